@@ -10,10 +10,26 @@ class Settings(BaseSettings):
     mysql_connection_string: str = 'user:pass@some_mariadb/dbname?charset=utf8mb4'
     max_execution_time: int = 14400
     max_store_time: int = 43200
+    reaper_interval: int = 60
+    upload_cleanup_interval: int = 600
+    upload_hash_key: str = ''
+    io_threads: int = 8  # threads for the uploads and media downloads of the API
     gdrive_folder_id: str = ''
     yadisk_token: str = ''
     ws_enabled: str = 'true'
     ws_port: int = 8765
+    ws_publisher_buffer: int = 1000
+    ws_mount: bool = False
+    ws_max_subscriptions: int = 1000
+    ws_outbox_size: int = 100
+    ws_slow_consumer_policy: str = 'drop'  # drop, close
+    ws_status_events: bool = False
+    ws_position_updates: int = 20
+    ws_replay_size: int = 20  # messages kept per UUID for clients that (re)connect, 0 - disabled
+    ws_replay_ttl: int = 300
+    ws_replay_keys: int = 10000
+    ws_workers: int = 1  # processes of web/server.py sharing WS_PORT
+    notification_backend: str = 'websocket'  # websocket, redis, inprocess
     tg_bot_token: str = ''
     tg_chat_id: str = ''
     bothub_api_key: str = ''
@@ -23,6 +39,14 @@ class Settings(BaseSettings):
     redis_host: str = 'localhost'
     redis_port: int = 6379
     redis_db: int = 10
+    queue_notifier: str = 'memory'  # memory, redis
+    queue_next_max_wait: int = 60
+    webhook_poll_interval: int = 5
+    webhook_concurrency: int = 10
+    webhook_timeout: int = 30
+    webhook_max_attempts: int = 8
+    webhook_retry_base: int = 10
+    webhook_host_interval: float = 0.2
     cors_allowed_origins: str = 'http://localhost,http://localhost:8001,http://localhost:4200,http://127.0.0.1:4200'
 
     class Config:
@@ -1,9 +1,11 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from config import settings
 
 if settings.sqlite_db_name:
     engine = create_engine('sqlite:///' + settings.sqlite_db_name)
+    async_engine = create_async_engine('sqlite+aiosqlite:///' + settings.sqlite_db_name)
 else:
     engine = create_engine(
         'mysql+pymysql://' + settings.mysql_connection_string,
@@ -12,7 +14,15 @@ else:
         pool_pre_ping=True,
         echo=True,
     )
+    async_engine = create_async_engine(
+        'mysql+aiomysql://' + settings.mysql_connection_string,
+        pool_recycle=3600,
+        pool_pre_ping=True,
+        echo=True,
+    )
 session_maker = sessionmaker(engine)
+# Used by the FastAPI routes. Objects stay usable after commit, so no implicit IO happens on attribute access.
+async_session_maker = async_sessionmaker(async_engine, expire_on_commit=False)
 
 
 class Base(DeclarativeBase):
@@ -1,17 +1,53 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 
 from routes import router as api_router
 from config import settings
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-app = FastAPI(title=settings.app_name, swagger_ui_parameters={'persistAuthorization': True})
+from utils.io_executor import shutdown_io_executor
+from utils.queue_notifier import get_queue_notifier
+from utils.restore_outdated_queue_items import run_reaper
+from utils.upload_storage import run_janitor, UploadStaticFiles
+from utils.webhook_dispatcher import get_webhook_dispatcher
+from utils.notifications import get_notification_backend
+from web.server import websocket_endpoint
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # REAPER_INTERVAL=0 disables the in-app reaper (e.g. when it runs as a separate process)
+    reaper_task = asyncio.create_task(run_reaper(settings.reaper_interval)) if settings.reaper_interval > 0 else None
+    # WEBHOOK_POLL_INTERVAL=0 disables the in-app webhook dispatcher
+    webhook_task = asyncio.create_task(get_webhook_dispatcher().run()) if settings.webhook_poll_interval > 0 else None
+    # UPLOAD_CLEANUP_INTERVAL=0 disables the in-app cleanup of expired uploads
+    janitor_task = asyncio.create_task(run_janitor(settings.upload_cleanup_interval)) \
+        if settings.upload_cleanup_interval > 0 else None
+    yield
+    for task in (reaper_task, webhook_task, janitor_task):
+        if task is None:
+            continue
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await get_queue_notifier().close()
+    await get_notification_backend().close()
+    shutdown_io_executor()
+
+
+app = FastAPI(title=settings.app_name, swagger_ui_parameters={'persistAuthorization': True}, lifespan=lifespan)
 app.include_router(api_router)
+if settings.ws_mount:
+    # WebSocket notifications served by this app (single worker, results are delivered in-process)
+    app.add_api_websocket_route('/ws', websocket_endpoint)
 
 _uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 os.makedirs(_uploads_dir, exist_ok=True)
-app.mount('/uploads', StaticFiles(directory=_uploads_dir), name='uploads')
+app.mount('/uploads', UploadStaticFiles(directory=_uploads_dir), name='uploads')
 
 app.add_middleware(
     CORSMiddleware,
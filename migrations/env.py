@@ -9,6 +9,7 @@ from db.db import Base
 from models.task import Task
 from models.queue import Queue
 from models.proxy import Proxy
+from models.webhook import Webhook
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -1,4 +1,4 @@
-from sqlalchemy import String
+from sqlalchemy import String, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from db.db import Base
 from models.queue import generate_uuid
@@ -7,7 +7,10 @@ from schemas.proxy_schema import ProxySchema
 
 class Proxy(Base):
     __tablename__ = 'proxy'
-    __table_args__ = {'mysql_engine': 'InnoDB'}
+    __table_args__ = (
+        Index('ix_proxy_uuid', 'uuid', unique=True),
+        {'mysql_engine': 'InnoDB'},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     uuid: Mapped[str] = mapped_column(String(37), default=generate_uuid)
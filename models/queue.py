@@ -1,5 +1,5 @@
 from enum import Enum
-from sqlalchemy import JSON, String, ForeignKey, DateTime, Integer
+from sqlalchemy import JSON, String, ForeignKey, DateTime, Integer, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from db.db import Base
 import uuid
@@ -22,7 +22,12 @@ def generate_uuid():
 
 class Queue(Base):
     __tablename__ = 'queue'
-    __table_args__ = {'mysql_engine': 'InnoDB'}
+    __table_args__ = (
+        Index('ix_queue_uuid', 'uuid', unique=True),
+        Index('ix_queue_task_id_status_id', 'task_id', 'status', 'id'),
+        Index('ix_queue_status_time_updated', 'status', 'time_updated'),
+        {'mysql_engine': 'InnoDB'},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     uuid: Mapped[str] = mapped_column(String(37), default=generate_uuid)
@@ -1,4 +1,4 @@
-from sqlalchemy import String
+from sqlalchemy import String, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from db.db import Base
 import uuid
@@ -12,7 +12,10 @@ def generate_uuid():
 
 class Task(Base):
     __tablename__ = 'tasks'
-    __table_args__ = {'mysql_engine': 'InnoDB'}
+    __table_args__ = (
+        Index('ix_tasks_uuid', 'uuid', unique=True),
+        {'mysql_engine': 'InnoDB'},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     uuid: Mapped[str] = mapped_column(String(128), default=generate_uuid)
@@ -0,0 +1,49 @@
+from enum import Enum
+from sqlalchemy import JSON, String, ForeignKey, DateTime, Integer, Index, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from db.db import Base
+import datetime
+
+from schemas.webhook_schema import WebhookSchema
+
+
+class WebhookStatus(Enum):
+    PENDING = 'pending'
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+
+
+class Webhook(Base):
+    """Outbox of webhook deliveries, written in the same transaction as the queue item result."""
+    __tablename__ = 'webhook_outbox'
+    __table_args__ = (
+        Index('ix_webhook_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        Index('ix_webhook_outbox_queue_id', 'queue_id'),
+        {'mysql_engine': 'InnoDB'},
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    queue_id: Mapped[int] = mapped_column(ForeignKey('queue.id', ondelete='CASCADE'))
+    url: Mapped[str] = mapped_column(String(256))
+    payload: Mapped[dict] = mapped_column(JSON(none_as_null=True), nullable=True, default=None)
+    status: Mapped[str] = mapped_column(String(30), default=WebhookStatus.PENDING.value)  # pending, delivered, failed
+    attempts: Mapped[int] = mapped_column(Integer(), default=0)
+    response_code: Mapped[int] = mapped_column(Integer(), nullable=True, default=None)
+    last_error: Mapped[str] = mapped_column(Text(), nullable=True, default=None)
+    next_attempt_at: Mapped[str] = mapped_column(DateTime(timezone=True), default=datetime.datetime.utcnow)
+    time_created: Mapped[str] = mapped_column(DateTime(timezone=True), default=datetime.datetime.utcnow)
+    time_updated: Mapped[str] = mapped_column(DateTime(timezone=True), default=datetime.datetime.utcnow)
+
+    def to_read_model(self) -> WebhookSchema:
+        return WebhookSchema(
+            id=self.id,
+            queue_id=self.queue_id,
+            url=self.url,
+            status=self.status,
+            attempts=self.attempts,
+            response_code=self.response_code,
+            last_error=self.last_error,
+            next_attempt_at=self.next_attempt_at.strftime('%Y-%m-%d %H:%M:%S') if isinstance(self.next_attempt_at, datetime.datetime) else self.next_attempt_at,
+            time_created=self.time_created.strftime('%Y-%m-%d %H:%M:%S') if isinstance(self.time_created, datetime.datetime) else self.time_created,
+            time_updated=self.time_updated.strftime('%Y-%m-%d %H:%M:%S') if isinstance(self.time_updated, datetime.datetime) else self.time_updated
+        )
@@ -1,26 +1,29 @@
+import datetime
+
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy import select, func
-from models.queue import Queue
+from sqlalchemy import select, update, func
+from models.queue import Queue, QueueStatus
 from utils.repository import SQLAlchemyRepository
 
 from models.queue import Queue
 from models.task import Task
+from models.webhook import Webhook
 
 
 class QueueRepository(SQLAlchemyRepository):
     model = Queue
 
-    def find_by_status(self, status, task_id=None):
+    async def find_by_status(self, status, task_id=None):
         try:
             stmt = (select(self.model)
                     .where(*((self.model.status == status,) if task_id is None else (self.model.task_id == task_id, self.model.status == status)))
                     .order_by(self.model.id))
-            result = self.session.execute(stmt)
+            result = await self.session.execute(stmt)
         except NoResultFound:
             return None
         return result
 
-    def get_count_by_task_id(self, status_list, task_id):
+    async def get_count_by_task_id(self, status_list, task_id):
         try:
             stmt = (select(func.count())
                     .where(
@@ -28,29 +31,150 @@ class QueueRepository(SQLAlchemyRepository):
                             self.model.status.in_(status_list)
                     )
                     .order_by(self.model.id))
-            result = self.session.execute(stmt).scalar()
+            result = (await self.session.execute(stmt)).scalar()
         except NoResultFound:
             return None
         return result
 
-    def find_by_uuid_and_status(self, uuid, status_list):
+    async def get_position(self, item_id: int, task_id=None) -> int:
+        """Return the 1-based position of a pending item among the pending items of its task."""
+        stmt = (select(func.count())
+                .select_from(self.model)
+                .where(self.model.status == QueueStatus.PENDING.value, self.model.id < item_id))
+        if task_id is not None:
+            stmt = stmt.where(self.model.task_id == task_id)
+        return (await self.session.execute(stmt)).scalar() + 1
+
+    async def find_pending_uuids(self, task_id: int, limit: int = 20) -> list[str]:
+        """Return the uuids of the first *limit* pending items of the task, in queue order."""
+        stmt = (select(self.model.uuid)
+                .where(self.model.task_id == task_id, self.model.status == QueueStatus.PENDING.value)
+                .order_by(self.model.id)
+                .limit(limit))
+        return list((await self.session.execute(stmt)).scalars().all())
+
+    async def find_by_uuid_and_status(self, uuid, status_list):
         try:
-            obj = self.session.query(self.model).filter(Queue.status.in_(status_list)).filter_by(uuid=uuid).one()
+            stmt = select(self.model).filter(self.model.status.in_(status_list)).filter_by(uuid=uuid)
+            obj = (await self.session.execute(stmt)).scalar_one()
         except NoResultFound:
             return None
         return obj
 
-    def find_one_next(self, task_id: int):
+    async def find_one_next(self, task_id: int):
         try:
             stmt = (select(self.model)
                     .where(self.model.task_id == task_id, self.model.status == 'pending')
                     .order_by(self.model.id))
-            result = self.session.execute(stmt)
+            result = await self.session.execute(stmt)
         except NoResultFound:
             return None
         return result.first()
 
-    def delete_old(self, limit=10, task_id=None) -> int:
+    async def claim_next(self, task_id: int, owner: str = ''):
+        """Atomically move the oldest pending item of the task to ``processing``.
+
+        Returns the claimed item as a read model or ``None`` if nothing is pending.
+        """
+        items = await self.claim_many(task_id, limit=1, owner=owner)
+        return items[0] if items else None
+
+    async def claim_many(self, task_id: int, limit: int = 1, owner: str = ''):
+        """Atomically move up to *limit* oldest pending items of the task to ``processing``.
+
+        SQLite serializes writers, so a single ``UPDATE ... RETURNING`` is enough there.
+        Other backends (MySQL/MariaDB) lock the rows with ``SELECT ... FOR UPDATE SKIP LOCKED``
+        so concurrent workers never receive the same item.
+        Returns the claimed items as read models ordered by id, with ``pending`` set to the number
+        of items still pending for the task (counted in the same transaction).
+        """
+        values = {
+            'owner': owner,
+            'status': QueueStatus.PROCESSING.value,
+            'time_updated': datetime.datetime.utcnow()
+        }
+        pending_filter = (self.model.task_id == task_id, self.model.status == QueueStatus.PENDING.value)
+
+        try:
+            if self.session.get_bind().dialect.name == 'sqlite':
+                next_ids = select(self.model.id).where(*pending_filter).order_by(self.model.id).limit(limit)
+                stmt = (update(self.model)
+                        .where(self.model.id.in_(next_ids.scalar_subquery()),
+                               self.model.status == QueueStatus.PENDING.value)
+                        .values(**values)
+                        .returning(self.model)
+                        .execution_options(synchronize_session=False))
+                items = (await self.session.execute(stmt)).scalars().all()
+            else:
+                stmt = (select(self.model)
+                        .where(*pending_filter)
+                        .order_by(self.model.id)
+                        .limit(limit)
+                        .with_for_update(skip_locked=True))
+                items = (await self.session.execute(stmt)).scalars().all()
+                for item in items:
+                    for key, value in values.items():
+                        setattr(item, key, value)
+                await self.session.flush()
+            result = sorted((item.to_read_model() for item in items), key=lambda item: item.id)
+            if result:
+                stmt = select(func.count()).select_from(self.model).where(*pending_filter)
+                pending = (await self.session.execute(stmt)).scalar()
+                for item in result:
+                    item.pending = pending
+        except:
+            await self.session.rollback()
+            raise
+        else:
+            await self.session.commit()
+        return result
+
+    async def update_result(self, data: dict, item_id: int, webhook_url: str | None = None, webhook_payload: dict | None = None):
+        """Update the item and, when *webhook_url* is set, add a webhook delivery to the outbox.
+
+        Both writes happen in one transaction, so a stored result always has its webhook queued.
+        """
+        stmt = update(self.model).where(self.model.id == item_id).values(**data)
+        try:
+            await self.session.execute(stmt)
+            if webhook_url:
+                self.session.add(Webhook(queue_id=item_id, url=webhook_url, payload=webhook_payload))
+        except:
+            await self.session.rollback()
+            raise
+        else:
+            await self.session.commit()
+        stmt = select(self.model).filter_by(id=item_id).execution_options(populate_existing=True)
+        return (await self.session.execute(stmt)).scalar_one().to_read_model()
+
+    async def restore_outdated(self, max_execution_time: int):
+        """Recover items stuck in ``processing`` for longer than *max_execution_time* seconds.
+
+        Items created before the threshold are marked as ``error``, the rest go back to ``pending``.
+        Returns the ``(restored, expired)`` row counts.
+        """
+        now = datetime.datetime.utcnow()
+        threshold = now - datetime.timedelta(seconds=max_execution_time)
+        outdated_filter = (self.model.status == QueueStatus.PROCESSING.value, self.model.time_updated < threshold)
+
+        expire_stmt = (update(self.model)
+                       .where(*outdated_filter, self.model.time_created < threshold)
+                       .values(status=QueueStatus.ERROR.value, time_updated=now))
+        restore_stmt = (update(self.model)
+                        .where(*outdated_filter)
+                        .values(status=QueueStatus.PENDING.value, time_updated=now))
+
+        try:
+            expired = (await self.session.execute(expire_stmt)).rowcount
+            restored = (await self.session.execute(restore_stmt)).rowcount
+        except:
+            await self.session.rollback()
+            raise
+        else:
+            await self.session.commit()
+        return restored, expired
+
+    async def delete_old(self, limit=10, task_id=None) -> int:
         stmt = (select(self.model).filter_by(task_id=task_id).order_by(self.model.id.asc()).limit(limit)
                 if task_id is not None
                 else select(self.model).order_by(self.model.id.asc()).limit(limit))
@@ -58,14 +182,14 @@ class QueueRepository(SQLAlchemyRepository):
         rowcount = 0
 
         try:
-            res = self.session.execute(stmt)
+            res = await self.session.execute(stmt)
             for item in res.all():
-                self.session.delete(item[0])
+                await self.session.delete(item[0])
                 rowcount += 1
         except:
-            self.session.rollback()
+            await self.session.rollback()
             raise
         else:
-            self.session.commit()
+            await self.session.commit()
 
         return rowcount
@@ -0,0 +1,58 @@
+import datetime
+
+from sqlalchemy import select, update
+from models.webhook import Webhook, WebhookStatus
+from utils.repository import SQLAlchemyRepository
+
+
+class WebhookRepository(SQLAlchemyRepository):
+    model = Webhook
+
+    async def find_by_queue_id(self, queue_id: int):
+        stmt = select(self.model).where(self.model.queue_id == queue_id).order_by(self.model.id)
+        return [item.to_read_model() for item in (await self.session.execute(stmt)).scalars().all()]
+
+    async def claim_due(self, limit: int = 10, lease_sec: int = 60):
+        """Lease up to *limit* pending deliveries whose next attempt is due.
+
+        The attempt counter is incremented and the next attempt is pushed *lease_sec* seconds
+        ahead, so a dispatcher that dies mid-delivery leaves the row to be retried later and
+        concurrent dispatchers never send the same row twice.
+        Uses the same SQLite / ``SKIP LOCKED`` split as ``QueueRepository.claim_many``.
+        Returns ORM objects (the session does not expire them on commit).
+        """
+        now = datetime.datetime.utcnow()
+        values = {
+            'attempts': self.model.attempts + 1,
+            'next_attempt_at': now + datetime.timedelta(seconds=lease_sec),
+            'time_updated': now
+        }
+        due_filter = (self.model.status == WebhookStatus.PENDING.value, self.model.next_attempt_at <= now)
+
+        try:
+            if self.session.get_bind().dialect.name == 'sqlite':
+                due_ids = select(self.model.id).where(*due_filter).order_by(self.model.id).limit(limit)
+                stmt = (update(self.model)
+                        .where(self.model.id.in_(due_ids.scalar_subquery()), *due_filter)
+                        .values(**values)
+                        .returning(self.model)
+                        .execution_options(synchronize_session=False))
+                items = (await self.session.execute(stmt)).scalars().all()
+            else:
+                stmt = (select(self.model)
+                        .where(*due_filter)
+                        .order_by(self.model.id)
+                        .limit(limit)
+                        .with_for_update(skip_locked=True))
+                items = (await self.session.execute(stmt)).scalars().all()
+                for item in items:
+                    item.attempts += 1
+                    item.next_attempt_at = values['next_attempt_at']
+                    item.time_updated = now
+                await self.session.flush()
+        except:
+            await self.session.rollback()
+            raise
+        else:
+            await self.session.commit()
+        return sorted(items, key=lambda item: item.id)
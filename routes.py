@@ -1,7 +1,7 @@
 import datetime
 import json
 import os
-from typing import Union, Optional
+from typing import Union, Optional, Literal
 import requests
 import codecs
 import time
@@ -9,26 +9,32 @@ import logging
 import uuid
 from logging.handlers import RotatingFileHandler
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, Header, status, UploadFile, Form, Body
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy.exc import NoResultFound, IntegrityError
 
-from db.db import session_maker
+from db.db import async_session_maker
 from models.queue import QueueStatus
 from repositories.proxy_repository import ProxyRepository
 from repositories.queue_repository import QueueRepository
 from repositories.tasks_repository import TasksRepository
+from repositories.webhook_repository import WebhookRepository
 from schemas.proxy_schema import ProxySchema, ProxyAddSchema
 from schemas.queue_schema import QueueAddSchema, QueueUpdateSchema, QueueSchema, QueueResultSchema, QueueSizeSchema
 from schemas.response import DataResponseSuccess, ResponseTasksItems, ResponseItemId, ResponseQueueItems, \
-    ResponseItemUuid, ResponseProxyItems, DataResponseDeletedSuccess, ResponseItemTask
+    ResponseItemUuid, ResponseProxyItems, DataResponseDeletedSuccess, ResponseItemTask, ResponseQueueNextItems
 from schemas.task_schema import TaskAddSchema, TaskUpdateSchema, TaskSchema, TaskDetailedSchema
+from schemas.webhook_schema import WebhookSchema
+from utils.io_executor import run_io
+from utils.pagination import cursor_bounds, next_cursor
 from utils.proxy_media_urls import proxy_media_in_result
+from utils.notifications import get_notification_backend
+from utils.queue_events import publish_status, publish_claimed, find_position_uuids, status_events_enabled
+from utils.queue_notifier import get_queue_notifier
 from utils.request_url import get_base_url
-from utils.restore_outdated_queue_items import restore_outdated_queue_items
 from utils.security import check_authentication_header, check_authentication_header_task
-from utils.upload_file import upload_file, delete_old_files
-from utils.webhook import webhook_post_result
+from utils.upload_file import upload_file
+from utils.webhook import webhook_payload
+from utils.webhook_dispatcher import get_webhook_dispatcher
 from config import settings
-from web.client import send_message
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -63,13 +69,13 @@ def read_root():
 
 @router.post('/tasks', name='Create Task', tags=['Tasks'],
              dependencies=[Depends(check_authentication_header)])
-def create_task_action(task: TaskAddSchema) -> Union[ResponseItemTask, dict]:
-    with session_maker() as session:
+async def create_task_action(task: TaskAddSchema) -> Union[ResponseItemTask, dict]:
+    async with async_session_maker() as session:
         task_repository = TasksRepository(session)
         api_keys = None
         if settings.use_task_api_keys:
             api_keys = str(uuid.uuid4())
-        task = task_repository.add_one(task.model_dump(), api_keys=api_keys)
+        task = await task_repository.add_one(task.model_dump(), api_keys=api_keys)
 
     output = {
         'success': True,
@@ -83,13 +89,15 @@ def create_task_action(task: TaskAddSchema) -> Union[ResponseItemTask, dict]:
 
 @router.patch('/tasks/{task_id}', name='Update Task', tags=['Tasks'],
               dependencies=[Depends(check_authentication_header)])
-def update_task_action(request: Request, task: TaskUpdateSchema, task_id: int) -> Union[TaskUpdateSchema, dict]:
-    with session_maker() as session:
+async def update_task_action(request: Request, task: TaskUpdateSchema, task_id: int) -> Union[TaskUpdateSchema, dict]:
+    async with async_session_maker() as session:
         task_repository = TasksRepository(session)
         try:
-            res = task_repository.update_one(task.model_dump(exclude_unset=True), task_id)
+            res = await task_repository.update_one(task.model_dump(exclude_unset=True), task_id)
         except NoResultFound:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Item with ID {task_id} not found.')
+        except IntegrityError:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'Task with UUID {task.uuid} already exists.')
 
     if res is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Item with ID {task_id} not found.')
@@ -99,10 +107,10 @@ def update_task_action(request: Request, task: TaskUpdateSchema, task_id: int) -
 
 @router.get('/tasks/{task_id}', name='View task', tags=['Tasks'],
             dependencies=[Depends(check_authentication_header)])
-def get_task_action(task_id: int) -> Union[TaskDetailedSchema, dict]:
-    with session_maker() as session:
+async def get_task_action(task_id: int) -> Union[TaskDetailedSchema, dict]:
+    async with async_session_maker() as session:
         task_repository = TasksRepository(session)
-        res = task_repository.find_one(task_id)
+        res = await task_repository.find_one(task_id)
 
     if res is not None:
         return res
@@ -112,23 +120,33 @@ def get_task_action(task_id: int) -> Union[TaskDetailedSchema, dict]:
 @router.get('/tasks', name='Tasks list', tags=['Tasks'],
             dependencies=[Depends(check_authentication_header)],
             response_model=ResponseTasksItems)
-def get_tasks_list_action() -> Union[ResponseTasksItems, dict]:
-    with session_maker() as session:
+async def get_tasks_list_action(
+        sort_dir: str = 'desc',
+        cursor: str | None = None,
+        limit: int = Query(default=100, le=100)
+) -> Union[ResponseTasksItems, dict]:
+    try:
+        bounds = cursor_bounds(cursor, sort_dir)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    async with async_session_maker() as session:
         task_repository = TasksRepository(session)
-        res = task_repository.find_all()
+        res = await task_repository.find_all(limit=limit, sort_dir=sort_dir, **bounds)
 
     return {
-        'items': res
+        'items': res,
+        'next_cursor': next_cursor(res, limit)
     }
 
 
 @router.delete('/tasks/{task_id}', name='Delete task', tags=['Tasks'],
                dependencies=[Depends(check_authentication_header)],
                response_model=DataResponseSuccess)
-def delete_task_action(task_id: int) -> Union[DataResponseSuccess, dict]:
-    with session_maker() as session:
+async def delete_task_action(task_id: int) -> Union[DataResponseSuccess, dict]:
+    async with async_session_maker() as session:
         task_repository = TasksRepository(session)
-        rowcount = task_repository.delete(task_id)
+        rowcount = await task_repository.delete(task_id)
 
     if rowcount > 0:
         return {
@@ -172,25 +190,23 @@ async def create_queue_action(
     upload_dir_path = os.path.join(ROOT_DIR, 'uploads')
     base_url = get_base_url(request)
 
-    delete_old_files(upload_dir_path, max_hours=(settings.max_store_time / 60 / 60))
-
     if image_file is not None:
-        file_name = upload_file(image_file, upload_dir_path, type='image')
+        file_name = await run_io(upload_file, image_file, upload_dir_path, type='image')
         if file_name:
             data['data']['image_file'] = f'{base_url}/uploads/{file_name}'
 
     if image_file2 is not None:
-        file_name = upload_file(image_file2, upload_dir_path, type='image')
+        file_name = await run_io(upload_file, image_file2, upload_dir_path, type='image')
         if file_name:
             data['data']['image_file2'] = f'{base_url}/uploads/{file_name}'
 
     if video_file is not None:
-        file_name = upload_file(video_file, upload_dir_path, type='video')
+        file_name = await run_io(upload_file, video_file, upload_dir_path, type='video')
         if file_name:
             data['data']['video_file'] = f'{base_url}/uploads/{file_name}'
 
     if audio_file is not None:
-        file_name = upload_file(audio_file, upload_dir_path, type='audio')
+        file_name = await run_io(upload_file, audio_file, upload_dir_path, type='audio')
         if file_name:
             data['data']['audio_file'] = f'{base_url}/uploads/{file_name}'
 
@@ -217,9 +233,9 @@ async def create_queue_action(
             continue
         headers_data[key] = val
 
-    with session_maker() as session:
+    async with async_session_maker() as session:
         task_repository = TasksRepository(session)
-        task = task_repository.find_one_by_uuid(task_uuid)
+        task = await task_repository.find_one_by_uuid(task_uuid)
 
         if task is not None:
             if settings.use_task_api_keys:
@@ -234,7 +250,15 @@ async def create_queue_action(
             queue_item_new = QueueAddSchema(status=QueueStatus.PENDING.value, task_id=task.id, user_id=user_id,
                                             headers=headers_data, **data)
             queue_repository = QueueRepository(session)
-            queue_item = queue_repository.add_one(queue_item_new.model_dump(), item_uuid=item_uuid)
+            try:
+                queue_item = await queue_repository.add_one(queue_item_new.model_dump(), item_uuid=item_uuid)
+            except IntegrityError:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                    detail=f'Queue item with UUID {item_uuid} already exists.')
+            await get_queue_notifier().notify(task.uuid)
+            if status_events_enabled():
+                position = await queue_repository.get_position(queue_item.id, task_id=task.id)
+                await publish_status(queue_item.uuid, queue_item.status, position)
             return {
                 'success': True if queue_item is not None else False,
                 'uuid': queue_item.uuid if queue_item is not None else None,
@@ -247,91 +271,137 @@ async def create_queue_action(
 @router.get('/queue', name='Queue list', tags=['Queue'],
             dependencies=[Depends(check_authentication_header)],
             response_model=ResponseQueueItems)
-def get_queue_list_action(
+async def get_queue_list_action(
         task_id: int | None = None,
         task_uuid: str | None = None,
         sort_dir: str = 'desc',
         page: int = 1,
+        cursor: str | None = None,
+        total: Literal['exact', 'estimate', 'none'] = 'exact',
         limit: int = Query(default=20, le=100)
 ) -> Union[ResponseQueueItems, dict]:
-    with session_maker() as session:
+    """Paginate with *page* (OFFSET) or, for deep pages, with the *cursor* returned as
+    ``next_cursor`` by the previous page. *total* selects an exact count, a cheap estimate
+    from table statistics (unfiltered lists only) or no count at all."""
+    try:
+        bounds = cursor_bounds(cursor, sort_dir)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    async with async_session_maker() as session:
         if task_uuid is not None:
             task_repository = TasksRepository(session)
-            task = task_repository.find_one_by_uuid(task_uuid)
+            task = await task_repository.find_one_by_uuid(task_uuid)
             task_id = task.id
         queue_repository = QueueRepository(session)
         filter_params = {'task_id': task_id} if task_id else None
-        offset = (page - 1) * limit
-        res = queue_repository.find_all(limit=limit, offset=offset, sort_dir=sort_dir, filter=filter_params)
-        total = queue_repository.count_all(filter=filter_params)
+        offset = (page - 1) * limit if not bounds else 0
+        res = await queue_repository.find_all(limit=limit, offset=offset, sort_dir=sort_dir, filter=filter_params, **bounds)
+        if total == 'none':
+            items_total = None
+        elif total == 'estimate' and filter_params is None:
+            items_total = await queue_repository.estimate_count()
+        else:
+            items_total = await queue_repository.count_all(filter=filter_params)
 
     return {
         'items': res,
-        'total': total,
+        'total': items_total,
         'page': page,
-        'limit': limit
+        'limit': limit,
+        'next_cursor': next_cursor(res, limit)
     }
 
 
 @router.get('/queue/{uuid}', name='Get Queue Item State', tags=['Queue'])
             # dependencies=[Depends(check_authentication_header)])
-def get_queue_action(uuid: str) -> Union[QueueSchema, dict]:
-    with session_maker() as session:
+async def get_queue_action(uuid: str) -> Union[QueueSchema, dict]:
+    async with async_session_maker() as session:
         queue_repository = QueueRepository(session)
-        queue_item = queue_repository.find_one_by_uuid(uuid)
+        queue_item = await queue_repository.find_one_by_uuid(uuid)
         if queue_item is not None:
-            queue_repository = QueueRepository(session)
-            queue_list = queue_repository.find_by_status(QueueStatus.PENDING.value, task_id=queue_item.task_id)
-            queue_index = next((index for (index, d) in enumerate(list(queue_list)) if d[0].uuid == uuid), None)
-
             result = queue_item.to_read_model()
-            result.number = queue_index + 1 if queue_index is not None else 0
+            if queue_item.status == QueueStatus.PENDING.value:
+                result.number = await queue_repository.get_position(queue_item.id, task_id=queue_item.task_id)
             return result
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Task not found.')
 
 
+@router.get('/queue_webhooks/{uuid}', name='Get Queue Item Webhooks', tags=['Queue'],
+            dependencies=[Depends(check_authentication_header)])
+async def get_queue_webhooks_action(uuid: str) -> list[WebhookSchema]:
+    async with async_session_maker() as session:
+        queue_repository = QueueRepository(session)
+        queue_item = await queue_repository.find_one_by_uuid(uuid)
+        if queue_item is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Queue item not found.')
+
+        webhook_repository = WebhookRepository(session)
+        return await webhook_repository.find_by_queue_id(queue_item.id)
+
+
 @router.get('/queue_size/{task_uuid}', name='Get Queue Size', tags=['Queue'])
-def get_queue_size_action(task_uuid: str) -> Union[QueueSizeSchema, dict]:
+async def get_queue_size_action(task_uuid: str) -> Union[QueueSizeSchema, dict]:
     queue_size = 0
-    with session_maker() as session:
+    async with async_session_maker() as session:
         task_repository = TasksRepository(session)
-        task = task_repository.find_one_by_uuid(task_uuid)
+        task = await task_repository.find_one_by_uuid(task_uuid)
 
         if task is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Task not found.')
 
         queue_repository = QueueRepository(session)
-        queue_size = queue_repository.get_count_by_task_id([QueueStatus.PENDING.value, QueueStatus.PROCESSING.value], task_id=task.id)
+        queue_size = await queue_repository.get_count_by_task_id([QueueStatus.PENDING.value, QueueStatus.PROCESSING.value], task_id=task.id)
 
     return {'queue_size': queue_size}
 
 
-@router.get('/queue_next/{task_uuid}', name='Get Next Queue Item', tags=['Queue'])
-def get_queue_next_action(task_uuid: str, user_ip: str = Header(None, alias='X-Real-IP')) -> Union[QueueSchema, dict]:
-
-    restore_outdated_queue_items()
-
-    with session_maker() as session:
+async def claim_queue_items(task_uuid: str, count: int | None, owner: str) -> Union[QueueSchema, dict, None]:
+    async with async_session_maker() as session:
         task_repository = TasksRepository(session)
-        task = task_repository.find_one_by_uuid(task_uuid)
+        task = await task_repository.find_one_by_uuid(task_uuid)
 
         if task is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Task not found.')
 
         queue_repository = QueueRepository(session)
-        res = queue_repository.find_one_next(task.id)
-        if res is not None:
-            queue_item = res[0]
-            result = queue_repository.update_one({
-                'owner': user_ip if user_ip is not None else '',
-                'status': QueueStatus.PROCESSING.value,
-                'time_updated': datetime.datetime.utcnow()
-            }, queue_item.id)
+        items = await queue_repository.claim_many(task.id, limit=count or 1, owner=owner)
+        pending_uuids = await find_position_uuids(queue_repository, task.id) if items else []
+    if not items:
+        return None
+    # Sent once the connection is back in the pool
+    publish_claimed([(item.uuid, item.status) for item in items], pending_uuids)
+    if count is None:
+        return items[0]
+    return {
+        'items': items,
+        'pending': items[0].pending
+    }
 
-            queue_list = queue_repository.find_by_status(QueueStatus.PENDING.value, task_id=task.id)
-            result.pending = len(list(queue_list))
 
-            return result
+@router.get('/queue_next/{task_uuid}', name='Get Next Queue Item', tags=['Queue'])
+async def get_queue_next_action(
+        task_uuid: str,
+        count: int | None = Query(default=None, ge=1, le=100),
+        wait: float = Query(default=0, ge=0),
+        user_ip: str = Header(None, alias='X-Real-IP')
+) -> Union[QueueSchema, ResponseQueueNextItems, dict]:
+    """Claim the next pending item. With *wait* > 0 the request is held open for up to
+    *wait* seconds (capped by the QUEUE_NEXT_MAX_WAIT setting) until an item is enqueued."""
+
+    owner = user_ip if user_ip is not None else ''
+    deadline = time.monotonic() + min(wait, settings.queue_next_max_wait)
+
+    with get_queue_notifier().waiter(task_uuid) as waiter:
+        while True:
+            result = await claim_queue_items(task_uuid, count, owner)
+            if result is not None:
+                return result
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            await waiter.wait(timeout)
+
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='There are no items in the queue.')
 
 
@@ -344,25 +414,24 @@ async def set_queue_result_action(request: Request, queue_item: QueueResultSchem
         print(str(e))
         payload = None
 
-    restore_outdated_queue_items()
+    result_data = queue_item.result_data if hasattr(queue_item, 'result_data') else None
+    if result_data is None and payload is not None:
+        result_data = payload
 
-    with session_maker() as session:
+    if settings.proxy_results_media and isinstance(result_data, dict):
+        upload_dir_path = os.path.join(ROOT_DIR, 'uploads')
+        base_url = get_base_url(request)
+        # Downloads and writes the media files, before a database connection is taken
+        result_data = await run_io(proxy_media_in_result, result_data, upload_dir_path, base_url)
+
+    async with async_session_maker() as session:
         queue_repository = QueueRepository(session)
-        res = queue_repository.find_by_uuid_and_status(uuid, [
+        res = await queue_repository.find_by_uuid_and_status(uuid, [
             QueueStatus.PENDING.value,
             QueueStatus.PROCESSING.value,
             QueueStatus.COMPLETED.value
         ])
 
-        result_data = queue_item.result_data if hasattr(queue_item, 'result_data') else None
-        if result_data is None and payload is not None:
-            result_data = payload
-
-        if settings.proxy_results_media and isinstance(result_data, dict):
-            upload_dir_path = os.path.join(ROOT_DIR, 'uploads')
-            base_url = get_base_url(request)
-            result_data = proxy_media_in_result(result_data, upload_dir_path, base_url)
-
         result_status = QueueStatus.PROCESSING.value
         result_code = result_data.get('code', 200) if result_data else 200
         result_input_status = result_data.get('status', '') if result_data else ''
@@ -378,47 +447,48 @@ async def set_queue_result_action(request: Request, queue_item: QueueResultSchem
         # logger.debug('TASK STATUS: ' + result_status)
 
         if res is not None:
-            result = queue_repository.update_one({
+            task_repository = TasksRepository(session)
+            task = await task_repository.find_one(res.task_id) if res.task_id else None
+            webhook_url = task.webhook_url if task else None
+            result = await queue_repository.update_result({
                 'status': result_status,
                 'result_data': result_data,
                 'time_updated': datetime.datetime.utcnow()
-            }, res.id)
+            }, res.id, webhook_url=webhook_url, webhook_payload=webhook_payload(uuid, result_status, result_data))
 
             if result:
-                task_id = result.task_id
-                task_repository = TasksRepository(session)
-                task = task_repository.find_one(task_id)
-                if task and task.webhook_url:
-                    webhook_resp = webhook_post_result(task.webhook_url, uuid, result.status, result.result_data)
-                    # print(webhook_resp)
+                if webhook_url:
+                    get_webhook_dispatcher().notify()
+                await publish_status(result.uuid, result.status)
                 # send WebSocker message
                 if settings.ws_enabled == 'true':
-                    await send_message(result.uuid, json.dumps(result_data))
+                    await get_notification_backend().send(result.uuid, json.dumps(result_data))
 
             return result
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Queue item not found.')
 
 
 @router.post('/queue_error/{uuid}', name='Send Queue Item error', tags=['Queue'])
-def set_queue_result_action(uuid: str, message: str = Form()) -> Union[QueueSchema, dict]:
-    with session_maker() as session:
+async def set_queue_result_action(uuid: str, message: str = Form()) -> Union[QueueSchema, dict]:
+    async with async_session_maker() as session:
         queue_repository = QueueRepository(session)
-        res = queue_repository.find_by_uuid_and_status(uuid, [QueueStatus.PENDING.value, QueueStatus.PROCESSING.value])
+        res = await queue_repository.find_by_uuid_and_status(uuid, [QueueStatus.PENDING.value, QueueStatus.PROCESSING.value])
 
         if res is not None:
-            result = queue_repository.update_one({
+            task_repository = TasksRepository(session)
+            task = await task_repository.find_one(res.task_id) if res.task_id else None
+            webhook_url = task.webhook_url if task else None
+            result_data = {'message': message}
+            result = await queue_repository.update_result({
                 'status': QueueStatus.ERROR.value,
-                'result_data': {'message': message},
+                'result_data': result_data,
                 'time_updated': datetime.datetime.utcnow()
-            }, res.id)
+            }, res.id, webhook_url=webhook_url, webhook_payload=webhook_payload(uuid, QueueStatus.ERROR.value, result_data))
 
             if result:
-                task_id = result.task_id
-                task_repository = TasksRepository(session)
-                task = task_repository.find_one(task_id)
-                if task and task.webhook_url:
-                    webhook_resp = webhook_post_result(task.webhook_url, uuid, result.status, result.result_data)
-                    # print(webhook_resp)
+                if webhook_url:
+                    get_webhook_dispatcher().notify()
+                await publish_status(result.uuid, result.status)
 
         return result
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Queue item not found.')
@@ -427,12 +497,12 @@ def set_queue_result_action(uuid: str, message: str = Form()) -> Union[QueueSche
 @router.delete('/queue_delete_old/{limit}', name='Delete old queue entries', tags=['Queue'],
                dependencies=[Depends(check_authentication_header)],
                response_model=DataResponseDeletedSuccess)
-def delete_queue_items_action(limit: int, task_uuid: str | None = None) -> Union[DataResponseDeletedSuccess, dict]:
-    with session_maker() as session:
+async def delete_queue_items_action(limit: int, task_uuid: str | None = None) -> Union[DataResponseDeletedSuccess, dict]:
+    async with async_session_maker() as session:
         task_id = None
         if task_uuid is not None:
             task_repository = TasksRepository(session)
-            task = task_repository.find_one_by_uuid(task_uuid)
+            task = await task_repository.find_one_by_uuid(task_uuid)
             task_id = task.id if task else None
 
             if task is None:
@@ -440,7 +510,7 @@ def delete_queue_items_action(limit: int, task_uuid: str | None = None) -> Union
 
         queue_repository = QueueRepository(session)
 
-        rowcount = queue_repository.delete_old(limit=limit, task_id=task_id)
+        rowcount = await queue_repository.delete_old(limit=limit, task_id=task_id)
 
     if rowcount > 0:
         return {
@@ -452,10 +522,10 @@ def delete_queue_items_action(limit: int, task_uuid: str | None = None) -> Union
 
 @router.post('/proxy', name='Create Proxy Item', tags=['Proxy'],
              dependencies=[Depends(check_authentication_header)])
-def create_proxy_action(proxy: ProxyAddSchema) -> Union[ResponseItemId, dict]:
-    with session_maker() as session:
+async def create_proxy_action(proxy: ProxyAddSchema) -> Union[ResponseItemId, dict]:
+    async with async_session_maker() as session:
         proxy_repository = ProxyRepository(session)
-        proxy = proxy_repository.add_one(proxy.model_dump())
+        proxy = await proxy_repository.add_one(proxy.model_dump())
 
     return {
         'success': True,
@@ -467,10 +537,10 @@ def create_proxy_action(proxy: ProxyAddSchema) -> Union[ResponseItemId, dict]:
 @router.get('/proxy', name='Proxy list', tags=['Proxy'],
             dependencies=[Depends(check_authentication_header)],
             response_model=ResponseProxyItems)
-def get_proxy_list_action() -> Union[ResponseProxyItems, dict]:
-    with session_maker() as session:
+async def get_proxy_list_action() -> Union[ResponseProxyItems, dict]:
+    async with async_session_maker() as session:
         proxy_repository = ProxyRepository(session)
-        res = proxy_repository.find_all()
+        res = await proxy_repository.find_all()
 
     return {
         'items': res
@@ -480,10 +550,10 @@ def get_proxy_list_action() -> Union[ResponseProxyItems, dict]:
 @router.delete('/proxy/{proxy_id}', name='Delete proxy', tags=['Proxy'],
                dependencies=[Depends(check_authentication_header)],
                response_model=DataResponseSuccess)
-def delete_proxy_action(item_id: int) -> Union[DataResponseSuccess, dict]:
-    with session_maker() as session:
+async def delete_proxy_action(item_id: int) -> Union[DataResponseSuccess, dict]:
+    async with async_session_maker() as session:
         repository = ProxyRepository(session)
-        rowcount = repository.delete(item_id)
+        rowcount = await repository.delete(item_id)
 
     if rowcount > 0:
         return {
@@ -496,9 +566,9 @@ def delete_proxy_action(item_id: int) -> Union[DataResponseSuccess, dict]:
              dependencies=[Depends(check_authentication_header)])
 async def proxy_post_action(uuid: str, request: Request) -> Union[DataResponseSuccess, dict]:
 
-    with session_maker() as session:
+    async with async_session_maker() as session:
         repository = ProxyRepository(session)
-        proxy_item = repository.find_one_by_uuid(uuid)
+        proxy_item = await repository.find_one_by_uuid(uuid)
 
     if proxy_item is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Item with UUID {uuid} not found.')
@@ -553,9 +623,9 @@ async def proxy_post_queue_action(uuid: str, request: Request) -> Union[DataResp
     so the remote service can post its result back via /queue_result/{queue_uuid}.
     """
 
-    with session_maker() as session:
+    async with async_session_maker() as session:
         repository = ProxyRepository(session)
-        proxy_item = repository.find_one_by_uuid(uuid)
+        proxy_item = await repository.find_one_by_uuid(uuid)
 
     if proxy_item is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Item with UUID {uuid} not found.')
@@ -568,9 +638,9 @@ async def proxy_post_queue_action(uuid: str, request: Request) -> Union[DataResp
 
     base_url = get_base_url(request)
 
-    with session_maker() as session:
+    async with async_session_maker() as session:
         queue_repository = QueueRepository(session)
-        queue_item = queue_repository.add_one(
+        queue_item = await queue_repository.add_one(
             QueueAddSchema(
                 status=QueueStatus.PENDING.value,
                 task_id=None,
@@ -635,9 +705,9 @@ async def proxy_post_queue_action(uuid: str, request: Request) -> Union[DataResp
             dependencies=[Depends(check_authentication_header)])
 async def proxy_get_action(uuid: str, request: Request) -> Union[DataResponseSuccess, dict]:
 
-    with session_maker() as session:
+    async with async_session_maker() as session:
         repository = ProxyRepository(session)
-        proxy_item = repository.find_one_by_uuid(uuid)
+        proxy_item = await repository.find_one_by_uuid(uuid)
 
     if proxy_item is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Item with UUID {uuid} not found.')
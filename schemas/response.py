@@ -44,6 +44,7 @@ class DataResponseMessage(BaseModel):
 
 class ResponseTasksItems(BaseModel):
     items: list[TaskSchema]
+    next_cursor: str | None = None
 
     class Config:
         from_attributes = True
@@ -79,9 +80,18 @@ class ResponseItemUuid(BaseModel):
 
 class ResponseQueueItems(BaseModel):
     items: list[QueueSchema]
-    total: int
+    total: int | None = None
     page: int
     limit: int
+    next_cursor: str | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class ResponseQueueNextItems(BaseModel):
+    items: list[QueueSchema]
+    pending: int = 0
 
     class Config:
         from_attributes = True
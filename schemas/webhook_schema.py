@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+
+class WebhookSchema(BaseModel):
+    id: int
+    queue_id: int
+    url: str
+    status: str
+    attempts: int = 0
+    response_code: int | None = None
+    last_error: str | None = None
+    next_attempt_at: str | datetime | None = None
+    time_created: str | datetime | None = None
+    time_updated: str | datetime | None = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,66 @@
+"""
+Tests for utils/io_executor.py
+Testing that blocking calls of request handlers run in the sized I/O thread pool.
+"""
+
+import unittest
+from unittest.mock import patch
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils import io_executor
+from utils.io_executor import get_io_executor, run_io, shutdown_io_executor
+
+
+class TestIoExecutor(unittest.IsolatedAsyncioTestCase):
+
+    def tearDown(self):
+        shutdown_io_executor()
+
+    async def test_runs_in_io_thread(self):
+        def blocking(value, suffix=''):
+            return threading.current_thread().name, value + suffix
+
+        thread_name, value = await run_io(blocking, 'a', suffix='b')
+
+        self.assertTrue(thread_name.startswith('io'))
+        self.assertEqual(value, 'ab')
+
+    async def test_pool_size_follows_setting(self):
+        with patch.object(io_executor.settings, 'io_threads', 3):
+            self.assertEqual(get_io_executor()._max_workers, 3)
+        self.assertIs(get_io_executor(), get_io_executor())
+
+        shutdown_io_executor()
+        with patch.object(io_executor.settings, 'io_threads', 0):
+            self.assertEqual(get_io_executor()._max_workers, 1)
+
+    async def test_slow_call_does_not_block_event_loop(self):
+        ticks = []
+
+        async def tick():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        started = time.monotonic()
+        await asyncio.gather(run_io(time.sleep, 0.2), tick())
+
+        self.assertEqual(len(ticks), 5)
+        self.assertLess(ticks[-1] - started, 0.15)
+
+    async def test_exceptions_are_raised_in_caller(self):
+        def failing():
+            raise ValueError('broken file')
+
+        with self.assertRaises(ValueError):
+            await run_io(failing)
+
+
+if __name__ == '__main__':
+    unittest.main()
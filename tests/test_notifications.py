@@ -0,0 +1,83 @@
+"""
+Tests for utils/notifications.py
+Testing that each notification backend hands the message to the right transport.
+"""
+
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.notifications import (
+    InProcessNotificationBackend,
+    RedisNotificationBackend,
+    WebSocketNotificationBackend,
+)
+from web.redis_routing import route_key, replay_key, NODE_CHANNEL_PREFIX, PRESENCE_PREFIX
+from web.server import _add_connection, CONNECTIONS, WS_TO_KEY
+
+
+class TestInProcessNotificationBackend(unittest.TestCase):
+    """Test direct delivery to the connections of web/server.py."""
+
+    def setUp(self):
+        CONNECTIONS.clear()
+        WS_TO_KEY.clear()
+
+    def tearDown(self):
+        CONNECTIONS.clear()
+        WS_TO_KEY.clear()
+
+    def test_sends_to_registered_connection(self):
+        ws = AsyncMock()
+        _add_connection('queue-uuid', ws)
+
+        asyncio.run(InProcessNotificationBackend().send('queue-uuid', '{"ok": 1}'))
+
+        ws.send.assert_called_once_with('{"ok": 1}')
+
+    def test_missing_connection_is_ignored(self):
+        asyncio.run(InProcessNotificationBackend().send('nonexistent', 'hello'))
+
+    def test_send_error_is_not_raised(self):
+        ws = AsyncMock()
+        ws.send = AsyncMock(side_effect=RuntimeError('closed'))
+        _add_connection('queue-uuid', ws)
+
+        asyncio.run(InProcessNotificationBackend().send('queue-uuid', 'hello'))
+
+
+class TestRedisNotificationBackend(unittest.TestCase):
+    """Test publishing to the web/server_redis.py nodes of the recipient."""
+
+    def test_publishes_to_recipient_route(self):
+        backend = RedisNotificationBackend()
+        backend.redis = MagicMock()
+        backend.redis.eval = AsyncMock(return_value=1)
+
+        asyncio.run(backend.send('queue-uuid', '{"ok": 1}'))
+
+        script, numkeys, key, stream_key, message, exclude_node, prefix, *_, recipient_key, presence_prefix = \
+            backend.redis.eval.call_args.args
+        self.assertEqual((numkeys, key, exclude_node, prefix), (2, route_key('queue-uuid'), '', NODE_CHANNEL_PREFIX))
+        self.assertEqual(presence_prefix, PRESENCE_PREFIX)
+        self.assertEqual((stream_key, message, recipient_key), (replay_key('queue-uuid'), '{"ok": 1}', 'queue-uuid'))
+
+
+class TestWebSocketNotificationBackend(unittest.TestCase):
+    """Test handing messages to the persistent WebSocket publisher."""
+
+    def test_publishes_through_publisher(self):
+        publisher = MagicMock()
+
+        with patch('web.client.get_ws_publisher', return_value=publisher):
+            asyncio.run(WebSocketNotificationBackend().send('queue-uuid', 'hello'))
+
+        publisher.publish.assert_called_once_with('queue-uuid', 'hello')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+Tests for utils/pagination.py
+Testing the opaque cursors used by keyset pagination.
+"""
+
+import unittest
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.pagination import encode_cursor, decode_cursor, cursor_bounds, next_cursor
+
+
+class TestCursor(unittest.TestCase):
+    """Test cursor encoding and translation to keyset bounds."""
+
+    def test_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(12345)), 12345)
+
+    def test_invalid_cursor_raises_value_error(self):
+        for cursor in ('not-a-cursor', encode_cursor(1)[:-2] + '!!', ''):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    decode_cursor(cursor)
+
+    def test_bounds_follow_sort_direction(self):
+        cursor = encode_cursor(10)
+        self.assertEqual(cursor_bounds(cursor, 'desc'), {'before_id': 10})
+        self.assertEqual(cursor_bounds(cursor, 'asc'), {'after_id': 10})
+        self.assertEqual(cursor_bounds(None, 'desc'), {})
+
+    def test_next_cursor_only_for_full_pages(self):
+        items = [SimpleNamespace(id=5), SimpleNamespace(id=4)]
+        self.assertEqual(decode_cursor(next_cursor(items, 2)), 4)
+        self.assertIsNone(next_cursor(items, 3))
+        self.assertIsNone(next_cursor([], 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
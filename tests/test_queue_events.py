@@ -0,0 +1,107 @@
+"""
+Tests for utils/queue_events.py
+Testing the status and position messages pushed to WebSocket subscribers.
+"""
+
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils import queue_events
+from utils.queue_events import status_event, publish_status, publish_claimed, find_position_uuids
+
+
+class QueueEventsTestCase(unittest.TestCase):
+    """Base class enabling status events and capturing sent messages."""
+
+    def setUp(self):
+        self.backend = MagicMock()
+        self.backend.send = AsyncMock()
+        patchers = [
+            patch.object(queue_events, 'get_notification_backend', return_value=self.backend),
+            patch.object(queue_events.settings, 'ws_enabled', 'true'),
+            patch.object(queue_events.settings, 'ws_status_events', True),
+            patch.object(queue_events.settings, 'ws_position_updates', 2),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sent(self):
+        return [(call.args[0], json.loads(call.args[1])) for call in self.backend.send.call_args_list]
+
+
+class TestStatusEvent(unittest.TestCase):
+
+    def test_position_is_optional(self):
+        self.assertEqual(json.loads(status_event('abc', 'processing')),
+                         {'event': 'status', 'uuid': 'abc', 'status': 'processing'})
+        self.assertEqual(json.loads(status_event('abc', 'pending', 3))['position'], 3)
+
+
+class TestPublishStatus(QueueEventsTestCase):
+
+    def test_sends_to_item_subscribers(self):
+        asyncio.run(publish_status('abc', 'completed'))
+
+        self.assertEqual(self.sent(), [('abc', {'event': 'status', 'uuid': 'abc', 'status': 'completed'})])
+
+    def test_disabled_by_setting(self):
+        with patch.object(queue_events.settings, 'ws_status_events', False):
+            asyncio.run(publish_status('abc', 'completed'))
+
+        self.backend.send.assert_not_called()
+
+
+class TestPublishClaimed(QueueEventsTestCase):
+
+    def publish(self, claimed, pending_uuids):
+        async def run():
+            publish_claimed(claimed, pending_uuids)
+            # Not sent before the caller yields
+            self.backend.send.assert_not_called()
+            await asyncio.gather(*queue_events.background_sends)
+
+        asyncio.run(run())
+
+    def test_finds_first_pending_items(self):
+        repository = MagicMock()
+        repository.find_pending_uuids = AsyncMock(return_value=['first', 'second'])
+
+        self.assertEqual(asyncio.run(find_position_uuids(repository, task_id=1)), ['first', 'second'])
+        repository.find_pending_uuids.assert_called_once_with(1, limit=2)
+
+        with patch.object(queue_events.settings, 'ws_position_updates', 0):
+            self.assertEqual(asyncio.run(find_position_uuids(repository, task_id=1)), [])
+
+    def test_sends_status_and_positions_in_background(self):
+        self.publish([('claimed', 'processing')], ['first', 'second'])
+
+        self.assertEqual([(recipient, event['status'], event.get('position')) for recipient, event in self.sent()],
+                         [('claimed', 'processing', None), ('first', 'pending', 1), ('second', 'pending', 2)])
+        self.assertEqual(queue_events.background_sends, set())
+
+    def test_failed_send_does_not_stop_the_others(self):
+        self.backend.send.side_effect = [ConnectionError('backend down'), None]
+
+        with patch.object(queue_events, 'logger') as logger_mock:
+            self.publish([('claimed', 'processing')], ['first'])
+
+        self.assertEqual(self.backend.send.call_count, 2)
+        logger_mock.error.assert_called_once()
+
+    def test_disabled_by_setting(self):
+        with patch.object(queue_events.settings, 'ws_status_events', False):
+            asyncio.run(find_position_uuids(MagicMock(), task_id=1))
+            publish_claimed([('claimed', 'processing')], ['first'])
+
+        self.backend.send.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -27,6 +27,10 @@ from utils.queue_manager import (
 )
 
 
+class StopPolling(Exception):
+    """Raised from a test callback to end the endless polling_queue loop."""
+
+
 class TestQueueManagerNetworkChanges(unittest.TestCase):
     """Test queue manager functions handle network changes gracefully"""
 
@@ -80,6 +84,56 @@ class TestQueueManagerNetworkChanges(unittest.TestCase):
         )
         self.assertIsNotNone(result)
 
+    @patch('utils.queue_manager.settings')
+    @patch('utils.queue_manager.requests.get')
+    def test_get_queue_next_with_count(self, mock_get, mock_settings):
+        """Test that get_queue_next requests a batch and returns the list of items"""
+        mock_settings.app_server_name = 'example.com'
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'items': [{'data': {'a': 1}}, {'data': {'a': 2}}], 'pending': 0}
+        mock_get.return_value = mock_response
+
+        result = get_queue_next(self.task_uuid, count=2)
+
+        mock_get.assert_called_once_with(
+            url=f'https://example.com/queue_next/{self.task_uuid}',
+            timeout=30,
+            params={'count': 2}
+        )
+        self.assertEqual(len(result), 2)
+
+    @patch('utils.queue_manager.settings')
+    @patch('utils.queue_manager.requests.get')
+    def test_get_queue_next_with_count_empty(self, mock_get, mock_settings):
+        """Test that get_queue_next returns None when the batch is empty"""
+        mock_settings.app_server_name = 'example.com'
+        mock_response = Mock()
+        mock_response.status_code = 404
+        mock_get.return_value = mock_response
+
+        result = get_queue_next(self.task_uuid, count=2)
+
+        self.assertIsNone(result)
+
+    @patch('utils.queue_manager.settings')
+    @patch('utils.queue_manager.requests.get')
+    def test_get_queue_next_with_wait(self, mock_get, mock_settings):
+        """Test that a long-poll request extends the client timeout by the wait time"""
+        mock_settings.app_server_name = 'example.com'
+        mock_response = Mock()
+        mock_response.status_code = 404
+        mock_get.return_value = mock_response
+
+        result = get_queue_next(self.task_uuid, wait=20)
+
+        self.assertIsNone(result)
+        mock_get.assert_called_once_with(
+            url=f'https://example.com/queue_next/{self.task_uuid}',
+            timeout=50,
+            params={'wait': 20}
+        )
+
     @patch('utils.queue_manager.settings')
     @patch('utils.queue_manager.requests.post')
     def test_send_queue_result_timeout(self, mock_post, mock_settings):
@@ -143,10 +197,15 @@ class TestQueueManagerNetworkChanges(unittest.TestCase):
 
         def test_callback(queue_item):
             callback_called[0] = True
+            # Stop the polling thread so it does not leak into other tests
+            raise StopPolling
 
         # Run polling in a thread with a timeout
         def run_polling():
-            polling_queue(self.task_uuid, test_callback, interval_sec=0.1)
+            try:
+                polling_queue(self.task_uuid, test_callback, interval_sec=0.1)
+            except StopPolling:
+                pass
 
         polling_thread = threading.Thread(target=run_polling, daemon=True)
         polling_thread.start()
@@ -176,10 +235,15 @@ class TestQueueManagerNetworkChanges(unittest.TestCase):
 
         def test_callback(queue_item):
             callback_called[0] = True
+            # Stop the polling thread so it does not leak into other tests
+            raise StopPolling
 
         # Run polling in a thread
         def run_polling():
-            polling_queue(self.task_uuid, test_callback, interval_sec=0.05)
+            try:
+                polling_queue(self.task_uuid, test_callback, interval_sec=0.05)
+            except StopPolling:
+                pass
 
         polling_thread = threading.Thread(target=run_polling, daemon=True)
         polling_thread.start()
@@ -0,0 +1,72 @@
+"""
+Tests for utils/queue_notifier.py
+Testing the in-process notifier used by long-polling /queue_next requests.
+"""
+
+import unittest
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.queue_notifier import QueueNotifier
+
+
+class TestQueueNotifier(unittest.TestCase):
+    """Test waking waiters registered for a task."""
+
+    def test_wait_times_out_without_notification(self):
+        notifier = QueueNotifier()
+
+        async def run():
+            with notifier.waiter('task-1') as waiter:
+                return await waiter.wait(0.01)
+
+        self.assertFalse(asyncio.run(run()))
+        self.assertEqual(notifier.waiters, {})
+
+    def test_notify_wakes_waiter_of_the_task(self):
+        notifier = QueueNotifier()
+
+        async def run():
+            with notifier.waiter('task-1') as waiter:
+                asyncio.get_running_loop().call_later(0.01, asyncio.ensure_future, notifier.notify('task-1'))
+                return await waiter.wait(5)
+
+        self.assertTrue(asyncio.run(run()))
+
+    def test_notify_other_task_does_not_wake(self):
+        notifier = QueueNotifier()
+
+        async def run():
+            with notifier.waiter('task-1') as waiter:
+                await notifier.notify('task-2')
+                return await waiter.wait(0.01)
+
+        self.assertFalse(asyncio.run(run()))
+
+    def test_notification_before_wait_is_not_lost(self):
+        """An item enqueued between the queue check and the wait must still wake the waiter."""
+        notifier = QueueNotifier()
+
+        async def run():
+            with notifier.waiter('task-1') as waiter:
+                await notifier.notify('task-1')
+                return await waiter.wait(0.01)
+
+        self.assertTrue(asyncio.run(run()))
+
+    def test_notify_without_task_wakes_everyone(self):
+        notifier = QueueNotifier()
+
+        async def run():
+            with notifier.waiter('task-1') as first, notifier.waiter('task-2') as second:
+                await notifier.notify()
+                return await first.wait(0.01), await second.wait(0.01)
+
+        self.assertEqual(asyncio.run(run()), (True, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+"""
+Tests for repositories/queue_repository.py
+Running the queue queries against an in-memory SQLite database.
+"""
+
+import unittest
+import datetime
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from db.db import Base
+from models.queue import Queue, QueueStatus
+from models.task import Task
+from repositories.queue_repository import QueueRepository
+
+
+class QueueRepositoryTestCase(unittest.IsolatedAsyncioTestCase):
+    """Base class creating a fresh in-memory database for every test."""
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine('sqlite+aiosqlite://', poolclass=StaticPool)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        async with self.session_maker() as session:
+            task = Task(name='test', title='Test task')
+            other_task = Task(name='other', title='Other task')
+            session.add_all([task, other_task])
+            await session.commit()
+            self.task_id = task.id
+            self.other_task_id = other_task.id
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def add_items(self, count, task_id=None, status=QueueStatus.PENDING.value):
+        async with self.session_maker() as session:
+            items = [Queue(task_id=task_id or self.task_id, status=status, data={'index': i}) for i in range(count)]
+            session.add_all(items)
+            await session.commit()
+            return [item.id for item in items]
+
+
+class TestClaimNext(QueueRepositoryTestCase):
+    """Test the atomic claim of the next pending item."""
+
+    async def test_claims_oldest_pending_item(self):
+        ids = await self.add_items(3)
+
+        async with self.session_maker() as session:
+            result = await QueueRepository(session).claim_next(self.task_id, owner='127.0.0.1')
+
+        self.assertEqual(result.id, ids[0])
+        self.assertEqual(result.status, QueueStatus.PROCESSING.value)
+        self.assertEqual(result.owner, '127.0.0.1')
+
+        async with self.session_maker() as session:
+            self.assertEqual((await session.get(Queue, ids[0])).status, QueueStatus.PROCESSING.value)
+            self.assertEqual((await session.get(Queue, ids[1])).status, QueueStatus.PENDING.value)
+
+    async def test_consecutive_claims_return_distinct_items(self):
+        ids = await self.add_items(2)
+
+        async with self.session_maker() as session:
+            first = await QueueRepository(session).claim_next(self.task_id)
+        async with self.session_maker() as session:
+            second = await QueueRepository(session).claim_next(self.task_id)
+        async with self.session_maker() as session:
+            third = await QueueRepository(session).claim_next(self.task_id)
+
+        self.assertEqual([first.id, second.id], ids)
+        self.assertIsNone(third)
+
+    async def test_ignores_other_tasks_and_statuses(self):
+        await self.add_items(1, task_id=self.other_task_id)
+        await self.add_items(1, status=QueueStatus.COMPLETED.value)
+
+        async with self.session_maker() as session:
+            result = await QueueRepository(session).claim_next(self.task_id)
+
+        self.assertIsNone(result)
+
+
+class TestClaimMany(QueueRepositoryTestCase):
+    """Test claiming a batch of pending items."""
+
+    async def test_claims_up_to_limit_in_order(self):
+        ids = await self.add_items(5)
+
+        async with self.session_maker() as session:
+            result = await QueueRepository(session).claim_many(self.task_id, limit=3, owner='worker')
+
+        self.assertEqual([item.id for item in result], ids[:3])
+        self.assertTrue(all(item.status == QueueStatus.PROCESSING.value for item in result))
+        self.assertTrue(all(item.pending == 2 for item in result))
+
+        async with self.session_maker() as session:
+            rest = await QueueRepository(session).claim_many(self.task_id, limit=3)
+
+        self.assertEqual([item.id for item in rest], ids[3:])
+
+    async def test_returns_empty_list_when_nothing_pending(self):
+        async with self.session_maker() as session:
+            result = await QueueRepository(session).claim_many(self.task_id, limit=10)
+
+        self.assertEqual(result, [])
+
+
+class TestGetPosition(QueueRepositoryTestCase):
+    """Test computing the position of a pending item with a COUNT query."""
+
+    async def test_position_counts_only_pending_items_of_the_task_ahead(self):
+        first_id, second_id, third_id = await self.add_items(3)
+        await self.add_items(2, task_id=self.other_task_id)
+
+        async with self.session_maker() as session:
+            repository = QueueRepository(session)
+            self.assertEqual(await repository.get_position(first_id, task_id=self.task_id), 1)
+            self.assertEqual(await repository.get_position(third_id, task_id=self.task_id), 3)
+
+            await repository.claim_next(self.task_id)
+            self.assertEqual(await repository.get_position(second_id, task_id=self.task_id), 1)
+            self.assertEqual(await repository.get_position(third_id, task_id=self.task_id), 2)
+
+
+class TestFindPendingUuids(QueueRepositoryTestCase):
+    """Test listing the pending items that receive position updates."""
+
+    async def test_returns_first_pending_items_in_order(self):
+        ids = await self.add_items(4)
+        await self.add_items(1, task_id=self.other_task_id)
+
+        async with self.session_maker() as session:
+            repository = QueueRepository(session)
+            await repository.claim_next(self.task_id)
+            uuids = await repository.find_pending_uuids(self.task_id, limit=2)
+            expected = [(await repository.find_one(item_id)).uuid for item_id in ids[1:3]]
+
+        self.assertEqual(uuids, expected)
+
+
+class TestFindAllKeyset(QueueRepositoryTestCase):
+    """Test keyset pagination in find_all."""
+
+    async def test_pages_follow_id_bounds(self):
+        ids = await self.add_items(5)
+
+        async with self.session_maker() as session:
+            repository = QueueRepository(session)
+            first_page = await repository.find_all(limit=2, sort_dir='desc')
+            second_page = await repository.find_all(limit=2, sort_dir='desc', before_id=first_page[-1].id)
+            asc_page = await repository.find_all(limit=10, sort_dir='asc', after_id=ids[2])
+
+        self.assertEqual([item.id for item in first_page], [ids[4], ids[3]])
+        self.assertEqual([item.id for item in second_page], [ids[2], ids[1]])
+        self.assertEqual([item.id for item in asc_page], ids[3:])
+
+    async def test_estimate_count(self):
+        await self.add_items(4)
+
+        async with self.session_maker() as session:
+            self.assertEqual(await QueueRepository(session).estimate_count(), 4)
+
+
+class TestRestoreOutdated(QueueRepositoryTestCase):
+    """Test the set-based recovery of items stuck in processing."""
+
+    async def add_processing_item(self, created_ago, updated_ago):
+        now = datetime.datetime.utcnow()
+        async with self.session_maker() as session:
+            item = Queue(task_id=self.task_id, status=QueueStatus.PROCESSING.value,
+                         time_created=now - datetime.timedelta(seconds=created_ago),
+                         time_updated=now - datetime.timedelta(seconds=updated_ago))
+            session.add(item)
+            await session.commit()
+            return item.id
+
+    async def get_status(self, item_id):
+        async with self.session_maker() as session:
+            return (await session.get(Queue, item_id)).status
+
+    async def test_restores_and_expires_outdated_items(self):
+        fresh_id = await self.add_processing_item(created_ago=500, updated_ago=10)
+        restore_id = await self.add_processing_item(created_ago=50, updated_ago=200)
+        expire_id = await self.add_processing_item(created_ago=500, updated_ago=200)
+
+        async with self.session_maker() as session:
+            restored, expired = await QueueRepository(session).restore_outdated(100)
+
+        self.assertEqual((restored, expired), (1, 1))
+        self.assertEqual(await self.get_status(fresh_id), QueueStatus.PROCESSING.value)
+        self.assertEqual(await self.get_status(restore_id), QueueStatus.PENDING.value)
+        self.assertEqual(await self.get_status(expire_id), QueueStatus.ERROR.value)
+
+    async def test_ignores_other_statuses(self):
+        await self.add_items(1)
+
+        async with self.session_maker() as session:
+            self.assertEqual(await QueueRepository(session).restore_outdated(0), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
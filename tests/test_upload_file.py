@@ -0,0 +1,189 @@
+"""
+Tests for utils/upload_file.py
+Testing the chunked copy of uploads with type sniffing, size limits and deduplication.
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+import io
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import HTTPException, UploadFile
+
+# tests/test_queue_manager.py replaces this module with a MagicMock, import the real one
+mocked_module = sys.modules.pop('utils.upload_file', None)
+import utils.upload_file as upload_module
+from utils import upload_storage
+if isinstance(mocked_module, MagicMock):
+    sys.modules['utils.upload_file'] = mocked_module
+
+upload_file = upload_module.upload_file
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR'
+
+
+class TestUploadFile(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        key_patcher = patch.object(upload_storage, 'upload_hash_key', b'test-key')
+        key_patcher.start()
+        self.addCleanup(key_patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path, ignore_errors=True)
+
+    def stored_files(self):
+        """Uploaded files, without the content store."""
+        return [os.path.relpath(os.path.join(root, name), self.dir_path)
+                for root, _, names in os.walk(self.dir_path) for name in names
+                if not os.path.relpath(root, self.dir_path).startswith(upload_storage.CAS_DIR)]
+
+    def make_upload(self, contents, size=None):
+        return UploadFile(file=io.BytesIO(contents), size=size, filename='upload')
+
+    def test_copies_file_in_chunks(self):
+        contents = PNG_HEADER + os.urandom(10000)
+        upload = self.make_upload(contents)
+
+        with patch.object(upload.file, 'read', wraps=upload.file.read) as read_mock:
+            file_name = upload_file(upload, self.dir_path, type='image', chunk_size=4096)
+
+        self.assertTrue(file_name.endswith('.png'))
+        with open(os.path.join(self.dir_path, file_name), 'rb') as f:
+            self.assertEqual(f.read(), contents)
+        self.assertTrue(all(c.args == (4096,) for c in read_mock.call_args_list))
+        # One pass: 3 chunks and the empty read at the end
+        self.assertEqual(read_mock.call_count, 4)
+        self.assertEqual(self.stored_files(), [file_name])
+
+    def test_rejects_wrong_type_before_copying(self):
+        with self.assertRaises(HTTPException) as ctx:
+            upload_file(self.make_upload(PNG_HEADER + b'0' * 100), self.dir_path, type='video')
+
+        self.assertEqual(ctx.exception.status_code, 415)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_rejects_declared_size_without_reading(self):
+        upload = self.make_upload(PNG_HEADER, size=200 * 1024 * 1024)
+
+        with patch.object(upload.file, 'read') as read_mock, self.assertRaises(HTTPException) as ctx:
+            upload_file(upload, self.dir_path, type='image')
+
+        self.assertEqual(ctx.exception.status_code, 413)
+        read_mock.assert_not_called()
+
+    def test_stops_copying_when_limit_is_exceeded(self):
+        upload = self.make_upload(PNG_HEADER + b'0' * 5000)
+
+        with patch.object(upload_module, 'IMAGE_MAX_FILE_SIZE', 2048), self.assertRaises(HTTPException) as ctx:
+            upload_file(upload, self.dir_path, type='image', chunk_size=1024)
+
+        self.assertEqual(ctx.exception.status_code, 413)
+        self.assertEqual(upload.file.tell(), 3072)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_names_files_by_content(self):
+        contents = PNG_HEADER + os.urandom(1000)
+
+        first_name = upload_file(self.make_upload(contents), self.dir_path, type='image')
+        second_name = upload_file(self.make_upload(contents), self.dir_path, type='image')
+        other_name = upload_file(self.make_upload(PNG_HEADER + os.urandom(1000)), self.dir_path, type='image')
+
+        self.assertEqual(first_name, second_name)
+        self.assertNotEqual(first_name, other_name)
+        self.assertTrue(upload_module.is_content_name(os.path.basename(first_name)))
+
+    def test_links_duplicate_to_stored_file(self):
+        contents = PNG_HEADER + os.urandom(1000)
+        file_name = upload_file(self.make_upload(contents), self.dir_path, type='image')
+        file_path = os.path.join(self.dir_path, file_name)
+        os.remove(file_path)
+        deduplicated = upload_storage.STATS['deduplicated']
+
+        upload = self.make_upload(contents)
+        with patch.object(upload_module, 'store_file') as store_mock:
+            self.assertEqual(upload_file(upload, self.dir_path, type='image'), file_name)
+
+        store_mock.assert_not_called()
+        self.assertEqual(self.stored_files(), [file_name])
+        stored_path = upload_storage.stored_file_path(self.dir_path, os.path.basename(file_name))
+        self.assertTrue(os.path.samefile(file_path, stored_path))
+        self.assertEqual(os.stat(stored_path).st_nlink, 2)
+        self.assertEqual(upload_storage.STATS['deduplicated'], deduplicated + 1)
+
+
+class TestUploadFromUrl(unittest.TestCase):
+    file_name = 'f2357771f7dceb7cba3ef6fe285dd4e2.png'
+
+    def setUp(self):
+        self.root_path = tempfile.mkdtemp()
+        self.dir_path = os.path.join(self.root_path, 'files')
+        server_patcher = patch.object(upload_module.settings, 'app_server_name', 'queue.example.com')
+        server_patcher.start()
+        self.addCleanup(server_patcher.stop)
+
+    def store_cached(self, contents):
+        os.makedirs(self.dir_path)
+        with open(os.path.join(self.dir_path, self.file_name), 'wb') as f:
+            f.write(contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_path, ignore_errors=True)
+
+    def test_skips_download_of_stored_content(self):
+        self.store_cached(PNG_HEADER)
+
+        with patch.object(upload_module.requests, 'get') as get_mock:
+            file_path = upload_module.upload_from_url(
+                self.dir_path, f'https://queue.example.com/uploads/2024070115/f2/35/{self.file_name}')
+
+        get_mock.assert_not_called()
+        self.assertEqual(file_path, os.path.join(self.dir_path, self.file_name))
+
+    def test_cached_file_is_validated(self):
+        self.store_cached(PNG_HEADER)
+
+        with patch.object(upload_module.requests, 'get'), self.assertRaises(HTTPException) as ctx:
+            upload_module.upload_from_url(self.dir_path, f'https://queue.example.com/uploads/{self.file_name}', type='video')
+
+        self.assertEqual(ctx.exception.status_code, 415)
+
+    def test_downloads_new_content_under_its_name(self):
+        response = MagicMock(content=PNG_HEADER + b'0' * 100, headers={})
+
+        with patch.object(upload_module.requests, 'get', return_value=response) as get_mock:
+            file_path = upload_module.upload_from_url(self.dir_path, f'https://queue.example.com/uploads/{self.file_name}?v=1')
+
+        get_mock.assert_called_once()
+        self.assertEqual(file_path, os.path.join(self.dir_path, self.file_name))
+        self.assertEqual(os.listdir(self.dir_path), [self.file_name])
+
+    def test_hash_names_of_other_hosts_are_not_cached(self):
+        self.store_cached(PNG_HEADER)
+        response = MagicMock(content=PNG_HEADER + b'1' * 100, headers={})
+
+        with patch.object(upload_module.requests, 'get', return_value=response) as get_mock:
+            file_path = upload_module.upload_from_url(self.dir_path, f'https://other.example.com/uploads/{self.file_name}')
+
+        get_mock.assert_called_once()
+        self.assertNotEqual(os.path.basename(file_path), self.file_name)
+        with open(os.path.join(self.dir_path, self.file_name), 'rb') as f:
+            self.assertEqual(f.read(), PNG_HEADER)
+
+    def test_invalid_download_leaves_no_file(self):
+        response = MagicMock(content=b'not an image', headers={})
+
+        with patch.object(upload_module.requests, 'get', return_value=response), self.assertRaises(HTTPException):
+            upload_module.upload_from_url(self.dir_path, f'https://queue.example.com/uploads/{self.file_name}')
+
+        self.assertEqual(os.listdir(self.dir_path), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+"""
+Tests for utils/upload_storage.py
+Testing the hourly, sharded upload layout, the content store and their cleanup.
+"""
+
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import time
+import shutil
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils import upload_storage
+from utils.upload_storage import (
+    cleanup_uploads,
+    delete_old_files,
+    link_stored_file,
+    make_upload_dir,
+    migrate_flat_uploads,
+    store_file,
+    stored_file_path,
+    upload_bucket,
+    UploadStaticFiles,
+    STATS,
+)
+
+
+class UploadDirTestCase(unittest.TestCase):
+    """Base class creating an empty uploads directory for every test."""
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path, ignore_errors=True)
+
+    def touch(self, *path, age_sec=0, size=0):
+        file_path = os.path.join(self.dir_path, *path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as f:
+            f.write(b'0' * size)
+        mtime = time.time() - age_sec
+        os.utime(file_path, (mtime, mtime))
+        return file_path
+
+
+class TestCleanupUploads(UploadDirTestCase):
+
+    def test_upload_bucket(self):
+        self.assertEqual(upload_bucket(datetime(2024, 7, 1, 15, 59)), '2024070115')
+
+    def test_make_upload_dir_shards_by_name(self):
+        rel_dir, path = make_upload_dir(self.dir_path, 'e43f23de-cb2f-11f1.png')
+
+        self.assertEqual(rel_dir, f'{upload_bucket()}/e4/3f')
+        self.assertTrue(os.path.isdir(path))
+        self.assertEqual(make_upload_dir(self.dir_path, 'image.png')[0], upload_bucket())
+
+    def test_deletes_whole_expired_buckets_only(self):
+        now = datetime(2024, 7, 1, 15, 30)
+        # Max age 1h: files of 13:xx are older than 1h at 15:00, files of 14:xx may not be
+        self.touch('2024070113', 'a.png')
+        self.touch('2024070114', 'b.png')
+        self.touch('2024070115', 'c.png')
+
+        self.assertEqual(cleanup_uploads(self.dir_path, 3600, now=now), (1, 0))
+        self.assertEqual(sorted(os.listdir(self.dir_path)), ['2024070114', '2024070115'])
+
+    def test_legacy_flat_files_are_deleted_by_mtime(self):
+        old_path = self.touch('old.png', age_sec=7200)
+        new_path = self.touch('new.png')
+        nested_path = self.touch('output', 'old.png', age_sec=7200)
+
+        self.assertEqual(cleanup_uploads(self.dir_path, 3600), (0, 2))
+        self.assertFalse(os.path.exists(old_path))
+        self.assertFalse(os.path.exists(nested_path))
+        self.assertTrue(os.path.exists(new_path))
+
+
+class TestDeleteOldFiles(UploadDirTestCase):
+
+    def test_deletes_old_files_and_empty_dirs_with_stats(self):
+        self.touch('ab', 'cd', 'old.png', age_sec=7200, size=100)
+        self.touch('ab', 'ef', 'new.png')
+        before = dict(STATS)
+
+        self.assertEqual(delete_old_files(self.dir_path, max_hours=1), 1)
+
+        self.assertEqual(os.listdir(os.path.join(self.dir_path, 'ab')), ['ef'])
+        self.assertEqual(STATS['scanned'] - before['scanned'], 5)
+        self.assertEqual(STATS['deleted_bytes'] - before['deleted_bytes'], 100)
+        self.assertEqual(STATS['removed_dirs'] - before['removed_dirs'], 1)
+
+
+    def test_files_deleted_by_another_cleanup_are_skipped(self):
+        first_path = self.touch('ab', 'cd', 'a.png', age_sec=7200)
+        self.touch('ab', 'cd', 'b.png', age_sec=7200)
+        remove = os.remove
+
+        def remove_concurrently(path):
+            if path == first_path:
+                # The other cleanup was faster
+                remove(path)
+                raise FileNotFoundError(path)
+            remove(path)
+
+        with patch.object(upload_storage.os, 'remove', side_effect=remove_concurrently):
+            self.assertEqual(cleanup_uploads(self.dir_path, 3600), (0, 1))
+
+        self.assertEqual(os.listdir(os.path.join(self.dir_path, 'ab')), [])
+        self.assertEqual(delete_old_files(os.path.join(self.dir_path, 'missing')), 0)
+
+
+class TestContentStore(UploadDirTestCase):
+    name = 'f2357771f7dceb7cba3ef6fe285dd4e2.png'
+
+    def store(self, bucket):
+        tmp_path = self.touch(bucket, '.upload.part', size=10)
+        file_path = os.path.join(self.dir_path, bucket, 'f2', '35', self.name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        store_file(self.dir_path, self.name, tmp_path, file_path)
+        return file_path
+
+    def test_stored_file_is_collected_with_its_last_bucket(self):
+        now = datetime(2024, 7, 1, 15, 30)
+        first_path = self.store('2024070113')
+        second_path = os.path.join(self.dir_path, '2024070115', 'f2', '35', self.name)
+        os.makedirs(os.path.dirname(second_path))
+        self.assertTrue(link_stored_file(self.dir_path, self.name, second_path))
+        stored_path = stored_file_path(self.dir_path, self.name)
+        # Link count is the number of uploads + 1
+        self.assertEqual(os.stat(stored_path).st_nlink, 3)
+
+        self.assertEqual(cleanup_uploads(self.dir_path, 3600, now=now), (1, 0))
+        self.assertFalse(os.path.exists(first_path))
+        self.assertEqual(os.stat(stored_path).st_nlink, 2)
+
+        shutil.rmtree(os.path.join(self.dir_path, '2024070115'))
+        self.assertEqual(cleanup_uploads(self.dir_path, 3600, now=now), (0, 1))
+        self.assertFalse(os.path.exists(stored_path))
+        self.assertFalse(link_stored_file(self.dir_path, self.name, second_path))
+
+
+class TestHashKey(UploadDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        key_patcher = patch.object(upload_storage, 'upload_hash_key', None)
+        key_patcher.start()
+        self.addCleanup(key_patcher.stop)
+
+    def test_random_key_is_created_once_when_not_configured(self):
+        key_path = os.path.join(self.dir_path, '.upload_hash_key')
+        with patch.object(upload_storage.settings, 'upload_hash_key', ''), \
+                patch.object(upload_storage, 'HASH_KEY_FILE', key_path):
+            key = upload_storage.get_upload_hash_key()
+            upload_storage.upload_hash_key = None
+            self.assertEqual(upload_storage.get_upload_hash_key(), key)
+
+        self.assertEqual(len(key), 64)
+        self.assertEqual(os.listdir(self.dir_path), ['.upload_hash_key'])
+        self.assertEqual(os.stat(key_path).st_mode & 0o777, 0o600)
+
+    def test_configured_key_is_used(self):
+        with patch.object(upload_storage.settings, 'upload_hash_key', 'secret'), \
+                patch.object(upload_storage, 'HASH_KEY_FILE', os.path.join(self.dir_path, '.upload_hash_key')):
+            self.assertEqual(upload_storage.get_upload_hash_key(), b'secret')
+            hasher = upload_storage.content_hasher()
+
+        hasher.update(b'content')
+        self.assertNotEqual(hasher.hexdigest(), upload_storage.hashlib.blake2b(b'content', digest_size=16).hexdigest())
+        self.assertEqual(os.listdir(self.dir_path), [])
+
+
+class TestShardedUrls(UploadDirTestCase):
+
+    def test_migrated_files_keep_their_urls(self):
+        name = 'e43f23de-cb2f-11f1.png'
+        self.touch(name)
+        self.touch('robots.txt')
+
+        self.assertEqual(migrate_flat_uploads(self.dir_path), 1)
+        self.assertTrue(os.path.isfile(os.path.join(self.dir_path, 'e4', '3f', name)))
+
+        static_files = UploadStaticFiles(directory=self.dir_path)
+        full_path, stat_result = static_files.lookup_path(name)
+        self.assertIsNotNone(stat_result)
+        self.assertEqual(full_path, os.path.realpath(os.path.join(self.dir_path, 'e4', '3f', name)))
+        self.assertIsNotNone(static_files.lookup_path('robots.txt')[1])
+        self.assertIsNone(static_files.lookup_path('ffff0000.png')[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
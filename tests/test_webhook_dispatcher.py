@@ -0,0 +1,160 @@
+"""
+Tests for utils/webhook_dispatcher.py and the webhook outbox
+Running the dispatcher against an in-memory SQLite database and a mocked HTTP transport.
+"""
+
+import unittest
+import datetime
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from db.db import Base
+from models.queue import Queue, QueueStatus
+from models.task import Task
+from models.webhook import Webhook, WebhookStatus
+from repositories.queue_repository import QueueRepository
+from repositories.webhook_repository import WebhookRepository
+from utils.webhook import webhook_payload
+from utils.webhook_dispatcher import WebhookDispatcher
+
+WEBHOOK_URL = 'https://example.com/webhook'
+
+
+class WebhookTestCase(unittest.IsolatedAsyncioTestCase):
+    """Base class creating a fresh in-memory database with one processing item."""
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine('sqlite+aiosqlite://', poolclass=StaticPool)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        async with self.session_maker() as session:
+            task = Task(name='test', title='Test task', webhook_url=WEBHOOK_URL)
+            session.add(task)
+            await session.flush()
+            item = Queue(task_id=task.id, status=QueueStatus.PROCESSING.value)
+            session.add(item)
+            await session.commit()
+            self.item_id = item.id
+            self.item_uuid = item.uuid
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def set_result(self, webhook_url=WEBHOOK_URL):
+        result_data = {'ok': True}
+        async with self.session_maker() as session:
+            return await QueueRepository(session).update_result(
+                {'status': QueueStatus.COMPLETED.value, 'result_data': result_data},
+                self.item_id,
+                webhook_url=webhook_url,
+                webhook_payload=webhook_payload(self.item_uuid, QueueStatus.COMPLETED.value, result_data)
+            )
+
+    async def get_webhooks(self):
+        async with self.session_maker() as session:
+            return (await session.execute(select(Webhook).order_by(Webhook.id))).scalars().all()
+
+    def create_dispatcher(self, handler, **kwargs):
+        kwargs.setdefault('host_interval', 0)
+        return WebhookDispatcher(session_maker=self.session_maker, transport=httpx.MockTransport(handler), **kwargs)
+
+
+class TestOutbox(WebhookTestCase):
+    """Test writing and leasing outbox rows."""
+
+    async def test_result_and_webhook_are_written_together(self):
+        result = await self.set_result()
+
+        self.assertEqual(result.status, QueueStatus.COMPLETED.value)
+        webhooks = await self.get_webhooks()
+        self.assertEqual(len(webhooks), 1)
+        self.assertEqual(webhooks[0].url, WEBHOOK_URL)
+        self.assertEqual(webhooks[0].status, WebhookStatus.PENDING.value)
+        self.assertEqual(webhooks[0].payload, {'uuid': self.item_uuid, 'status': 'completed', 'result': {'ok': True}})
+
+    async def test_no_webhook_without_url(self):
+        await self.set_result(webhook_url=None)
+
+        self.assertEqual(await self.get_webhooks(), [])
+
+    async def test_claim_due_leases_rows(self):
+        await self.set_result()
+
+        async with self.session_maker() as session:
+            first = await WebhookRepository(session).claim_due(limit=10, lease_sec=60)
+        async with self.session_maker() as session:
+            second = await WebhookRepository(session).claim_due(limit=10, lease_sec=60)
+
+        self.assertEqual(len(first), 1)
+        self.assertEqual(first[0].attempts, 1)
+        self.assertEqual(second, [])
+
+
+class TestWebhookDispatcher(WebhookTestCase):
+    """Test delivering outbox rows."""
+
+    async def test_delivers_payload(self):
+        await self.set_result()
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={'success': True})
+
+        dispatcher = self.create_dispatcher(handler)
+        self.assertEqual(await dispatcher.dispatch_due(), 1)
+        await dispatcher.close()
+
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(str(requests[0].url), WEBHOOK_URL)
+        self.assertEqual(json.loads(requests[0].content)['uuid'], self.item_uuid)
+        webhook = (await self.get_webhooks())[0]
+        self.assertEqual(webhook.status, WebhookStatus.DELIVERED.value)
+        self.assertEqual(webhook.response_code, 200)
+
+    async def test_failed_delivery_is_rescheduled_with_backoff(self):
+        await self.set_result()
+        dispatcher = self.create_dispatcher(lambda request: httpx.Response(503), retry_base=10)
+
+        await dispatcher.dispatch_due()
+        await dispatcher.close()
+
+        webhook = (await self.get_webhooks())[0]
+        self.assertEqual(webhook.status, WebhookStatus.PENDING.value)
+        self.assertEqual(webhook.response_code, 503)
+        self.assertEqual(webhook.last_error, 'HTTP 503')
+        self.assertGreater(webhook.next_attempt_at, datetime.datetime.utcnow() + datetime.timedelta(seconds=5))
+
+    async def test_gives_up_after_max_attempts(self):
+        await self.set_result()
+
+        def handler(request):
+            raise httpx.ConnectError('Connection refused')
+
+        dispatcher = self.create_dispatcher(handler, max_attempts=1)
+        await dispatcher.dispatch_due()
+        await dispatcher.close()
+
+        webhook = (await self.get_webhooks())[0]
+        self.assertEqual(webhook.status, WebhookStatus.FAILED.value)
+        self.assertEqual(webhook.last_error, 'Connection refused')
+
+    def test_backoff_is_exponential_and_capped(self):
+        dispatcher = WebhookDispatcher(retry_base=10)
+
+        self.assertEqual([dispatcher.backoff(n) for n in (1, 2, 3)], [10, 20, 40])
+        self.assertEqual(dispatcher.backoff(30), 3600)
+
+
+if __name__ == '__main__':
+    unittest.main()
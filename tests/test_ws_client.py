@@ -0,0 +1,94 @@
+"""
+Tests for web/client.py
+Running the WebSocket publisher against a real web/server.py instance on a local port.
+"""
+
+import unittest
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import websockets
+from websockets.asyncio.server import serve
+
+from web.client import WebSocketPublisher
+from web.server import register, CONNECTIONS, WS_TO_KEY
+
+
+class WebSocketPublisherTestCase(unittest.IsolatedAsyncioTestCase):
+    """Base class starting a WebSocket server and a connected recipient."""
+
+    async def asyncSetUp(self):
+        CONNECTIONS.clear()
+        WS_TO_KEY.clear()
+        self.server = await serve(register, 'localhost', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.recipient = await self.connect_recipient('recipient-uuid')
+        self.publisher = WebSocketPublisher(uri=f'ws://localhost:{self.port}', buffer_size=10, max_reconnect_delay=0.2)
+
+    async def asyncTearDown(self):
+        await self.publisher.close(timeout=0)
+        await self.recipient.close()
+        self.server.close()
+        await self.server.wait_closed()
+        CONNECTIONS.clear()
+        WS_TO_KEY.clear()
+
+    async def connect_recipient(self, recipient_uuid):
+        websocket = await websockets.connect(f'ws://localhost:{self.port}')
+        await websocket.recv()  # Greeting
+        await websocket.send(json.dumps({'recipient_uuid': recipient_uuid, 'message': 'connected'}))
+        for _ in range(50):
+            if recipient_uuid in CONNECTIONS:
+                break
+            await asyncio.sleep(0.01)
+        return websocket
+
+    async def receive(self, count):
+        return [await asyncio.wait_for(self.recipient.recv(), 2) for _ in range(count)]
+
+
+class TestWebSocketPublisher(WebSocketPublisherTestCase):
+
+    async def test_messages_share_one_connection(self):
+        for i in range(5):
+            self.publisher.publish('recipient-uuid', f'message {i}')
+
+        self.assertEqual(await self.receive(5), [f'message {i}' for i in range(5)])
+
+        self.publisher.publish('recipient-uuid', 'later')
+        self.assertEqual(await self.receive(1), ['later'])
+        # Recipient and one publisher connection
+        self.assertEqual(len(WS_TO_KEY), 2)
+
+    async def test_buffers_while_server_is_down(self):
+        self.publisher.uri = 'ws://localhost:1'
+        self.publisher.publish('recipient-uuid', 'buffered')
+        await asyncio.sleep(0.1)
+
+        self.publisher.uri = f'ws://localhost:{self.port}'
+
+        self.assertEqual(await self.receive(1), ['buffered'])
+
+    async def test_buffer_drops_oldest_messages(self):
+        self.publisher.uri = 'ws://localhost:1'
+        for i in range(15):
+            self.publisher.publish('recipient-uuid', f'message {i}')
+
+        self.assertEqual(self.publisher.dropped, 5)
+        self.assertEqual(self.publisher.buffer[0]['message'], 'message 5')
+
+    def test_batch_respects_size_limit(self):
+        publisher = WebSocketPublisher(max_batch=3, max_batch_size=10)
+        for message in ('aaaa', 'bbbb', 'cccc', 'dddd'):
+            publisher.buffer.append({'recipient_uuid': 'r', 'message': message})
+
+        self.assertEqual([item['message'] for item in publisher._take_batch()], ['aaaa', 'bbbb'])
+        self.assertEqual([item['message'] for item in publisher._take_batch()], ['cccc', 'dddd'])
+
+
+if __name__ == '__main__':
+    unittest.main()
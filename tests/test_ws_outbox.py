@@ -0,0 +1,82 @@
+"""
+Tests for web/outbox.py
+Testing the bounded per-connection queue used for slow WebSocket consumers.
+"""
+
+import unittest
+from unittest.mock import AsyncMock
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from web.outbox import ConnectionOutbox, STATS
+
+
+class BlockedWebSocket:
+    """Websocket whose send() blocks until released, like a recipient that stopped reading."""
+
+    def __init__(self):
+        self.released = asyncio.Event()
+        self.sent = []
+        self.close = AsyncMock()
+
+    async def send(self, message):
+        await self.released.wait()
+        self.sent.append(message)
+
+
+class TestConnectionOutbox(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        STATS['dropped'] = 0
+        STATS['closed'] = 0
+
+    async def test_messages_are_sent_in_order(self):
+        websocket = BlockedWebSocket()
+        websocket.released.set()
+        outbox = ConnectionOutbox(websocket, max_size=10)
+
+        for i in range(3):
+            self.assertTrue(outbox.send_nowait(f'message {i}'))
+        await asyncio.sleep(0.01)
+        await outbox.close()
+
+        self.assertEqual(websocket.sent, ['message 0', 'message 1', 'message 2'])
+
+    async def test_drop_policy_drops_oldest_messages(self):
+        websocket = BlockedWebSocket()
+        outbox = ConnectionOutbox(websocket, max_size=2, policy='drop')
+        await asyncio.sleep(0)
+        outbox.send_nowait('in flight')
+        await asyncio.sleep(0)
+
+        for i in range(4):
+            outbox.send_nowait(f'message {i}')
+
+        self.assertEqual(outbox.dropped, 2)
+        self.assertEqual(STATS['dropped'], 2)
+
+        websocket.released.set()
+        await asyncio.sleep(0.01)
+        await outbox.close()
+        self.assertEqual(websocket.sent, ['in flight', 'message 2', 'message 3'])
+
+    async def test_close_policy_closes_slow_connection(self):
+        websocket = BlockedWebSocket()
+        outbox = ConnectionOutbox(websocket, max_size=1, policy='close')
+
+        outbox.send_nowait('first')
+        outbox.send_nowait('second')
+        self.assertFalse(outbox.send_nowait('third'))
+        await asyncio.sleep(0.01)
+
+        websocket.close.assert_called_once()
+        self.assertEqual(STATS['closed'], 1)
+        self.assertFalse(outbox.send_nowait('after close'))
+        await outbox.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
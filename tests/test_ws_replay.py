@@ -0,0 +1,77 @@
+"""
+Tests for web/replay.py
+Testing the bounded per-UUID buffer of messages replayed on (re)connect.
+"""
+
+import unittest
+from unittest.mock import patch
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from web.replay import ReplayBuffer, seq_envelope
+
+
+class TestReplayBuffer(unittest.TestCase):
+
+    def test_since_last_seq_returns_newer_messages(self):
+        buffer = ReplayBuffer()
+        first = buffer.append('uuid-1', 'one')
+        second = buffer.append('uuid-1', 'two')
+        buffer.append('uuid-2', 'other')
+
+        self.assertGreater(second, first)
+        self.assertEqual(buffer.since('uuid-1', 0), [(first, 'one'), (second, 'two')])
+        self.assertEqual(buffer.since('uuid-1', first), [(second, 'two')])
+        self.assertEqual(buffer.since('unknown', 0), [])
+
+    def test_without_last_seq_returns_undelivered_messages(self):
+        buffer = ReplayBuffer()
+        buffer.append('uuid-1', 'seen', delivered=True)
+        seq = buffer.append('uuid-1', 'missed', delivered=False)
+
+        self.assertEqual(buffer.since('uuid-1'), [(seq, 'missed')])
+
+    def test_replayed_messages_are_marked_delivered(self):
+        buffer = ReplayBuffer()
+        first = buffer.append('uuid-1', 'one', delivered=False)
+        second = buffer.append('uuid-1', 'two', delivered=False)
+
+        buffer.mark_delivered('uuid-1', [first])
+
+        self.assertEqual(buffer.since('uuid-1'), [(second, 'two')])
+        self.assertEqual(buffer.since('uuid-1', 0), [(first, 'one'), (second, 'two')])
+
+    def test_keeps_last_messages_per_key(self):
+        buffer = ReplayBuffer(max_messages=2)
+        for i in range(5):
+            buffer.append('uuid-1', f'm{i}')
+
+        self.assertEqual([message for _, message in buffer.since('uuid-1', 0)], ['m3', 'm4'])
+
+    def test_evicts_least_recently_written_keys(self):
+        buffer = ReplayBuffer(max_keys=2)
+        buffer.append('uuid-1', 'one')
+        buffer.append('uuid-2', 'two')
+        buffer.append('uuid-1', 'three')
+        buffer.append('uuid-3', 'four')
+
+        self.assertEqual(list(buffer.entries), ['uuid-1', 'uuid-3'])
+
+    def test_expired_messages_are_not_replayed(self):
+        buffer = ReplayBuffer(ttl=10)
+        with patch('web.replay.time.monotonic', return_value=100):
+            buffer.append('uuid-1', 'old')
+        with patch('web.replay.time.monotonic', return_value=105):
+            seq = buffer.append('uuid-1', 'new')
+        with patch('web.replay.time.monotonic', return_value=112):
+            self.assertEqual(buffer.since('uuid-1', 0), [(seq, 'new')])
+
+    def test_seq_envelope(self):
+        self.assertEqual(json.loads(seq_envelope('uuid-1', 7, 'hello')), {'seq': 7, 'uuid': 'uuid-1', 'message': 'hello'})
+
+
+if __name__ == '__main__':
+    unittest.main()
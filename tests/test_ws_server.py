@@ -15,11 +15,15 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from web.server import (
     WebSocketMessage,
     _add_connection,
+    _remove_connection,
     _remove_connection_by_key,
     _remove_connection_by_ws,
     _parse_message,
+    _parse_messages,
     CONNECTIONS,
     WS_TO_KEY,
+    REPLAY,
+    SEQ_SOCKETS,
 )
 
 
@@ -77,6 +81,31 @@ class TestParseMessage(unittest.TestCase):
         self.assertEqual(result.message, msg)
 
 
+class TestParseMessages(unittest.TestCase):
+    """Test _parse_messages function (single messages and batch frames)."""
+
+    def test_single_message(self):
+        msg = json.dumps({'recipient_uuid': 'abc-123', 'message': 'hello'})
+        result = _parse_messages(msg)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].recipient_uuid, 'abc-123')
+
+    def test_batch_message(self):
+        msg = json.dumps([
+            {'recipient_uuid': 'abc-123', 'message': 'one'},
+            {'recipient_uuid': 'def-456', 'message': 'two'},
+        ])
+        result = _parse_messages(msg)
+        self.assertEqual([(e.recipient_uuid, e.message) for e in result],
+                         [('abc-123', 'one'), ('def-456', 'two')])
+
+    def test_array_of_plain_values_is_plain_message(self):
+        msg = '["not", "a", "dict"]'
+        result = _parse_messages(msg)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].message, msg)
+
+
 class TestConnectionManagement(unittest.TestCase):
     """Test connection add/remove helper functions."""
 
@@ -92,9 +121,9 @@ class TestConnectionManagement(unittest.TestCase):
         ws = MagicMock()
         _add_connection('key1', ws)
         self.assertIn('key1', CONNECTIONS)
-        self.assertEqual(CONNECTIONS['key1'], ws)
+        self.assertEqual(CONNECTIONS['key1'], {ws})
         self.assertIn(id(ws), WS_TO_KEY)
-        self.assertEqual(WS_TO_KEY[id(ws)], 'key1')
+        self.assertEqual(WS_TO_KEY[id(ws)], {'key1'})
 
     def test_remove_connection_by_key(self):
         ws = MagicMock()
@@ -119,14 +148,32 @@ class TestConnectionManagement(unittest.TestCase):
         ws = MagicMock()
         _remove_connection_by_ws(ws)
 
-    def test_add_replaces_existing_key(self):
-        """Adding a new websocket for the same key replaces the old one."""
+    def test_add_keeps_existing_connections_of_key(self):
+        """A second websocket for the same key (another tab) is added next to the first one."""
         ws1 = MagicMock()
         ws2 = MagicMock()
         _add_connection('key1', ws1)
         _add_connection('key1', ws2)
-        self.assertEqual(CONNECTIONS['key1'], ws2)
-        self.assertEqual(WS_TO_KEY[id(ws2)], 'key1')
+        self.assertEqual(CONNECTIONS['key1'], {ws1, ws2})
+        self.assertEqual(WS_TO_KEY[id(ws2)], {'key1'})
+
+        _remove_connection_by_ws(ws1)
+        self.assertEqual(CONNECTIONS['key1'], {ws2})
+
+    def test_one_websocket_many_keys(self):
+        """A single websocket can subscribe to many keys and is removed from all of them."""
+        ws = MagicMock()
+        _add_connection('key1', ws)
+        _add_connection('key2', ws)
+        self.assertEqual(WS_TO_KEY[id(ws)], {'key1', 'key2'})
+
+        _remove_connection('key1', ws)
+        self.assertNotIn('key1', CONNECTIONS)
+        self.assertEqual(WS_TO_KEY[id(ws)], {'key2'})
+
+        _remove_connection_by_ws(ws)
+        self.assertEqual(len(CONNECTIONS), 0)
+        self.assertEqual(len(WS_TO_KEY), 0)
 
     def test_uuid_reassignment(self):
         """Simulate the flow: tmp connection -> UUID assignment."""
@@ -144,7 +191,7 @@ class TestConnectionManagement(unittest.TestCase):
 
         self.assertNotIn(tmp_key, CONNECTIONS)
         self.assertIn(real_key, CONNECTIONS)
-        self.assertEqual(WS_TO_KEY[id(ws)], real_key)
+        self.assertEqual(WS_TO_KEY[id(ws)], {real_key})
 
     def test_multiple_connections(self):
         """Multiple connections should be tracked independently."""
@@ -171,8 +218,8 @@ class TestConnectionManagement(unittest.TestCase):
         _add_connection('user-uuid', ws)
 
         # The reverse lookup should find the key directly
-        key = WS_TO_KEY.get(id(ws))
-        self.assertEqual(key, 'user-uuid')
+        keys = WS_TO_KEY.get(id(ws))
+        self.assertEqual(keys, {'user-uuid'})
 
         # Cleanup should work via _remove_connection_by_ws
         _remove_connection_by_ws(ws)
@@ -249,6 +296,91 @@ class TestRegisterHandler(unittest.TestCase):
         # Recipient should have received the forwarded message
         recipient_ws.send.assert_called_once_with('hello target')
 
+    def test_register_forwards_batch_messages(self):
+        """A failing recipient does not stop the rest of a batch."""
+        from web.server import register
+
+        broken_ws = AsyncMock()
+        broken_ws.send = AsyncMock(side_effect=RuntimeError('closed'))
+        recipient_ws = AsyncMock()
+        recipient_ws.send = AsyncMock()
+        _add_connection('broken-uuid', broken_ws)
+        _add_connection('target-uuid', recipient_ws)
+
+        batch_msg = json.dumps([
+            {'recipient_uuid': 'broken-uuid', 'message': 'lost'},
+            {'recipient_uuid': 'target-uuid', 'message': 'one'},
+            {'recipient_uuid': 'target-uuid', 'message': 'two'},
+        ])
+        sender_ws = _make_ws_mock([batch_msg])
+
+        asyncio.run(register(sender_ws))
+
+        self.assertEqual([c.args[0] for c in recipient_ws.send.call_args_list], ['one', 'two'])
+
+    def test_register_fans_out_to_all_connections_of_key(self):
+        """Every tab subscribed to the UUID receives the message."""
+        from web.server import register
+
+        tab1 = AsyncMock()
+        tab2 = AsyncMock()
+        _add_connection('target-uuid', tab1)
+        _add_connection('target-uuid', tab2)
+
+        forward_msg = json.dumps({'recipient_uuid': 'target-uuid', 'message': 'hello'})
+        asyncio.run(register(_make_ws_mock([forward_msg])))
+
+        tab1.send.assert_called_once_with('hello')
+        tab2.send.assert_called_once_with('hello')
+
+    def test_register_subscribes_to_many_uuids(self):
+        """A batch of 'connected' messages subscribes one socket to several UUIDs."""
+        from web.server import register
+
+        batch_msg = json.dumps([
+            {'recipient_uuid': 'uuid-1', 'message': 'connected'},
+            {'recipient_uuid': 'uuid-2', 'message': 'connected'},
+            {'recipient_uuid': 'uuid-1', 'message': 'disconnected'},
+        ])
+        ws = _make_ws_mock([batch_msg])
+
+        # Keep the subscriptions after the mocked socket disconnects
+        with patch('web.server._remove_connection_by_ws') as remove_mock:
+            asyncio.run(register(ws))
+            self.assertEqual(set(CONNECTIONS), {'uuid-2'})
+            self.assertEqual(WS_TO_KEY[id(ws)], {'uuid-2'})
+            remove_mock.assert_called_once_with(ws)
+
+    def test_register_limits_subscriptions(self):
+        from web.server import register
+
+        batch_msg = json.dumps([{'recipient_uuid': f'uuid-{i}', 'message': 'connected'} for i in range(3)])
+        ws = _make_ws_mock([batch_msg])
+
+        with patch('web.server.settings') as settings_mock, patch('web.server._remove_connection_by_ws'):
+            settings_mock.ws_max_subscriptions = 2
+            asyncio.run(register(ws))
+            self.assertEqual(WS_TO_KEY[id(ws)], {'uuid-0', 'uuid-1'})
+
+    def test_register_does_not_wait_for_slow_recipient(self):
+        """Forwarding to a recipient that stopped reading goes through its outbox and does not block."""
+        from web.server import register, _open_outbox, _close_outbox
+
+        async def run():
+            async def blocked_send(message):
+                await asyncio.sleep(3600)
+
+            recipient_ws = MagicMock()
+            recipient_ws.send = blocked_send
+            _add_connection('slow-uuid', recipient_ws)
+            _open_outbox(recipient_ws)
+
+            messages = [json.dumps({'recipient_uuid': 'slow-uuid', 'message': f'm{i}'}) for i in range(500)]
+            await asyncio.wait_for(register(_make_ws_mock(messages)), 1)
+            await _close_outbox(recipient_ws)
+
+        asyncio.run(run())
+
     def test_register_handles_json_decode_error(self):
         """Test that invalid JSON is handled gracefully."""
         from web.server import register
@@ -272,6 +404,125 @@ class TestRegisterHandler(unittest.TestCase):
             mock_logger.warning.assert_called()
 
 
+class TestReplay(unittest.TestCase):
+    """Test replaying buffered messages to clients that subscribe late or reconnect."""
+
+    def setUp(self):
+        CONNECTIONS.clear()
+        WS_TO_KEY.clear()
+        REPLAY.entries.clear()
+
+    def tearDown(self):
+        CONNECTIONS.clear()
+        WS_TO_KEY.clear()
+        SEQ_SOCKETS.clear()
+
+    def test_undelivered_message_is_sent_on_connect(self):
+        from web.server import send_to_recipient, _replay
+
+        ws = AsyncMock()
+
+        async def run():
+            self.assertFalse(await send_to_recipient('late-uuid', 'result'))
+            _add_connection('late-uuid', ws)
+            self.assertEqual(await _replay('late-uuid', ws), 1)
+            # Neither replayed messages nor messages delivered live are replayed again to clients without last_seq
+            await send_to_recipient('late-uuid', 'second')
+            self.assertEqual(await _replay('late-uuid', AsyncMock()), 0)
+
+        asyncio.run(run())
+
+        self.assertEqual([c.args[0] for c in ws.send.call_args_list], ['result', 'second'])
+
+    def test_forwarded_undelivered_message_reaches_new_local_subscriber(self):
+        from web.server import _deliver_forwarded, _replay
+
+        ws = AsyncMock()
+        # Subscribed here while our announcement was still on its way to the sending worker
+        _add_connection('queue-uuid', ws)
+
+        async def run():
+            await _deliver_forwarded('queue-uuid', 'result', 5, False)
+            return await _replay('queue-uuid', AsyncMock())
+
+        self.assertEqual(asyncio.run(run()), 0)
+        ws.send.assert_called_once_with('result')
+
+    def test_reconnect_with_last_seq_gets_only_missed_messages(self):
+        from web.server import send_to_recipient, _replay
+
+        ws = AsyncMock()
+        SEQ_SOCKETS.add(id(ws))
+        _add_connection('queue-uuid', ws)
+
+        async def run():
+            await send_to_recipient('queue-uuid', 'one')
+            _remove_connection('queue-uuid', ws)
+            await send_to_recipient('queue-uuid', 'two')
+            await send_to_recipient('queue-uuid', 'three')
+
+            last_seq = json.loads(ws.send.call_args.args[0])['seq']
+            reconnected_ws = AsyncMock()
+            await _replay('queue-uuid', reconnected_ws, last_seq)
+            return reconnected_ws
+
+        reconnected_ws = asyncio.run(run())
+
+        received = [json.loads(c.args[0]) for c in reconnected_ws.send.call_args_list]
+        self.assertEqual([item['message'] for item in received], ['two', 'three'])
+        self.assertEqual({item['uuid'] for item in received}, {'queue-uuid'})
+        self.assertLess(received[0]['seq'], received[1]['seq'])
+
+    def test_register_replays_after_connected(self):
+        from web.server import register, send_to_recipient
+
+        asyncio.run(send_to_recipient('queue-uuid', 'result'))
+
+        ws = AsyncMock()
+
+        async def messages():
+            yield json.dumps({'recipient_uuid': 'queue-uuid', 'message': 'connected', 'last_seq': 0})
+            # Let the outbox writer send the replayed message before the socket closes
+            await asyncio.sleep(0.05)
+
+        ws.__aiter__ = lambda self: messages()
+        asyncio.run(register(ws))
+
+        replayed = json.loads(ws.send.call_args_list[1].args[0])
+        self.assertEqual((replayed['uuid'], replayed['message']), ('queue-uuid', 'result'))
+        self.assertNotIn(id(ws), SEQ_SOCKETS)
+
+
+class TestWebSocketEndpoint(unittest.TestCase):
+    """Test the endpoint mounted as /ws in the FastAPI app."""
+
+    def setUp(self):
+        CONNECTIONS.clear()
+        WS_TO_KEY.clear()
+
+    def tearDown(self):
+        CONNECTIONS.clear()
+        WS_TO_KEY.clear()
+
+    def test_mounted_endpoint_shares_registry(self):
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from web.server import websocket_endpoint
+
+        app = FastAPI()
+        app.add_api_websocket_route('/ws', websocket_endpoint)
+
+        with TestClient(app) as client:
+            with client.websocket_connect('/ws') as websocket:
+                self.assertEqual(websocket.receive_text(), '..:: Hello from the Notification Center ::..')
+                websocket.send_text(json.dumps({'recipient_uuid': 'queue-uuid', 'message': 'connected'}))
+                websocket.send_text(json.dumps({'recipient_uuid': 'queue-uuid', 'message': 'result'}))
+                self.assertEqual(websocket.receive_text(), 'result')
+                self.assertIn('queue-uuid', CONNECTIONS)
+
+        self.assertEqual(len(CONNECTIONS), 0)
+
+
 class TestPingTimeout(unittest.TestCase):
     """Test that ping_timeout is correctly configured."""
 
@@ -0,0 +1,250 @@
+"""
+Tests for web/server_redis.py
+Testing the per-node presence registry and routing against an in-memory stand-in for Redis.
+"""
+
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+import asyncio
+import json
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from web.server_redis import RedisConnectionManager, PRESENCE_TTL
+from web.redis_routing import presence_key, replay_key, route_key, node_channel
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        return [getattr(self.redis, '_' + name)(*args) for name, args in self.commands]
+
+
+class FakeRedis:
+    """Set commands of redis.asyncio.Redis, counting round trips."""
+
+    def __init__(self):
+        self.sets = {}
+        self.ttl = {}
+        self.published = []
+        self.streams = {}
+        self.values = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def _sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+
+    def _srem(self, key, *members):
+        self.sets.get(key, set()).difference_update(members)
+
+    def _expire(self, key, seconds):
+        if key not in self.sets:
+            return False
+        self.ttl[key] = seconds
+        return True
+
+    async def sadd(self, key, *members):
+        self.round_trips += 1
+        return self._sadd(key, *members)
+
+    async def srem(self, key, *members):
+        self.round_trips += 1
+        return self._srem(key, *members)
+
+    async def expire(self, key, seconds):
+        self.round_trips += 1
+        return self._expire(key, seconds)
+
+    async def sismember(self, key, member):
+        self.round_trips += 1
+        return member in self.sets.get(key, set())
+
+    async def eval(self, script, numkeys, key, stream_key, message, exclude_node, prefix,
+                   replay_size, replay_ttl, recipient_key, presence_prefix):
+        """Same effect as the routing script of web/redis_routing.py."""
+        self.round_trips += 1
+        nodes = {node for node in self.sets.get(key, set())
+                 if recipient_key in self.sets.get(presence_prefix + node, set())}
+        self._srem(key, *(self.sets.get(key, set()) - nodes))
+        data = {'recipient_key': recipient_key, 'message': message}
+        if replay_size > 0:
+            stream = self.streams.setdefault(stream_key, [])
+            data['seq'] = f'{int(time.time() * 1000)}-{len(stream)}'
+            stream.append((data['seq'], {'m': message, 'd': '1' if nodes else '0'}))
+            del stream[:-replay_size]
+        for node in nodes:
+            if node != exclude_node:
+                self.published.append((prefix + node, json.dumps(data)))
+        return data.get('seq')
+
+    async def get(self, key):
+        self.round_trips += 1
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.round_trips += 1
+        self.values[key] = value
+        self.ttl[key] = ex
+
+    async def xread(self, streams, count=None):
+        self.round_trips += 1
+        result = []
+        for key, last_id in streams.items():
+            entries = [(seq, fields) for seq, fields in self.streams.get(key, [])
+                       if tuple(map(int, seq.split('-'))) > tuple(map(int, last_id.split('-')))]
+            if entries:
+                result.append((key, entries[:count]))
+        return result
+
+
+class TestPresence(unittest.TestCase):
+    """Test that registry changes cost at most one Redis round trip."""
+
+    def setUp(self):
+        self.manager = RedisConnectionManager()
+        self.manager.redis = FakeRedis()
+        self.presence_key = self.manager._get_presence_key()
+
+    def test_tmp_keys_stay_local(self):
+        ws = MagicMock()
+        asyncio.run(self.manager.add_connection('tmp_abc', ws))
+
+        self.assertIn('tmp_abc', self.manager.local_connections)
+        self.assertEqual(self.manager.redis.round_trips, 0)
+
+    def test_first_subscriber_adds_presence_in_one_round_trip(self):
+        tab1, tab2 = MagicMock(), MagicMock()
+
+        asyncio.run(self.manager.add_connection('queue-uuid', tab1))
+        self.assertEqual(self.manager.redis.sets[self.presence_key], {'queue-uuid'})
+        self.assertEqual(self.manager.redis.ttl[self.presence_key], PRESENCE_TTL)
+        self.assertEqual(self.manager.redis.sets[route_key('queue-uuid')], {self.manager.node_id})
+        self.assertEqual(self.manager.redis.ttl[route_key('queue-uuid')], PRESENCE_TTL)
+        self.assertEqual(self.manager.redis.round_trips, 1)
+
+        # A second tab on the same node does not touch Redis
+        asyncio.run(self.manager.add_connection('queue-uuid', tab2))
+        self.assertEqual(self.manager.redis.round_trips, 1)
+
+    def test_disconnect_removes_only_keys_without_local_subscribers(self):
+        tab1, tab2 = MagicMock(), MagicMock()
+
+        async def run():
+            await self.manager.add_connection('shared', tab1)
+            await self.manager.add_connection('shared', tab2)
+            await self.manager.add_connection('own-1', tab1)
+            await self.manager.add_connection('own-2', tab1)
+            self.manager.redis.round_trips = 0
+            await self.manager.remove_connection_by_websocket(tab1)
+
+        asyncio.run(run())
+
+        self.assertEqual(self.manager.redis.sets[self.presence_key], {'shared'})
+        self.assertEqual(self.manager.redis.sets[route_key('own-1')], set())
+        self.assertEqual(self.manager.redis.sets[route_key('shared')], {self.manager.node_id})
+        self.assertEqual(self.manager.redis.round_trips, 1)
+        self.assertEqual(self.manager.local_connections, {'shared': {tab2}})
+        self.assertNotIn(id(tab1), self.manager.local_ws_to_key)
+
+class TestRouting(unittest.TestCase):
+    """Test that messages are published only to the nodes holding the recipient."""
+
+    def test_publishes_to_other_nodes_of_recipient(self):
+        redis = FakeRedis()
+        node_a, node_b, node_c = RedisConnectionManager(), RedisConnectionManager(), RedisConnectionManager()
+        for manager in (node_a, node_b, node_c):
+            manager.redis = redis
+
+        async def run():
+            await node_a.add_connection('queue-uuid', MagicMock())
+            await node_b.add_connection('queue-uuid', MagicMock())
+            await node_c.add_connection('other-uuid', MagicMock())
+            redis.round_trips = 0
+            await node_a.publish_message('queue-uuid', 'hello')
+
+        asyncio.run(run())
+
+        self.assertEqual(redis.round_trips, 1)
+        self.assertEqual(len(redis.published), 1)
+        channel, payload = redis.published[0]
+        self.assertEqual(channel, node_channel(node_b.node_id))
+        self.assertEqual(json.loads(payload)['message'], 'hello')
+
+    def test_nothing_published_without_remote_subscribers(self):
+        manager = RedisConnectionManager()
+        manager.redis = FakeRedis()
+
+        asyncio.run(manager.add_connection('queue-uuid', MagicMock()))
+        asyncio.run(manager.publish_message('queue-uuid', 'hello'))
+        asyncio.run(manager.publish_message('unknown-uuid', 'hello'))
+
+        self.assertEqual(manager.redis.published, [])
+
+    def test_stopped_node_is_removed_from_route(self):
+        redis = FakeRedis()
+        sender, receiver = RedisConnectionManager(), RedisConnectionManager()
+        sender.redis = receiver.redis = redis
+
+        async def run():
+            await receiver.add_connection('queue-uuid', MagicMock())
+            # The node stopped without cleanup and its presence set expired, another node keeps the route alive
+            del redis.sets[presence_key(receiver.node_id)]
+            await sender.add_connection('other-uuid', MagicMock())
+            return await sender.publish_message('queue-uuid', 'result')
+
+        seq = asyncio.run(run())
+
+        self.assertEqual(redis.published, [])
+        self.assertEqual(redis.sets[route_key('queue-uuid')], set())
+        # Not delivered: replayed when the client reconnects to another node
+        self.assertEqual(redis.streams[replay_key('queue-uuid')], [(seq, {'m': 'result', 'd': '0'})])
+
+
+class TestReplay(unittest.TestCase):
+    """Test replaying the Redis stream of a UUID to a client that (re)connects on another node."""
+
+    def test_replays_undelivered_or_missed_messages(self):
+        redis = FakeRedis()
+        sender, receiver = RedisConnectionManager(), RedisConnectionManager()
+        sender.redis = receiver.redis = redis
+
+        async def run():
+            missed = await sender.publish_message('queue-uuid', 'result')
+            legacy_ws, seq_ws = AsyncMock(), AsyncMock()
+            await receiver.add_connection('queue-uuid', legacy_ws)
+            self.assertEqual(await receiver.replay('queue-uuid', legacy_ws), 1)
+            delivered = await sender.publish_message('queue-uuid', 'second')
+            # Only undelivered (and not yet replayed) messages without last_seq, everything newer with it
+            self.assertEqual(await receiver.replay('queue-uuid', AsyncMock()), 0)
+            await receiver.replay('queue-uuid', seq_ws, missed)
+            return legacy_ws, seq_ws, delivered
+
+        legacy_ws, seq_ws, delivered = asyncio.run(run())
+
+        legacy_ws.send.assert_called_once_with('result')
+        self.assertEqual(json.loads(seq_ws.send.call_args.args[0]),
+                         {'seq': delivered, 'uuid': 'queue-uuid', 'message': 'second'})
+        self.assertEqual(json.loads(redis.published[0][1])['seq'], delivered)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Tests for web/workers.py
+Testing message routing between worker processes, with two links in one event loop.
+"""
+
+import unittest
+import asyncio
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from web.workers import WorkerLink
+
+
+class TestWorkerLink(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.ipc_dir = tempfile.mkdtemp()
+        self.keys = {0: set(), 1: set()}
+        self.delivered = {0: [], 1: []}
+        self.links = [self.make_link(worker_id) for worker_id in (0, 1)]
+        for link in self.links:
+            await link.start()
+        await self.wait_for(lambda: all(link.peers for link in self.links))
+
+    async def asyncTearDown(self):
+        for link in self.links:
+            await link.close()
+        shutil.rmtree(self.ipc_dir, ignore_errors=True)
+
+    def make_link(self, worker_id):
+        async def deliver(key, message, seq, delivered):
+            self.delivered[worker_id].append((key, message, seq, delivered))
+
+        return WorkerLink(worker_id, 2, self.ipc_dir, deliver=deliver, local_keys=lambda: self.keys[worker_id])
+
+    async def wait_for(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail('Condition not reached')
+
+    async def test_forwards_only_to_workers_holding_the_key(self):
+        self.links[1].subscribed('queue-uuid')
+        await self.wait_for(lambda: self.links[0].has_remote('queue-uuid'))
+
+        self.assertTrue(self.links[0].forward('queue-uuid', 'hello', 7))
+        self.assertFalse(self.links[0].forward('other-uuid', 'lost'))
+        await self.wait_for(lambda: self.delivered[1])
+
+        self.assertEqual(self.delivered[1], [('queue-uuid', 'hello', 7, True)])
+
+        self.links[1].unsubscribed('queue-uuid')
+        await self.wait_for(lambda: not self.links[0].has_remote('queue-uuid'))
+
+    async def test_undelivered_message_goes_to_every_worker(self):
+        self.assertFalse(self.links[0].forward('queue-uuid', 'missed', 3, delivered=False))
+        await self.wait_for(lambda: self.delivered[1])
+
+        self.assertEqual(self.delivered[1], [('queue-uuid', 'missed', 3, False)])
+
+    async def test_restarted_worker_announces_its_keys_again(self):
+        self.links[1].subscribed('queue-uuid')
+        await self.wait_for(lambda: self.links[0].has_remote('queue-uuid'))
+
+        await self.links[1].close()
+        await self.wait_for(lambda: not self.links[0].has_remote('queue-uuid'))
+
+        self.keys[1].add('queue-uuid')
+        self.links[1] = self.make_link(1)
+        await self.links[1].start()
+        await self.wait_for(lambda: self.links[0].has_remote('queue-uuid'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import sys
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+sys.path.append(os.path.abspath('.'))
+from config import settings
+
+io_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Threads for the blocking file I/O and downloads of request handlers (IO_THREADS).
+    Separate from the default pool of anyio, so slow uploads don't take the threads of sync endpoints."""
+    global io_executor
+    if io_executor is None:
+        io_executor = ThreadPoolExecutor(max_workers=max(1, settings.io_threads), thread_name_prefix='io')
+    return io_executor
+
+
+async def run_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking function in the I/O executor without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_io_executor() -> None:
+    global io_executor
+    if io_executor is not None:
+        io_executor.shutdown(wait=True)
+        io_executor = None
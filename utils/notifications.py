@@ -0,0 +1,87 @@
+import logging
+from typing import Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationBackend:
+    """Delivers queue item notifications to WebSocket subscribers.
+
+    Selected with the NOTIFICATION_BACKEND setting:
+    websocket - send through the WebSocket server over a persistent client connection (web/client.py);
+    redis - publish to the web/server_redis.py nodes that have subscribers for the recipient;
+    inprocess - send directly to the connections of web/server.py served by this process
+    (used instead of websocket when WS_MOUNT serves the endpoint from the API app).
+    """
+
+    async def send(self, recipient_uuid: str, message: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class WebSocketNotificationBackend(NotificationBackend):
+
+    async def send(self, recipient_uuid: str, message: str) -> None:
+        from web.client import get_ws_publisher
+        get_ws_publisher().publish(recipient_uuid, message)
+
+    async def close(self) -> None:
+        from web.client import get_ws_publisher
+        await get_ws_publisher().close()
+
+
+class RedisNotificationBackend(NotificationBackend):
+
+    def __init__(self, host: str = settings.redis_host, port: int = settings.redis_port, db: int = settings.redis_db):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.redis = None
+
+    def _get_redis(self):
+        if self.redis is None:
+            import redis.asyncio as redis
+            self.redis = redis.Redis(host=self.host, port=self.port, db=self.db, decode_responses=True)
+        return self.redis
+
+    async def send(self, recipient_uuid: str, message: str) -> None:
+        from web.redis_routing import publish_routed
+        try:
+            await publish_routed(self._get_redis(), recipient_uuid, message,
+                                 replay_size=settings.ws_replay_size, replay_ttl=settings.ws_replay_ttl)
+        except Exception as e:
+            logger.error(f'Notification Redis error: {e}')
+
+    async def close(self) -> None:
+        if self.redis is not None:
+            await self.redis.close()
+
+
+class InProcessNotificationBackend(NotificationBackend):
+
+    async def send(self, recipient_uuid: str, message: str) -> None:
+        from web.server import send_to_recipient
+        try:
+            if not await send_to_recipient(recipient_uuid, message):
+                logger.info(f'Connection not found for UUID: {recipient_uuid}')
+        except Exception as e:
+            logger.error(f'Error sending notification to {recipient_uuid}: {e}')
+
+
+notification_backend: Optional[NotificationBackend] = None
+
+
+def get_notification_backend() -> NotificationBackend:
+    global notification_backend
+    if notification_backend is None:
+        if settings.notification_backend == 'redis':
+            notification_backend = RedisNotificationBackend()
+        elif settings.notification_backend == 'inprocess' or settings.ws_mount:
+            notification_backend = InProcessNotificationBackend()
+        else:
+            notification_backend = WebSocketNotificationBackend()
+    return notification_backend
@@ -0,0 +1,31 @@
+import base64
+import json
+
+
+def encode_cursor(item_id: int) -> str:
+    """Build an opaque cursor pointing after the item with *item_id*."""
+    return base64.urlsafe_b64encode(json.dumps({'id': item_id}).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    """Return the item id stored in the cursor. Raises ValueError for malformed cursors."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return int(data['id'])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+
+def cursor_bounds(cursor: str | None, sort_dir: str) -> dict:
+    """Translate a cursor to the ``after_id`` / ``before_id`` arguments of ``find_all``."""
+    if not cursor:
+        return {}
+    item_id = decode_cursor(cursor)
+    return {'before_id': item_id} if sort_dir == 'desc' else {'after_id': item_id}
+
+
+def next_cursor(items: list, limit: int) -> str | None:
+    """Cursor of the page following *items*, or None when this is the last page."""
+    if not items or len(items) < limit:
+        return None
+    return encode_cursor(items[-1].id)
@@ -4,6 +4,8 @@ import uuid as uuid_module
 
 import requests
 
+from utils.upload_storage import make_upload_dir
+
 MEDIA_EXTENSIONS = frozenset({
     'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp',
     'mp4', 'mov', 'avi', 'webm',
@@ -42,17 +44,15 @@ def _is_media_url(value: str) -> bool:
 
 def _download_url(url: str, upload_dir: str) -> str | None:
     """
-    Download *url* into *upload_dir*.
+    Download *url* into the current bucket and shard of *upload_dir*.
 
-    Returns the generated filename on success, or None if the download fails.
+    Returns the generated file path relative to *upload_dir* on success, or None if the download fails.
     The extension is inferred from (in order of priority):
       1. Content-Type response header
       2. Content-Disposition response header
       3. The URL path itself
     """
     try:
-        os.makedirs(upload_dir, exist_ok=True)
-
         path = url.split('?')[0].split('#')[0]
         ext = path.rsplit('.', 1)[-1].lower() if '.' in path else 'bin'
 
@@ -72,11 +72,12 @@ def _download_url(url: str, upload_dir: str) -> str | None:
             ext = _CONTENT_TYPE_TO_EXT[ct]
 
         file_name = f'{uuid_module.uuid4()}.{ext}'
-        file_path = os.path.join(upload_dir, file_name)
+        rel_dir, dir_path = make_upload_dir(upload_dir, file_name)
+        file_path = os.path.join(dir_path, file_name)
         with open(file_path, 'wb') as f:
             f.write(resp.content)
 
-        return file_name
+        return f'{rel_dir}/{file_name}'
     except Exception as e:
         print(f'[proxy_media] Failed to download {url}: {e}')
         return None
@@ -123,7 +124,7 @@ def proxy_media_in_result(result_data: dict, upload_dir: str, base_url: str) ->
     """
     Scan *result_data* recursively for media URLs, download each one into
     *upload_dir*, and return a copy of the data with every URL replaced by a
-    local proxied URL of the form ``{base_url}/uploads/<filename>``.
+    local proxied URL of the form ``{base_url}/uploads/<bucket>/<shard>/<filename>``.
 
     JSON-encoded string values (e.g. ``resultJson``, ``param``) are parsed,
     processed in-place, and re-serialised so that nested URLs are also proxied.
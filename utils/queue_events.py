@@ -0,0 +1,61 @@
+import json
+import asyncio
+import logging
+from typing import List, Set, Tuple
+
+from config import settings
+from models.queue import QueueStatus
+from utils.notifications import get_notification_backend
+
+logger = logging.getLogger(__name__)
+
+# Event sends running in the background, referenced until they are done
+background_sends: Set[asyncio.Task] = set()
+
+
+def status_events_enabled() -> bool:
+    return settings.ws_enabled == 'true' and settings.ws_status_events
+
+
+def status_event(queue_uuid: str, status: str, position: int | None = None) -> str:
+    """WebSocket message announcing a status transition (and the position of a pending item)."""
+    event = {'event': 'status', 'uuid': queue_uuid, 'status': status}
+    if position is not None:
+        event['position'] = position
+    return json.dumps(event)
+
+
+async def publish_status(queue_uuid: str, status: str, position: int | None = None) -> None:
+    if not status_events_enabled():
+        return
+    await get_notification_backend().send(queue_uuid, status_event(queue_uuid, status, position))
+
+
+async def find_position_uuids(queue_repository, task_id: int) -> List[str]:
+    """UUIDs of the first WS_POSITION_UPDATES pending items of the task, in queue order (empty when disabled).
+    Read inside the session of a claim, which moves everyone behind the claimed items forward."""
+    if not status_events_enabled() or settings.ws_position_updates <= 0:
+        return []
+    return await queue_repository.find_pending_uuids(task_id, limit=settings.ws_position_updates)
+
+
+def publish_claimed(claimed: List[Tuple[str, str]], pending_uuids: List[str]) -> None:
+    """Send the status of the claimed items (uuid, status) and the new positions of the pending ones.
+    Runs in the background, after the database session is closed: a slow backend doesn't delay claims."""
+    if not status_events_enabled() or not (claimed or pending_uuids):
+        return
+    messages = [(queue_uuid, status_event(queue_uuid, status)) for queue_uuid, status in claimed]
+    messages += [(queue_uuid, status_event(queue_uuid, QueueStatus.PENDING.value, position))
+                 for position, queue_uuid in enumerate(pending_uuids, start=1)]
+    task = asyncio.create_task(_send_all(messages))
+    background_sends.add(task)
+    task.add_done_callback(background_sends.discard)
+
+
+async def _send_all(messages: List[Tuple[str, str]]) -> None:
+    backend = get_notification_backend()
+    results = await asyncio.gather(*(backend.send(queue_uuid, message) for queue_uuid, message in messages),
+                                   return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f'Error sending status event: {result}')
@@ -17,14 +17,26 @@ def is_json(json_str: str) -> bool:
         return False
 
 
-def get_queue_next(task_uuid, timeout=30):
+def get_queue_next(task_uuid, timeout=30, count=None, wait=None):
+    """Claim the next queue item of the task.
+    When *count* is given, up to *count* items are claimed at once and a list is returned instead.
+    When *wait* is given, the server holds the request for up to *wait* seconds until an item is enqueued."""
     queue_url = 'https://{}/queue_next/{}'.format(settings.app_server_name, task_uuid)
+    params = {}
+    if count is not None:
+        params['count'] = count
+    if wait:
+        params['wait'] = wait
+        timeout += wait
+    request_kwargs = {'params': params} if params else {}
     try:
-        r = requests.get(url=queue_url, timeout=timeout)
+        r = requests.get(url=queue_url, timeout=timeout, **request_kwargs)
     except Exception as e:
         print(str(e))
         return None
     result = r.json() if r.status_code == 200 else None
+    if count is not None:
+        return result['items'] if result and result.get('items') else None
     return result if result and 'data' in result else None
 
 
@@ -113,10 +125,14 @@ def send_queue_error(queue_uuid, message, timeout=30, retry_delay=20, max_retrie
                 return None
 
 
-def polling_queue(item_uuid, callback_func, interval_sec=10):
+def polling_queue(item_uuid, callback_func, interval_sec=10, wait=0):
+    """Process queue items forever.
+    With *wait* > 0 every empty poll is a long-poll held by the server, so the
+    *interval_sec* pause only applies when the server answered early (e.g. on errors)."""
     show_message = True
     while True:
-        queue_item = get_queue_next(item_uuid)
+        started = time.monotonic()
+        queue_item = get_queue_next(item_uuid, wait=wait) if wait else get_queue_next(item_uuid)
         if queue_item is not None:
             callback_func(queue_item)
             show_message = True
@@ -124,7 +140,8 @@ def polling_queue(item_uuid, callback_func, interval_sec=10):
             if show_message:
                 print('Waiting for a task...')
                 show_message = False
-            time.sleep(interval_sec)
+            if not wait or time.monotonic() - started < wait:
+                time.sleep(interval_sec)
 
 
 def upload_queue_files(queue_item, upload_dir_path):
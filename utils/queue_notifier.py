@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+REDIS_CHANNEL = 'queue:enqueued'
+
+
+class QueueWaiter:
+    """A registration for "new item in task queue" notifications.
+
+    The waiter is registered before the queue is checked, so an item enqueued
+    between the check and the wait is never missed.
+    """
+
+    def __init__(self, notifier: 'QueueNotifier', task_uuid: str):
+        self.notifier = notifier
+        self.task_uuid = task_uuid
+        self.event = asyncio.Event()
+
+    def __enter__(self):
+        self.notifier._add_waiter(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.notifier._remove_waiter(self)
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait until notified or *timeout* seconds elapse. Returns True if notified."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.event.clear()
+        return True
+
+
+class QueueNotifier:
+    """In-process notifier waking long-polling /queue_next requests of the same process."""
+
+    def __init__(self):
+        self.waiters: Dict[str, Set[QueueWaiter]] = {}
+
+    def waiter(self, task_uuid: str) -> QueueWaiter:
+        return QueueWaiter(self, task_uuid)
+
+    def _add_waiter(self, waiter: QueueWaiter) -> None:
+        self.waiters.setdefault(waiter.task_uuid, set()).add(waiter)
+
+    def _remove_waiter(self, waiter: QueueWaiter) -> None:
+        waiters = self.waiters.get(waiter.task_uuid)
+        if waiters is None:
+            return
+        waiters.discard(waiter)
+        if not waiters:
+            del self.waiters[waiter.task_uuid]
+
+    def _wake(self, task_uuid: Optional[str] = None) -> None:
+        """Wake waiters of the task, or all waiters when *task_uuid* is None."""
+        if task_uuid is None:
+            waiters = [waiter for task_waiters in self.waiters.values() for waiter in task_waiters]
+        else:
+            waiters = self.waiters.get(task_uuid, ())
+        for waiter in waiters:
+            waiter.event.set()
+
+    async def notify(self, task_uuid: Optional[str] = None) -> None:
+        self._wake(task_uuid)
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisQueueNotifier(QueueNotifier):
+    """Notifier shared by several worker processes through Redis pub/sub.
+
+    Every process publishes to one channel and wakes its own waiters from a
+    single listener task, so an item created by one gunicorn worker wakes the
+    long-polling requests held by all of them.
+    """
+
+    def __init__(self, host: str = settings.redis_host, port: int = settings.redis_port, db: int = settings.redis_db):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.db = db
+        self.redis = None
+        self.listener_task: Optional[asyncio.Task] = None
+
+    def _get_redis(self):
+        if self.redis is None:
+            import redis.asyncio as redis
+            self.redis = redis.Redis(host=self.host, port=self.port, db=self.db, decode_responses=True)
+        return self.redis
+
+    def waiter(self, task_uuid: str) -> QueueWaiter:
+        if self.listener_task is None or self.listener_task.done():
+            self.listener_task = asyncio.create_task(self._listen())
+        return super().waiter(task_uuid)
+
+    async def _listen(self):
+        pubsub = self._get_redis().pubsub()
+        try:
+            await pubsub.subscribe(REDIS_CHANNEL)
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    self._wake(message['data'] or None)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f'Queue notifier Redis error: {e}')
+        finally:
+            await pubsub.close()
+
+    async def notify(self, task_uuid: Optional[str] = None) -> None:
+        try:
+            await self._get_redis().publish(REDIS_CHANNEL, task_uuid or '')
+        except Exception as e:
+            logger.error(f'Queue notifier Redis error: {e}')
+            self._wake(task_uuid)
+
+    async def close(self) -> None:
+        if self.listener_task is not None:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+        if self.redis is not None:
+            await self.redis.close()
+
+
+queue_notifier: Optional[QueueNotifier] = None
+
+
+def get_queue_notifier() -> QueueNotifier:
+    global queue_notifier
+    if queue_notifier is None:
+        queue_notifier = RedisQueueNotifier() if settings.queue_notifier == 'redis' else QueueNotifier()
+    return queue_notifier
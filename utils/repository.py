@@ -1,87 +1,108 @@
 from abc import ABC, abstractmethod
-from sqlalchemy import insert, select, update, delete, func
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, update, delete, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.exc import NoResultFound
 
 
 class AbstractRepository(ABC):
     @abstractmethod
-    def add_one(self, data: dict):
+    async def add_one(self, data: dict):
         raise NotImplementedError
 
     @abstractmethod
-    def find_all(self):
+    async def find_all(self):
         raise NotImplementedError
 
 
 class SQLAlchemyRepository(AbstractRepository):
     model = None
 
-    def __init__(self, session: Session):
+    def __init__(self, session: AsyncSession):
         self.session = session
 
-    def add_one(self, data: dict, item_uuid=None):
+    async def add_one(self, data: dict, item_uuid=None):
         if item_uuid is not None:
             data['uuid'] = item_uuid
-        if not self.session.in_transaction():
-            self.session.begin()
         stmt = insert(self.model).values(**data)
         try:
-            lastrowid = self.session.execute(stmt).lastrowid
+            item_id = (await self.session.execute(stmt)).inserted_primary_key[0]
         except:
-            self.session.rollback()
+            await self.session.rollback()
             raise
         else:
-            self.session.commit()
-        return self.session.query(self.model).filter_by(id=lastrowid).one().to_read_model()
+            await self.session.commit()
+        return (await self.session.execute(select(self.model).filter_by(id=item_id))).scalar_one().to_read_model()
 
-    def update_one(self, data: dict, item_id: int):
-        if not self.session.in_transaction():
-            self.session.begin()
+    async def update_one(self, data: dict, item_id: int):
         stmt = update(self.model).where(self.model.id == item_id).values(**data)
         try:
-            res = self.session.execute(stmt)
+            res = await self.session.execute(stmt)
         except:
-            self.session.rollback()
+            await self.session.rollback()
             raise
         else:
-            self.session.commit()
-        return self.session.query(self.model).filter_by(id=item_id).one().to_read_model()
+            await self.session.commit()
+        stmt = select(self.model).filter_by(id=item_id).execution_options(populate_existing=True)
+        return (await self.session.execute(stmt)).scalar_one().to_read_model()
 
-    def find_one(self, item_id: int):
+    async def find_one(self, item_id: int):
         try:
-            obj = self.session.get_one(self.model, item_id)
+            obj = await self.session.get_one(self.model, item_id)
         except NoResultFound:
             return None
         return obj
 
-    def find_one_by_uuid(self, uuid: str):
+    async def find_one_by_uuid(self, uuid: str):
         try:
-            obj = self.session.query(self.model).filter_by(uuid=uuid).one()
+            obj = (await self.session.execute(select(self.model).filter_by(uuid=uuid))).scalar_one()
         except NoResultFound:
             return None
         return obj
 
-    def count_all(self, filter=None):
+    async def count_all(self, filter=None):
         stmt = select(func.count()).select_from(self.model).filter_by(**filter) if filter \
             else select(func.count()).select_from(self.model)
-        return self.session.execute(stmt).scalar()
+        return (await self.session.execute(stmt)).scalar()
 
-    def find_all(self, filter=None, limit=100, offset=0, sort_dir='desc'):
+    async def estimate_count(self):
+        """Cheap estimate of the number of rows, based on table statistics instead of a full COUNT."""
+        dialect_name = self.session.get_bind().dialect.name
+        if dialect_name in ('mysql', 'mariadb'):
+            stmt = text('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name')
+            estimate = (await self.session.execute(stmt, {'table_name': self.model.__tablename__})).scalar()
+            if estimate is not None:
+                return int(estimate)
+        elif dialect_name == 'sqlite':
+            # Ids are never reused and old rows are deleted first, so the id range is a close upper bound
+            stmt = select(func.min(self.model.id), func.max(self.model.id))
+            min_id, max_id = (await self.session.execute(stmt)).one()
+            return max_id - min_id + 1 if max_id is not None else 0
+        return await self.count_all()
+
+    async def find_all(self, filter=None, limit=100, offset=0, sort_dir='desc', after_id=None, before_id=None):
+        """Return a page of items. Use *after_id* / *before_id* (keyset pagination)
+        instead of *offset* for deep pages."""
         sort_dir_opt = self.model.id.desc() if sort_dir == 'desc' else self.model.id.asc()
-        stmt = select(self.model).filter_by(**filter).order_by(sort_dir_opt).limit(limit).offset(offset) if filter \
-            else select(self.model).order_by(sort_dir_opt).limit(limit).offset(offset)
-        res = self.session.execute(stmt)
+        stmt = select(self.model).filter_by(**filter) if filter else select(self.model)
+        if after_id is not None:
+            stmt = stmt.where(self.model.id > after_id)
+        if before_id is not None:
+            stmt = stmt.where(self.model.id < before_id)
+        stmt = stmt.order_by(sort_dir_opt).limit(limit)
+        if offset:
+            stmt = stmt.offset(offset)
+        res = await self.session.execute(stmt)
         res = [row[0].to_read_model() for row in res.all()]
         return res
 
-    def delete(self, item_id: int) -> int:
+    async def delete(self, item_id: int) -> int:
         stmt = delete(self.model).where(self.model.id == item_id)
         try:
-            res = self.session.execute(stmt)
+            res = await self.session.execute(stmt)
         except:
-            self.session.rollback()
+            await self.session.rollback()
             raise
         else:
-            self.session.commit()
+            await self.session.commit()
         return res.rowcount
@@ -1,50 +1,47 @@
 import sys
 import os
-import datetime
+import asyncio
+import logging
 
 sys.path.append(os.path.abspath('.'))
 from config import settings
-from db.db import session_maker
-from models.queue import QueueStatus
+from db.db import async_session_maker
 from repositories.queue_repository import QueueRepository
+from utils.queue_notifier import get_queue_notifier
 
+logger = logging.getLogger(__name__)
 
-def restore_outdated_queue_items():
-    max_execution_time = settings.max_execution_time
-    now = datetime.datetime.utcnow()
-    restore_ids = []
-    remove_ids = []
 
-    with session_maker() as session:
+async def restore_outdated_queue_items():
+    """Return items stuck in processing to the queue (or mark them as error when too old).
+    Returns the ``(restored, expired)`` row counts."""
+    async with async_session_maker() as session:
         queue_repository = QueueRepository(session)
-        res = queue_repository.find_by_status(QueueStatus.PROCESSING.value)
-        for queue in res:
-            if (now - queue[0].time_updated).total_seconds() > max_execution_time:
-                if (now - queue[0].time_created).total_seconds() > max_execution_time:
-                    remove_ids.append(queue[0].id)
-                else:
-                    restore_ids.append(queue[0].id)
-
-    for item_id in restore_ids:
-        with session_maker() as session:
-            queue_repository = QueueRepository(session)
-            queue_repository.update_one({
-                'status': QueueStatus.PENDING.value,
-                'time_updated': datetime.datetime.utcnow()
-            }, item_id)
-
-    for item_id in remove_ids:
-        with session_maker() as session:
-            queue_repository = QueueRepository(session)
-            queue_repository.update_one({
-                'status': QueueStatus.ERROR.value,
-                'time_updated': datetime.datetime.utcnow()
-            }, item_id)
-            # queue_repository.delete(item_id)
-
-    return restore_ids
+        return await queue_repository.restore_outdated(settings.max_execution_time)
+
+
+async def run_reaper(interval_sec: int = 60):
+    """Periodically restore outdated queue items. Started from the app lifespan."""
+    while True:
+        try:
+            restored, expired = await restore_outdated_queue_items()
+            if restored or expired:
+                logger.info(f'Outdated queue items: restored {restored}, expired {expired}')
+            if restored:
+                # Restored items are pending again, wake the long-polling workers
+                await get_queue_notifier().notify()
+        except Exception as e:
+            logger.error(f'Error restoring outdated queue items: {e}')
+        await asyncio.sleep(interval_sec)
 
 
 if __name__ == '__main__':
-    result = restore_outdated_queue_items()
-    print(result)
+    # Usage: restore_outdated_queue_items.py [--loop [interval_sec]]
+    args = sys.argv[1:]
+    if len(args) > 0 and args[0] == '--loop':
+        interval = int(args[1]) if len(args) > 1 else settings.reaper_interval or 60
+        logging.basicConfig(level=logging.INFO)
+        asyncio.run(run_reaper(interval))
+    else:
+        result = asyncio.run(restore_outdated_queue_items())
+        print(result)
@@ -1,64 +1,129 @@
 import os
-from datetime import datetime
+import tempfile
 import uuid
 
 import requests
 from fastapi import HTTPException, status, UploadFile
-from typing import IO
+from typing import IO, Optional
+from urllib.parse import urlparse
 import filetype
 from pydub import AudioSegment
 
+from config import settings
 from utils.video_audio import cut_audio_duration
+# delete_old_files is imported from here by older scripts
+from utils.upload_storage import make_upload_dir, delete_old_files, is_folder_empty  # noqa: F401
+from utils.upload_storage import content_hasher, is_content_name, link_stored_file, store_file
+
+IMAGE_MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
+AUDIO_MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
+VIDEO_MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def upload_file(file: UploadFile, dir_path: str, type='image', chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Store an upload in the current bucket and shard of dir_path, reading it chunk by chunk,
+    so memory use is bounded by chunk_size.
+    The type is sniffed from the first chunk; the size is checked and the content hashed while it is
+    copied to a temporary file, which appears under its final name only when complete. A file that is
+    already stored is hard linked instead and the copy is dropped.
+    Returns the path relative to dir_path. Blocking, call it with run_io from async handlers.
+    """
+    if file.size is not None:
+        validate_file_size(file.size, type=type)
 
-
-def upload_file(file: UploadFile, dir_path: str, type='image'):
-    if not os.path.isdir(dir_path):
-        os.mkdir(dir_path)
-
-    contents = file.file.read()
-
-    item_uuid = str(uuid.uuid1())
-    file_info = validate_file_size_type(file=file, type=type)
-    file_name = f'{item_uuid}.{file_info.extension}'
-
-    file_path = os.path.join(dir_path, file_name)
-
-    open(file_path, 'wb').write(contents)
-
-    return file_name
+    file.file.seek(0)
+    chunk = file.file.read(chunk_size)
+    file_info = validate_file_type(filetype.guess(chunk), type=type)
+
+    # The name is known only at the end, the temporary file is in the bucket, so leftovers expire with it
+    _, bucket_path = make_upload_dir(dir_path, '')
+    fd, tmp_path = tempfile.mkstemp(dir=bucket_path, prefix='.upload-', suffix='.part')
+    try:
+        hasher = content_hasher()
+        file_size = 0
+        with os.fdopen(fd, 'wb') as out_file:
+            while chunk:
+                file_size += len(chunk)
+                validate_file_size(file_size, type=type)
+                hasher.update(chunk)
+                out_file.write(chunk)
+                chunk = file.file.read(chunk_size)
+
+        file_name = f'{hasher.hexdigest()}.{file_info.extension}'
+        rel_dir, upload_path = make_upload_dir(dir_path, file_name)
+        file_path = os.path.join(upload_path, file_name)
+        if link_stored_file(dir_path, file_name, file_path):
+            os.remove(tmp_path)
+        else:
+            store_file(dir_path, file_name, tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return f'{rel_dir}/{file_name}'
+
+
+def server_upload_name(file_url: str) -> Optional[str]:
+    """Content hash name of an upload of this queue server (APP_SERVER_NAME), None for other URLs.
+    Only the server knows the hash key, so names in other URLs may not match their content."""
+    url = urlparse(file_url)
+    if url.scheme != 'https' or url.netloc != settings.app_server_name or not url.path.startswith('/uploads/'):
+        return None
+    file_name = url.path.rsplit('/', 1)[-1]
+    return file_name if is_content_name(file_name) else None
 
 
 def upload_from_url(dir_path: str, file_url: str, type='image'):
+    """
+    Download a file to dir_path. Uploads of this queue server are downloaded once: they are named by
+    their content hash and reused from dir_path. Other files get a new name.
+    """
     if not os.path.isdir(os.path.dirname(dir_path)):
         os.mkdir(os.path.dirname(dir_path))
     if not os.path.isdir(dir_path):
         os.mkdir(dir_path)
 
-    item_uuid = str(uuid.uuid1())
-    file_extension = file_url.split('.')[-1]
-    file_name = f'{item_uuid}.{file_extension}'
-
-    resp = requests.get(file_url)
-    if 'Content-Disposition' in resp.headers:
-        attachment_file_name = resp.headers['Content-Disposition']
-        file_extension = attachment_file_name.split('.')[-1]
+    file_name = server_upload_name(file_url)
+    if file_name is not None:
+        file_path = os.path.join(dir_path, file_name)
+        if os.path.isfile(file_path):
+            validate_file_size_type(file_path=file_path, type=type)
+            return file_path
+        resp = requests.get(file_url)
+    else:
+        item_uuid = str(uuid.uuid1())
+        file_extension = file_url.split('.')[-1]
         file_name = f'{item_uuid}.{file_extension}'
 
+        resp = requests.get(file_url)
+        if 'Content-Disposition' in resp.headers:
+            attachment_file_name = resp.headers['Content-Disposition']
+            file_extension = attachment_file_name.split('.')[-1]
+            file_name = f'{item_uuid}.{file_extension}'
+
     contents = resp.content
     file_path = os.path.join(dir_path, file_name)
 
-    open(file_path, 'wb').write(contents)
-
-    validate_file_size_type(file_path=file_path, type=type)
+    # Workers sharing dir_path may download the same upload at the same time: each one writes its own
+    # temporary file, so a partial file is never taken for a complete one
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix='.download-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out_file:
+            out_file.write(contents)
+        validate_file_size_type(file_path=tmp_path, type=type)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
     return file_path
 
 
 def validate_file_size(real_file_size, type='image'):
-    IMAGE_MAX_FILE_SIZE = 20 * 1024 * 1024  # 10MB
-    AUDIO_MAX_FILE_SIZE = 20 * 1024 * 1024  # 10MB
-    VIDEO_MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
-
     if (
             (type == 'image' and real_file_size > IMAGE_MAX_FILE_SIZE)
             or (type == 'audio' and real_file_size > AUDIO_MAX_FILE_SIZE)
@@ -69,18 +134,12 @@ def validate_file_size(real_file_size, type='image'):
     return True
 
 
-def validate_file_size_type(file: UploadFile = None, file_path=None, type='image'):
+def validate_file_type(file_info, type='image'):
+    """Check the type detected by filetype.guess. Returns file_info."""
     IMAGE_TYPES = ['image/png', 'image/jpeg', 'image/jpg', 'png', 'jpeg', 'jpg']
     VIDEO_TYPES = ['video/mp4', 'video/webm', 'mp4', 'webm']
     AUDIO_TYPES = ['audio/mp3', 'audio/mpeg', 'audio/wav', 'audio/x-wav', 'mp3', 'wav']
 
-    if file is None and file_path is None:
-        raise HTTPException(
-            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-            detail='File not found.',
-        )
-
-    file_info = filetype.guess(file.file) if file is not None else filetype.guess(file_path)
     if file_info is None:
         raise HTTPException(
             status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
@@ -100,6 +159,19 @@ def validate_file_size_type(file: UploadFile = None, file_path=None, type='image
             detail=f'Unsupported {type} file type.',
         )
 
+    return file_info
+
+
+def validate_file_size_type(file: UploadFile = None, file_path=None, type='image'):
+    if file is None and file_path is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail='File not found.',
+        )
+
+    file_info = filetype.guess(file.file) if file is not None else filetype.guess(file_path)
+    validate_file_type(file_info, type=type)
+
     if file is not None:
         validate_file_size(file.size, type=type)
 
@@ -110,31 +182,6 @@ def validate_file_size_type(file: UploadFile = None, file_path=None, type='image
     return file_info
 
 
-def is_folder_empty(folder_path):
-    return len(os.listdir(folder_path)) == 0
-
-
-def delete_old_files(dir_path, max_hours=6):
-    if not os.path.isdir(dir_path):
-        return 0
-    files_list = os.listdir(dir_path)
-    now = datetime.now()
-    deleted = 0
-    for file in files_list:
-        if not os.path.isfile(os.path.join(dir_path, file)):
-            if os.path.isdir(os.path.join(dir_path, file)):
-                deleted += delete_old_files(os.path.join(dir_path, file), max_hours)
-                if is_folder_empty(os.path.join(dir_path, file)):
-                    os.rmdir(os.path.join(dir_path, file))
-            continue
-        mtime = datetime.fromtimestamp(os.stat(os.path.join(dir_path, file)).st_mtime)
-        diff = now - mtime
-        if diff.total_seconds() / 60 / 60 > max_hours:
-            os.remove(os.path.join(dir_path, file))
-            deleted += 1
-    return deleted
-
-
 if __name__ == '__main__':
     out_path = cut_audio_duration('/media/andrew/KINGSTON/work/SadTalker/input_audio/jason_dentist_16000.wav', 20)
     print(out_path)
@@ -0,0 +1,302 @@
+import sys
+import os
+import re
+import shutil
+import time
+import hashlib
+import secrets
+import asyncio
+import logging
+import contextlib
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from starlette.staticfiles import StaticFiles
+
+sys.path.append(os.path.abspath('.'))
+from config import settings
+from utils.io_executor import run_io
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPLOAD_DIR = os.path.join(ROOT_DIR, 'uploads')
+
+# Uploads are stored in one directory per hour of creation (UTC), so expired files are deleted
+# a whole directory at a time, and sharded by the first characters of the name inside it,
+# so no directory gets too many entries: uploads/2024070115/e4/3f/<uuid>.png
+BUCKET_FORMAT = '%Y%m%d%H'
+BUCKET_RE = re.compile(r'^\d{10}$')
+SHARD_RE = re.compile(r'^[0-9a-f]{4}')
+# Content store: one file per distinct content, named by its hash (uploads/cas/ab/cd/<hash>.<ext>).
+# Uploads are hard links to it, so the link count of a stored file is its reference count + 1
+CAS_DIR = 'cas'
+CONTENT_NAME_RE = re.compile(r'^[0-9a-f]{32}\.[0-9a-z]+$')
+# Key of the content hash created on first use when UPLOAD_HASH_KEY is empty (outside of the served uploads)
+HASH_KEY_FILE = os.path.join(ROOT_DIR, '.upload_hash_key')
+# Log the cleanup progress every PROGRESS_EVERY scanned entries
+PROGRESS_EVERY = 10000
+
+# Counters of the cleanup, for the whole process
+STATS: Dict[str, int] = {
+    'scanned': 0,
+    'deleted': 0,
+    'deleted_bytes': 0,
+    'removed_dirs': 0,
+    'removed_buckets': 0,
+    'deduplicated': 0,
+    'collected': 0,
+}
+
+
+def upload_bucket(now: Optional[datetime] = None) -> str:
+    return (now or datetime.utcnow()).strftime(BUCKET_FORMAT)
+
+
+def shard_dir(file_name: str) -> str:
+    """Shard directories of a file name: 'e43f23de-....png' -> 'e4/3f'. Empty for names that are not hex."""
+    name = file_name.lower()
+    if not SHARD_RE.match(name):
+        return ''
+    return f'{name[:2]}/{name[2:4]}'
+
+
+def make_upload_dir(dir_path: str, file_name: str) -> Tuple[str, str]:
+    """Create the directory for a new file in the current bucket.
+    Returns the directory relative to dir_path (the prefix of the URL path) and its path."""
+    rel_dir = f'{upload_bucket()}/{shard_dir(file_name)}'.rstrip('/')
+    path = os.path.join(dir_path, rel_dir)
+    os.makedirs(path, exist_ok=True)
+    return rel_dir, path
+
+
+def sharded_path(path: str) -> str:
+    """Where a file of an older URL is stored now: 'x/<name>' -> 'x/e4/3f/<name>'."""
+    head, name = os.path.split(path)
+    shard = shard_dir(name)
+    return os.path.join(head, shard, name) if shard else path
+
+
+class UploadStaticFiles(StaticFiles):
+    """Serves uploads, also under the URLs given out before the files were sharded."""
+
+    def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is None and sharded_path(path) != path:
+            return super().lookup_path(sharded_path(path))
+        return full_path, stat_result
+
+
+upload_hash_key: Optional[bytes] = None
+
+
+def get_upload_hash_key() -> bytes:
+    """UPLOAD_HASH_KEY, or a random key created once and kept in HASH_KEY_FILE. Never empty."""
+    global upload_hash_key
+    if upload_hash_key is None:
+        if settings.upload_hash_key:
+            upload_hash_key = settings.upload_hash_key.encode()[:64]
+        else:
+            upload_hash_key = _load_hash_key(HASH_KEY_FILE)
+    return upload_hash_key
+
+
+def _load_hash_key(key_path: str) -> bytes:
+    if not os.path.exists(key_path):
+        tmp_path = f'{key_path}.{os.getpid()}'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            # Fails if another worker created it first, then its key is used
+            os.link(tmp_path, key_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(key_path) as f:
+        return f.read().strip().encode()[:64]
+
+
+def content_hasher():
+    """Streaming hash of the content, keyed so the names can't be computed from the content."""
+    return hashlib.blake2b(digest_size=16, key=get_upload_hash_key())
+
+
+def is_content_name(file_name: str) -> bool:
+    return bool(CONTENT_NAME_RE.match(file_name))
+
+
+def stored_file_path(dir_path: str, file_name: str) -> str:
+    return os.path.join(dir_path, CAS_DIR, shard_dir(file_name), file_name)
+
+
+def link_stored_file(dir_path: str, file_name: str, file_path: str) -> bool:
+    """Hard link the stored file with the same content to file_path. Returns False if there is none."""
+    try:
+        os.link(stored_file_path(dir_path, file_name), file_path)
+    except FileExistsError:
+        # The same content was uploaded earlier in this hour
+        pass
+    except OSError:
+        # Not stored (or collected meanwhile), or the file system has no hard links
+        return False
+    STATS['deduplicated'] += 1
+    return True
+
+
+def store_file(dir_path: str, file_name: str, tmp_path: str, file_path: str) -> None:
+    """Move a new complete file to file_path and keep it in the content store for later duplicates."""
+    # Linked to file_path first, so the stored file never has a link count of 1 and can't be collected
+    try:
+        os.link(tmp_path, file_path)
+    except FileExistsError:
+        pass
+    except OSError:
+        os.replace(tmp_path, file_path)
+        return
+    stored_path = stored_file_path(dir_path, file_name)
+    os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+    os.replace(tmp_path, stored_path)
+
+
+def collect_stored_files(cas_path: str) -> int:
+    """Delete the stored files that no upload links to any more (link count 1)."""
+    collected = 0
+    with _scandir(cas_path) as entries:
+        for entry in entries:
+            _count_scanned()
+            if entry.is_dir(follow_symlinks=False):
+                collected += collect_stored_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                try:
+                    if entry.stat(follow_symlinks=False).st_nlink > 1:
+                        continue
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    # Deleted by another cleanup
+                    continue
+                collected += 1
+                STATS['collected'] += 1
+    return collected
+
+
+def is_folder_empty(folder_path):
+    return len(os.listdir(folder_path)) == 0
+
+
+def _scandir(dir_path: str):
+    """os.scandir of a directory that another cleanup (other worker, cron) may have deleted meanwhile."""
+    try:
+        return os.scandir(dir_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return contextlib.nullcontext(())
+
+
+def _delete_if_older(entry: os.DirEntry, max_mtime: float) -> bool:
+    """Delete the file of a scandir entry if it is older than max_mtime. False if it is newer or already deleted."""
+    try:
+        stat_result = entry.stat(follow_symlinks=False)
+        if stat_result.st_mtime >= max_mtime:
+            return False
+        os.remove(entry.path)
+    except FileNotFoundError:
+        return False
+    STATS['deleted'] += 1
+    STATS['deleted_bytes'] += stat_result.st_size
+    return True
+
+
+def _count_scanned() -> None:
+    STATS['scanned'] += 1
+    if STATS['scanned'] % PROGRESS_EVERY == 0:
+        logger.info(f'Uploads cleanup: scanned {STATS["scanned"]}, deleted {STATS["deleted"]} files '
+                    f'({STATS["deleted_bytes"]} bytes), {STATS["removed_buckets"]} buckets')
+
+
+def delete_old_files(dir_path, max_hours=6):
+    """Delete files older than max_hours under dir_path and the directories left empty.
+    Uses the stat data cached by os.scandir, one system call per file at most."""
+    max_mtime = time.time() - max_hours * 60 * 60
+    deleted = 0
+    with _scandir(dir_path) as entries:
+        for entry in entries:
+            _count_scanned()
+            if entry.is_dir(follow_symlinks=False):
+                deleted += delete_old_files(entry.path, max_hours)
+                try:
+                    os.rmdir(entry.path)
+                    STATS['removed_dirs'] += 1
+                except OSError:
+                    # Not empty, or already deleted
+                    pass
+            elif entry.is_file(follow_symlinks=False) and _delete_if_older(entry, max_mtime):
+                deleted += 1
+    return deleted
+
+
+def migrate_flat_uploads(dir_path: str) -> int:
+    """Move the files stored directly in dir_path to their shard directories. Their URLs keep working."""
+    moved = 0
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            shard = shard_dir(entry.name)
+            if not shard or not entry.is_file(follow_symlinks=False):
+                continue
+            os.makedirs(os.path.join(dir_path, shard), exist_ok=True)
+            os.replace(entry.path, os.path.join(dir_path, shard, entry.name))
+            moved += 1
+    return moved
+
+
+def cleanup_uploads(dir_path: str, max_age_sec: int, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """
+    Delete the buckets whose newest possible file is older than max_age_sec, without looking into live buckets.
+    Files outside of buckets (stored before the buckets were introduced) are deleted by their mtime,
+    and the files of the content store when no upload links to them.
+    Returns the number of deleted ``(buckets, files)``.
+    """
+    now = now or datetime.utcnow()
+    max_bucket = upload_bucket(now - timedelta(seconds=max_age_sec) - timedelta(hours=1))
+    max_mtime = time.time() - max_age_sec
+    deleted_buckets = 0
+    deleted_files = 0
+    with _scandir(dir_path) as entries:
+        for entry in entries:
+            _count_scanned()
+            if entry.is_dir(follow_symlinks=False):
+                if BUCKET_RE.match(entry.name):
+                    # Names sort as times; the bucket of hour H holds files created before H + 1h
+                    if entry.name <= max_bucket:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        deleted_buckets += 1
+                        STATS['removed_buckets'] += 1
+                elif entry.name == CAS_DIR:
+                    deleted_files += collect_stored_files(entry.path)
+                else:
+                    deleted_files += delete_old_files(entry.path, max_hours=max_age_sec / 60 / 60)
+            elif entry.is_file(follow_symlinks=False) and _delete_if_older(entry, max_mtime):
+                deleted_files += 1
+    return deleted_buckets, deleted_files
+
+
+async def run_janitor(interval_sec: int = 600, dir_path: str = UPLOAD_DIR):
+    """Periodically delete expired uploads. Started from the app lifespan."""
+    while True:
+        try:
+            buckets, files = await run_io(cleanup_uploads, dir_path, settings.max_store_time)
+            if buckets or files:
+                logger.info(f'Expired uploads deleted: {buckets} buckets, {files} files')
+        except Exception as e:
+            logger.error(f'Error deleting expired uploads: {e}')
+        await asyncio.sleep(interval_sec)
+
+
+if __name__ == '__main__':
+    # Usage: upload_storage.py [migrate]
+    args = sys.argv[1:]
+    if len(args) > 0 and args[0] == 'migrate':
+        print(migrate_flat_uploads(UPLOAD_DIR))
+    else:
+        print(cleanup_uploads(UPLOAD_DIR, settings.max_store_time))
+        print(STATS)
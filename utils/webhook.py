@@ -1,12 +1,16 @@
 import requests
 
 
-def webhook_post_result(webhook_url, queue_uuid, status, result_data):
-    webhook_data = {
+def webhook_payload(queue_uuid, status, result_data):
+    return {
         'uuid': queue_uuid,
         'status': status,
         'result': result_data
     }
+
+
+def webhook_post_result(webhook_url, queue_uuid, status, result_data):
+    webhook_data = webhook_payload(queue_uuid, status, result_data)
     webhook_resp = None
     try:
         r = requests.request('POST', webhook_url, json=webhook_data, allow_redirects=True, timeout=60)
@@ -14,4 +18,3 @@ def webhook_post_result(webhook_url, queue_uuid, status, result_data):
     except Exception as e:
         print(str(e))
     return webhook_resp
-
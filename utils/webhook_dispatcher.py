@@ -0,0 +1,157 @@
+import sys
+import os
+import asyncio
+import datetime
+import logging
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+sys.path.append(os.path.abspath('.'))
+from config import settings
+from db.db import async_session_maker
+from models.webhook import WebhookStatus
+from repositories.webhook_repository import WebhookRepository
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookDispatcher:
+    """Background worker draining the webhook outbox.
+
+    Deliveries are sent with one pooled ``httpx.AsyncClient``, at most *concurrency* at a time
+    and no more often than once per *host_interval* seconds per host. Failed deliveries are
+    retried with exponential backoff until *max_attempts* is reached.
+    """
+
+    def __init__(self,
+                 session_maker=async_session_maker,
+                 concurrency: int = settings.webhook_concurrency,
+                 timeout: float = settings.webhook_timeout,
+                 max_attempts: int = settings.webhook_max_attempts,
+                 retry_base: float = settings.webhook_retry_base,
+                 host_interval: float = settings.webhook_host_interval,
+                 poll_interval: float = settings.webhook_poll_interval,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.session_maker = session_maker
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.host_interval = host_interval
+        self.poll_interval = poll_interval
+        self.transport = transport
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.host_next_time: Dict[str, float] = {}
+        self.host_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+                transport=self.transport
+            )
+        return self.client
+
+    def notify(self) -> None:
+        """Wake the dispatcher right away instead of waiting for the next poll."""
+        self.wakeup.set()
+
+    def backoff(self, attempts: int) -> float:
+        """Delay before the next attempt: retry_base * 2^(attempts - 1), capped at one hour."""
+        return min(self.retry_base * 2 ** max(attempts - 1, 0), 3600)
+
+    async def _wait_for_host(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        async with self.host_lock:
+            now = time.monotonic()
+            start_time = max(now, self.host_next_time.get(host, now))
+            self.host_next_time[host] = start_time + self.host_interval
+        if start_time > now:
+            await asyncio.sleep(start_time - now)
+
+    async def deliver(self, item) -> None:
+        """Send one delivery and record the outcome."""
+        response_code = None
+        error = None
+        async with self.semaphore:
+            await self._wait_for_host(item.url)
+            try:
+                r = await self._get_client().post(item.url, json=item.payload)
+                response_code = r.status_code
+                if r.status_code >= 400:
+                    error = f'HTTP {r.status_code}'
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+
+        now = datetime.datetime.utcnow()
+        data = {
+            'response_code': response_code,
+            'last_error': error,
+            'time_updated': now
+        }
+        if error is None:
+            data['status'] = WebhookStatus.DELIVERED.value
+        elif item.attempts >= self.max_attempts:
+            data['status'] = WebhookStatus.FAILED.value
+            logger.error(f'Webhook {item.id} to {item.url} failed after {item.attempts} attempts: {error}')
+        else:
+            data['next_attempt_at'] = now + datetime.timedelta(seconds=self.backoff(item.attempts))
+
+        async with self.session_maker() as session:
+            await WebhookRepository(session).update_one(data, item.id)
+
+    async def dispatch_due(self) -> int:
+        """Deliver one batch of due webhooks. Returns the number of deliveries attempted."""
+        async with self.session_maker() as session:
+            items = await WebhookRepository(session).claim_due(
+                limit=self.concurrency * 2,
+                lease_sec=int(self.timeout) + 30
+            )
+        results = await asyncio.gather(*(self.deliver(item) for item in items), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f'Webhook dispatcher error: {result}')
+        return len(items)
+
+    async def run(self) -> None:
+        try:
+            while True:
+                try:
+                    if await self.dispatch_due():
+                        continue
+                except Exception as e:
+                    logger.error(f'Webhook dispatcher error: {e}')
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+webhook_dispatcher: Optional[WebhookDispatcher] = None
+
+
+def get_webhook_dispatcher() -> WebhookDispatcher:
+    global webhook_dispatcher
+    if webhook_dispatcher is None:
+        webhook_dispatcher = WebhookDispatcher()
+    return webhook_dispatcher
+
+
+if __name__ == '__main__':
+    # Run the dispatcher as a separate process (set WEBHOOK_POLL_INTERVAL=0 for the app then)
+    asyncio.run(WebhookDispatcher(poll_interval=settings.webhook_poll_interval or 5).run())
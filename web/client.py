@@ -6,6 +6,8 @@ import json
 import asyncio
 import websockets
 import logging
+from collections import deque
+from typing import Deque, List, Optional
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -15,7 +17,115 @@ logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
+class WebSocketPublisher:
+    """Long-lived connection from the API process to the WebSocket server.
+
+    Messages are put into a bounded buffer and sent by a background task over one connection.
+    A burst of messages is sent as a single JSON array frame (up to *max_batch* messages and
+    about *max_batch_size* characters, below the server's 1 MiB frame limit). While the server
+    is unavailable the buffer keeps the newest *buffer_size* messages and the task reconnects
+    with backoff.
+    """
+
+    def __init__(self, uri: Optional[str] = None, buffer_size: int = settings.ws_publisher_buffer,
+                 max_batch: int = 100, max_batch_size: int = 512 * 1024, max_reconnect_delay: float = 10):
+        self.uri = uri or f'ws://localhost:{settings.ws_port}'
+        self.buffer: Deque[dict] = deque(maxlen=buffer_size)
+        self.max_batch = max_batch
+        self.max_batch_size = max_batch_size
+        self.max_reconnect_delay = max_reconnect_delay
+        self.has_messages = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    def publish(self, recipient_uuid, message) -> None:
+        """Queue a message for the recipient. Never blocks; the oldest message is dropped when the buffer is full."""
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+            logger.warning(f'WebSocket publisher buffer is full, dropped messages: {self.dropped}')
+        self.buffer.append({'recipient_uuid': recipient_uuid, 'message': message})
+        self.has_messages.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def _take_batch(self) -> List[dict]:
+        batch = []
+        batch_size = 0
+        while self.buffer and len(batch) < self.max_batch:
+            message_size = len(str(self.buffer[0]['message']))
+            if batch and batch_size + message_size > self.max_batch_size:
+                break
+            batch.append(self.buffer.popleft())
+            batch_size += message_size
+        return batch
+
+    async def _run(self):
+        reconnect_delay = 0.5
+        batch: List[dict] = []
+        while True:
+            try:
+                async with websockets.connect(self.uri) as websocket:
+                    await websocket.recv()  # Greeting
+                    reconnect_delay = 0.5
+                    while True:
+                        if not batch:
+                            await self.has_messages.wait()
+                            self.has_messages.clear()
+                            batch = self._take_batch()
+                            if not batch:
+                                continue
+                        # A single message keeps the plain format understood by older servers
+                        await websocket.send(json.dumps(batch[0] if len(batch) == 1 else batch))
+                        logger.info(f'Messages sent: {len(batch)}')
+                        batch = []
+                        if self.buffer:
+                            self.has_messages.set()
+            except asyncio.CancelledError:
+                raise
+            except websockets.exceptions.ConnectionClosed as e:
+                logger.error(f'WebSocket publisher connection closed: {e}')
+                if e.rcvd is not None and e.rcvd.code == 1009:
+                    # Message too big: resending the same frame would fail again
+                    logger.error(f'WebSocket publisher dropped messages: {len(batch)}')
+                    batch = []
+            except Exception as e:
+                logger.error(f'WebSocket publisher connection error: {e}')
+            # The unsent batch is kept and sent first after reconnecting
+            await asyncio.sleep(reconnect_delay)
+            reconnect_delay = min(reconnect_delay * 2, self.max_reconnect_delay)
+
+    async def close(self, timeout: float = 2) -> None:
+        """Give the buffered messages *timeout* seconds to be sent, then stop the task."""
+        if self.task is None:
+            return
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self.buffer and not self.task.done() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+
+ws_publisher: Optional[WebSocketPublisher] = None
+
+
+def get_ws_publisher() -> WebSocketPublisher:
+    global ws_publisher
+    if ws_publisher is None:
+        ws_publisher = WebSocketPublisher()
+    return ws_publisher
+
+
 async def send_message(recipient_uuid, message):
+    """Send a message through the shared publisher connection of this process."""
+    get_ws_publisher().publish(recipient_uuid, message)
+
+
+async def send_message_once(recipient_uuid, message):
+    """Send a single message over a new connection (for scripts without a running publisher)."""
     uri = f'ws://localhost:{settings.ws_port}'
     try:
         async with websockets.connect(uri) as websocket:
@@ -29,13 +139,13 @@ async def send_message(recipient_uuid, message):
 
 
 def ws_send_message(recipient_uuid, message):
-    asyncio.run(send_message(recipient_uuid, message))
+    asyncio.run(send_message_once(recipient_uuid, message))
 
 
 if __name__ == "__main__":
     recipient_uuid = sys.argv[1] if len(sys.argv) > 1 else None
     message = sys.argv[2] if len(sys.argv) > 2 else 'Hello.'
     if recipient_uuid is not None:
-        asyncio.run(send_message(recipient_uuid, message))
+        asyncio.run(send_message_once(recipient_uuid, message))
     else:
         print('Usage: client.py <recipient_uuid> <message>')
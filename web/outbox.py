@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Counters of slow-consumer handling, shared by all connections of the process
+STATS: Dict[str, int] = {
+    'dropped': 0,
+    'closed': 0,
+}
+
+
+class ConnectionOutbox:
+    """Bounded outgoing queue of one WebSocket connection, drained by its own writer task.
+
+    ``send_nowait`` never waits for the network, so forwarding a message does not stall on a
+    slow or half-dead recipient. When the queue is full the *policy* decides:
+    ``drop`` - drop the oldest queued message (the newest status is the useful one);
+    ``close`` - close the connection, the client reconnects and reloads the state.
+    """
+
+    def __init__(self, websocket, max_size: int = 100, policy: str = 'drop'):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.policy = policy
+        self.dropped = 0
+        self.closing = False
+        self.writer_task: Optional[asyncio.Task] = asyncio.create_task(self._write())
+
+    def send_nowait(self, message: str) -> bool:
+        """Queue a message. Returns False if it was not queued."""
+        if self.closing:
+            return False
+        if self.queue.full():
+            if self.policy == 'close':
+                self.closing = True
+                STATS['closed'] += 1
+                logger.warning(f'Slow WebSocket consumer, closing the connection ({self.queue.qsize()} messages queued)')
+                asyncio.create_task(self._close())
+                return False
+            self.queue.get_nowait()
+            self.dropped += 1
+            STATS['dropped'] += 1
+            if STATS['dropped'] % 100 == 1:
+                logger.warning(f'Slow WebSocket consumer, messages dropped: {STATS["dropped"]}')
+        self.queue.put_nowait(message)
+        return True
+
+    async def _write(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                await self.websocket.send(message)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f'WebSocket write error: {e}')
+
+    async def _close(self):
+        try:
+            await self.websocket.close(code=1013, reason='Too slow')
+        except Exception as e:
+            logger.error(f'WebSocket close error: {e}')
+
+    async def close(self) -> None:
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+            try:
+                await self.writer_task
+            except asyncio.CancelledError:
+                pass
+            self.writer_task = None
@@ -0,0 +1,100 @@
+import time
+from typing import List, Optional, Tuple
+
+# Recipient -> nodes map: one set of node ids per UUID, kept alive by the node heartbeats
+ROUTE_PREFIX = 'ws:route:'
+# Per-node presence: set of UUIDs with subscribers on the node, expires PRESENCE_TTL after the node stops
+PRESENCE_PREFIX = 'ws:presence:'
+# Each web/server_redis.py node listens on its own channel only
+NODE_CHANNEL_PREFIX = 'ws:node:'
+# Stream of the last messages of a UUID, replayed when a client (re)connects
+REPLAY_PREFIX = 'ws:replay:'
+# Id of the last replayed message of a UUID: stream entries can't be updated, earlier ones count as received
+REPLAYED_PREFIX = 'ws:replayed:'
+PRESENCE_TTL = 60
+
+# In one round trip: looks up the nodes holding the recipient, appends the message to
+# the replay stream (ARGV[4] > 0) and publishes it with its stream id to the node channels.
+# Route sets are refreshed by every node holding the UUID, so a stopped node stays in them:
+# nodes without the UUID in their presence set are skipped and removed from the route
+PUBLISH_SCRIPT = """
+local nodes = {}
+for _, node in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    if redis.call('SISMEMBER', ARGV[7] .. node, ARGV[6]) == 1 then
+        table.insert(nodes, node)
+    else
+        redis.call('SREM', KEYS[1], node)
+    end
+end
+local data = {recipient_key = ARGV[6], message = ARGV[1]}
+if tonumber(ARGV[4]) > 0 then
+    local delivered = '0'
+    if #nodes > 0 then
+        delivered = '1'
+    end
+    data['seq'] = redis.call('XADD', KEYS[2], 'MAXLEN', ARGV[4], '*', 'm', ARGV[1], 'd', delivered)
+    redis.call('EXPIRE', KEYS[2], ARGV[5])
+end
+local payload = cjson.encode(data)
+for _, node in ipairs(nodes) do
+    if node ~= ARGV[2] then
+        redis.call('PUBLISH', ARGV[3] .. node, payload)
+    end
+end
+return data['seq']
+"""
+
+
+def route_key(recipient_key: str) -> str:
+    return f'{ROUTE_PREFIX}{recipient_key}'
+
+
+def presence_key(node_id: str) -> str:
+    return f'{PRESENCE_PREFIX}{node_id}'
+
+
+def node_channel(node_id: str) -> str:
+    return f'{NODE_CHANNEL_PREFIX}{node_id}'
+
+
+def replay_key(recipient_key: str) -> str:
+    return f'{REPLAY_PREFIX}{recipient_key}'
+
+
+def replayed_key(recipient_key: str) -> str:
+    return f'{REPLAYED_PREFIX}{recipient_key}'
+
+
+async def publish_routed(redis, recipient_key: str, message: str, exclude_node: str = '',
+                         replay_size: int = 0, replay_ttl: int = 0) -> Optional[str]:
+    """Publish a message to the nodes that have subscribers for the recipient.
+    Returns its sequence number (replay stream id), or None if replay is disabled."""
+    return await redis.eval(PUBLISH_SCRIPT, 2, route_key(recipient_key), replay_key(recipient_key),
+                            message, exclude_node, NODE_CHANNEL_PREFIX, replay_size, replay_ttl, recipient_key,
+                            PRESENCE_PREFIX)
+
+
+async def read_replay(redis, recipient_key: str, last_seq: Optional[str] = None,
+                      count: int = 20, ttl: int = 300) -> List[Tuple[str, str]]:
+    """Messages of the replay stream newer than last_seq; without it only the messages nobody received."""
+    if last_seq is None:
+        # Messages up to the last replayed one were received by then
+        start = await redis.get(replayed_key(recipient_key)) or '0-0'
+    else:
+        start = last_seq
+    streams = await redis.xread({replay_key(recipient_key): start}, count=count)
+    min_time = (time.time() - ttl) * 1000
+    messages = []
+    for _, entries in streams:
+        for seq, fields in entries:
+            if int(seq.split('-')[0]) < min_time:
+                continue
+            if last_seq is None and fields.get('d') != '0':
+                continue
+            messages.append((seq, fields.get('m')))
+    return messages
+
+
+async def mark_replayed(redis, recipient_key: str, seq: str, ttl: int = 300) -> None:
+    """Remember the last replayed message, so later connects without last_seq don't get it again."""
+    await redis.set(replayed_key(recipient_key), seq, ex=ttl)
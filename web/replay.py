@@ -0,0 +1,67 @@
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional, Tuple
+
+
+def seq_envelope(recipient_key: str, seq, message: str) -> str:
+    """Message format for clients that track the last seen sequence number."""
+    return json.dumps({
+        'seq': seq,
+        'uuid': recipient_key,
+        'message': message
+    })
+
+
+class ReplayBuffer:
+    """Bounded in-memory buffer of the last messages of every UUID, replayed when a client (re)connects.
+
+    Holds up to *max_messages* per UUID for *ttl* seconds; the least recently
+    written UUIDs are evicted beyond *max_keys*. Sequence numbers are shared by
+    all UUIDs and start from the current time in milliseconds, so they keep
+    increasing after an eviction or a restart of the server.
+    """
+
+    def __init__(self, max_messages: int = 20, ttl: float = 300, max_keys: int = 10000):
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.last_seq = 0
+        # key -> messages as (seq, time, delivered, message)
+        self.entries: 'OrderedDict[str, Deque[Tuple[int, float, bool, str]]]' = OrderedDict()
+
+    def append(self, key: str, message: str, delivered: bool = True, seq: Optional[int] = None) -> int:
+        """Store a message and return its sequence number (*seq* - one assigned by another worker)."""
+        if seq is None:
+            seq = max(self.last_seq + 1, int(time.time() * 1000))
+        self.last_seq = max(self.last_seq, seq)
+        messages = self.entries.pop(key, None)
+        if messages is None:
+            messages = deque(maxlen=self.max_messages)
+        messages.append((seq, time.monotonic(), delivered, message))
+        self.entries[key] = messages
+        while len(self.entries) > self.max_keys:
+            self.entries.popitem(last=False)
+        return seq
+
+    def since(self, key: str, last_seq: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Messages newer than *last_seq*; without it only the messages nobody received."""
+        messages = self.entries.get(key)
+        if messages is None:
+            return []
+        min_time = time.monotonic() - self.ttl
+        while messages and messages[0][1] < min_time:
+            messages.popleft()
+        if last_seq is None:
+            return [(seq, message) for seq, _, delivered, message in messages if not delivered]
+        return [(seq, message) for seq, _, _, message in messages if seq > last_seq]
+
+    def mark_delivered(self, key: str, seqs) -> None:
+        """Mark replayed messages as received, so later connects without last_seq don't get them again."""
+        messages = self.entries.get(key)
+        if not messages or not seqs:
+            return
+        seqs = set(seqs)
+        for i, (seq, created, delivered, message) in enumerate(messages):
+            if not delivered and seq in seqs:
+                messages[i] = (seq, created, True, message)
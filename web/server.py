@@ -1,25 +1,48 @@
 #!/usr/bin/env python
 
 import sys
+import os
 import uuid
 import asyncio
 import signal
 import json
 import logging
-from typing import Dict, List, Optional, Sequence
+import shutil
+import tempfile
+import multiprocessing
+from typing import Dict, List, Optional, Sequence, Set
 from dataclasses import dataclass
 
+from starlette.websockets import WebSocket
 from websockets.asyncio.server import serve, ServerConnection
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from config import settings
+from web.outbox import ConnectionOutbox
+from web.replay import ReplayBuffer, seq_envelope
+from web.workers import WorkerLink
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
-# Forward mapping: key (UUID or tmp_UUID) -> websocket
-CONNECTIONS: Dict[str, ServerConnection] = {}
-# Reverse mapping: websocket id -> key, for O(1) cleanup on disconnect
-WS_TO_KEY: Dict[int, str] = {}
+# Forward mapping: key (UUID or tmp_UUID) -> websockets subscribed to it (several tabs may watch one UUID)
+CONNECTIONS: Dict[str, Set[ServerConnection]] = {}
+# Reverse mapping: websocket id -> keys, for O(1) cleanup on disconnect (one socket may watch many UUIDs)
+WS_TO_KEY: Dict[int, Set[str]] = {}
+# Websocket id -> bounded outgoing queue, so forwarding never waits for a slow recipient
+OUTBOXES: Dict[int, ConnectionOutbox] = {}
+# Last messages of every UUID, replayed on 'connected' so results sent between reconnects are not lost
+REPLAY: Optional[ReplayBuffer] = ReplayBuffer(
+    max_messages=settings.ws_replay_size,
+    ttl=settings.ws_replay_ttl,
+    max_keys=settings.ws_replay_keys
+) if settings.ws_replay_size > 0 else None
+# Websocket ids of clients that sent last_seq: they receive messages wrapped with their sequence number
+SEQ_SOCKETS: Set[int] = set()
+# IPC with the other worker processes when started with several workers (see run_workers)
+LINK: Optional[WorkerLink] = None
+TMP_KEY_PREFIX = 'tmp_'
 
 
 def _normalize_origin(value: str) -> str:
@@ -139,26 +162,65 @@ async def _http_not_found(send) -> None:
 class WebSocketMessage:
     recipient_uuid: Optional[str] = None
     message: Optional[str] = None
+    last_seq: Optional[int] = None
 
 
 def _add_connection(key: str, websocket) -> None:
-    """Register a connection with both forward and reverse mappings."""
-    CONNECTIONS[key] = websocket
-    WS_TO_KEY[id(websocket)] = key
+    """Subscribe a connection to a key in both forward and reverse mappings."""
+    websockets = CONNECTIONS.get(key)
+    if websockets is None:
+        websockets = CONNECTIONS[key] = set()
+        if LINK is not None and not key.startswith(TMP_KEY_PREFIX):
+            LINK.subscribed(key)
+    websockets.add(websocket)
+    WS_TO_KEY.setdefault(id(websocket), set()).add(key)
+
+
+def _drop_key(key: str) -> None:
+    """Forget a key that has no connections left."""
+    del CONNECTIONS[key]
+    if LINK is not None and not key.startswith(TMP_KEY_PREFIX):
+        LINK.unsubscribed(key)
+
+
+def _remove_connection(key: str, websocket) -> None:
+    """Unsubscribe one connection from a key."""
+    websockets = CONNECTIONS.get(key)
+    if websockets is not None:
+        websockets.discard(websocket)
+        if not websockets:
+            _drop_key(key)
+    keys = WS_TO_KEY.get(id(websocket))
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del WS_TO_KEY[id(websocket)]
 
 
 def _remove_connection_by_key(key: str) -> None:
-    """Remove a connection by its key from both mappings."""
-    ws = CONNECTIONS.pop(key, None)
-    if ws is not None:
-        WS_TO_KEY.pop(id(ws), None)
+    """Remove all connections of a key from both mappings."""
+    for ws in list(CONNECTIONS.get(key, ())):
+        _remove_connection(key, ws)
 
 
 def _remove_connection_by_ws(websocket) -> None:
-    """Remove a connection by websocket reference using O(1) reverse lookup."""
-    key = WS_TO_KEY.pop(id(websocket), None)
-    if key is not None:
-        CONNECTIONS.pop(key, None)
+    """Remove all subscriptions of a websocket using O(1) reverse lookup."""
+    for key in WS_TO_KEY.pop(id(websocket), ()):
+        websockets = CONNECTIONS.get(key)
+        if websockets is not None:
+            websockets.discard(websocket)
+            if not websockets:
+                _drop_key(key)
+
+
+def _subscribe(key: str, websocket, tmp_key: str) -> bool:
+    """Handle a 'connected' message: replace the temporary key with the UUID, up to WS_MAX_SUBSCRIPTIONS per socket."""
+    _remove_connection(tmp_key, websocket)
+    if len(WS_TO_KEY.get(id(websocket), ())) >= settings.ws_max_subscriptions:
+        logger.warning(f'Too many subscriptions, ignored UUID: {key}')
+        return False
+    _add_connection(key, websocket)
+    return True
 
 
 def _parse_message(message: str) -> WebSocketMessage:
@@ -171,42 +233,141 @@ def _parse_message(message: str) -> WebSocketMessage:
     return WebSocketMessage(message=message)
 
 
+def _parse_messages(message: str) -> List[WebSocketMessage]:
+    """Parse an incoming frame, which is either one message or a JSON array batch of messages."""
+    if message.startswith('['):
+        data = json.loads(message)
+        if isinstance(data, list) and data and all(isinstance(item, dict) for item in data):
+            return [WebSocketMessage(**item) for item in data]
+    return [_parse_message(message)]
+
+
+def _open_outbox(websocket) -> ConnectionOutbox:
+    outbox = ConnectionOutbox(websocket, max_size=settings.ws_outbox_size, policy=settings.ws_slow_consumer_policy)
+    OUTBOXES[id(websocket)] = outbox
+    return outbox
+
+
+async def _close_outbox(websocket) -> None:
+    outbox = OUTBOXES.pop(id(websocket), None)
+    if outbox is not None:
+        await outbox.close()
+
+
+async def send_to_recipient(recipient_uuid: Optional[str], message: str) -> bool:
+    """Queue a message to all connections subscribed to the UUID. Returns False if there are none."""
+    if not recipient_uuid:
+        return False
+    recipients = CONNECTIONS.get(recipient_uuid)
+    remote = LINK is not None and LINK.has_remote(recipient_uuid)
+    seq = None
+    if REPLAY is not None:
+        seq = REPLAY.append(recipient_uuid, message, delivered=bool(recipients) or remote)
+    if LINK is not None:
+        LINK.forward(recipient_uuid, message, seq, delivered=bool(recipients) or remote)
+    if recipients:
+        await _send_local(recipients, recipient_uuid, message, seq)
+    return bool(recipients) or remote
+
+
+async def _deliver_forwarded(recipient_uuid: str, message: str, seq: Optional[int], delivered: bool) -> None:
+    """Handle a message forwarded by another worker process."""
+    # Also when the sender found no subscribers: ours may have connected before our announcement reached it
+    recipients = CONNECTIONS.get(recipient_uuid)
+    if REPLAY is not None:
+        REPLAY.append(recipient_uuid, message, delivered=bool(recipients), seq=seq)
+    if recipients:
+        await _send_local(recipients, recipient_uuid, message, seq)
+
+
+async def _send_local(recipients: Set, recipient_uuid: str, message: str, seq: Optional[int]) -> None:
+    envelope = None
+    direct = []
+    for ws in list(recipients):
+        text = message
+        if seq is not None and id(ws) in SEQ_SOCKETS:
+            if envelope is None:
+                envelope = seq_envelope(recipient_uuid, seq, message)
+            text = envelope
+        outbox = OUTBOXES.get(id(ws))
+        if outbox is not None:
+            outbox.send_nowait(text)
+        else:
+            direct.append((ws, text))
+    if direct:
+        results = await asyncio.gather(*(ws.send(text) for ws, text in direct), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f'Error sending message to {recipient_uuid}: {result}')
+
+
+async def _replay(key: str, websocket, last_seq: Optional[int] = None) -> int:
+    """Send the buffered messages of the key to a new subscriber: newer than last_seq, or the undelivered ones."""
+    if REPLAY is None:
+        return 0
+    messages = REPLAY.since(key, last_seq)
+    outbox = OUTBOXES.get(id(websocket))
+    sent = []
+    try:
+        for seq, message in messages:
+            text = seq_envelope(key, seq, message) if last_seq is not None else message
+            if outbox is not None:
+                outbox.send_nowait(text)
+            else:
+                await websocket.send(text)
+            sent.append(seq)
+    finally:
+        REPLAY.mark_delivered(key, sent)
+    return len(messages)
+
+
 async def register(websocket):
     tmp_uuid = str(uuid.uuid4())
     tmp_key = f'tmp_{tmp_uuid}'
     logger.info(f'New connection: {tmp_uuid}')
     _add_connection(tmp_key, websocket)
-    logger.info(f'Connections total: {len(CONNECTIONS)}')
+    _open_outbox(websocket)
+    logger.info(f'Connections total: {len(WS_TO_KEY)}')
 
     try:
         await websocket.send('..:: Hello from the Notification Center ::..')
         async for message in websocket:
             try:
-                event = _parse_message(message)
-
-                if event.message == 'connected' and event.recipient_uuid:
-                    logger.info(f'Set UUID: {event.recipient_uuid}')
-                    _remove_connection_by_key(tmp_key)
-                    _add_connection(event.recipient_uuid, websocket)
-                else:
-                    logger.info(f'Message: {event}')
-                    recipient_ws = CONNECTIONS.get(event.recipient_uuid) if event.recipient_uuid else None
-                    if recipient_ws is not None:
-                        await recipient_ws.send(event.message)
-                    else:
-                        logger.warning(f'Connection not found for UUID: {event.recipient_uuid}')
+                events = _parse_messages(message)
             except json.JSONDecodeError as e:
                 logger.error(f'JSON decode error: {e}')
+                continue
             except Exception as e:
                 logger.error(f'Error processing message: {e}')
+                continue
+            for event in events:
+                try:
+                    if event.message == 'connected' and event.recipient_uuid:
+                        logger.info(f'Set UUID: {event.recipient_uuid}')
+                        if event.last_seq is not None:
+                            SEQ_SOCKETS.add(id(websocket))
+                        if _subscribe(event.recipient_uuid, websocket, tmp_key):
+                            await _replay(event.recipient_uuid, websocket, event.last_seq)
+                    elif event.message == 'disconnected' and event.recipient_uuid:
+                        logger.info(f'Unset UUID: {event.recipient_uuid}')
+                        _remove_connection(event.recipient_uuid, websocket)
+                    else:
+                        logger.info(f'Message: {event}')
+                        if not await send_to_recipient(event.recipient_uuid, event.message):
+                            logger.warning(f'Connection not found for UUID: {event.recipient_uuid}')
+                except Exception as e:
+                    logger.error(f'Error processing message: {e}')
 
     finally:
         logger.info(f'Disconnected: {tmp_uuid}')
         _remove_connection_by_ws(websocket)
-        logger.info(f'Connections total: {len(CONNECTIONS)}')
+        SEQ_SOCKETS.discard(id(websocket))
+        await _close_outbox(websocket)
+        logger.info(f'Connections total: {len(WS_TO_KEY)}')
 
 
-async def main(port=8765):
+async def main(port=8765, worker_id: int = 0, workers: int = 1, ipc_dir: Optional[str] = None):
+    global LINK
     logger.info('Starting WebSocket server')
 
     # Set the stop condition when receiving SIGTERM.
@@ -214,16 +375,61 @@ async def main(port=8765):
     stop = loop.create_future()
     loop.add_signal_handler(signal.SIGTERM, stop.set_result, None)
 
-    async with serve(
-        register,
-        host='',
-        port=port,
-        reuse_port=True,
-        ping_interval=60,
-        ping_timeout=30,
-        origins=cors_origins_for_websocket(),
-    ):
-        await stop  # Waiting for SIGTERM signal to terminate
+    if workers > 1:
+        LINK = WorkerLink(worker_id, workers, ipc_dir, deliver=_deliver_forwarded,
+                          local_keys=lambda: [key for key in CONNECTIONS if not key.startswith(TMP_KEY_PREFIX)])
+        await LINK.start()
+
+    try:
+        async with serve(
+            register,
+            host='',
+            port=port,
+            reuse_port=True,
+            ping_interval=60,
+            ping_timeout=30,
+            origins=cors_origins_for_websocket(),
+        ):
+            await stop  # Waiting for SIGTERM signal to terminate
+    finally:
+        if LINK is not None:
+            await LINK.close()
+            LINK = None
+
+
+def _run_worker(port, worker_id: int, workers: int, ipc_dir: str) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(main(port=port, worker_id=worker_id, workers=workers, ipc_dir=ipc_dir))
+
+
+def run_workers(port=8765, workers: int = 1) -> None:
+    """
+    Run the server in several processes sharing the port (SO_REUSEPORT), one per CPU core.
+
+    The kernel spreads the connections between the workers; a message for a client of
+    another worker is forwarded to it over a Unix socket (see web/workers.py), so no Redis is needed.
+    """
+    if workers <= 1:
+        asyncio.run(main(port=port))
+        return
+    ipc_dir = tempfile.mkdtemp(prefix='queue-ws-')
+    processes = [multiprocessing.Process(target=_run_worker, args=(port, worker_id, workers, ipc_dir))
+                 for worker_id in range(workers)]
+    for process in processes:
+        process.start()
+
+    def stop_workers(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(ipc_dir, ignore_errors=True)
 
 
 # ASGI application for uvicorn compatibility
@@ -271,6 +477,16 @@ async def app(scope, receive, send):
         await _http_not_found(send)
 
 
+async def websocket_endpoint(websocket: WebSocket) -> None:
+    """
+    Starlette/FastAPI WebSocket endpoint sharing the CONNECTIONS registry of this module.
+
+    Mounted by main.py as /ws when WS_MOUNT is enabled, so the API and the
+    notification server run as one deployment.
+    """
+    await websocket_handler(websocket.scope, websocket.receive, websocket.send)
+
+
 async def websocket_handler(scope, receive, send):
     """Handle a single WebSocket connection using ASGI protocol."""
     # Wait for connection
@@ -309,6 +525,16 @@ async def websocket_handler(scope, receive, send):
                     'text': message
                 })
 
+        async def close(self, code: int = 1000, reason: str = ''):
+            """Close the connection."""
+            if not self._closed:
+                self._closed = True
+                await self._send({
+                    'type': 'websocket.close',
+                    'code': code,
+                    'reason': reason
+                })
+
         def __aiter__(self):
             """Async iterator for receiving messages."""
             return self
@@ -329,37 +555,48 @@ async def websocket_handler(scope, receive, send):
 
     websocket = ASGIWebSocket(scope, receive, send)
     _add_connection(tmp_key, websocket)
-    logger.info(f'Connections total: {len(CONNECTIONS)}')
+    _open_outbox(websocket)
+    logger.info(f'Connections total: {len(WS_TO_KEY)}')
 
     try:
         await websocket.send('..:: Hello from the Notification Center ::..')
         async for message in websocket:
             try:
-                event = _parse_message(message)
-
-                if event.message == 'connected' and event.recipient_uuid:
-                    logger.info(f'Set UUID: {event.recipient_uuid}')
-                    _remove_connection_by_key(tmp_key)
-                    _add_connection(event.recipient_uuid, websocket)
-                else:
-                    logger.info(f'Message: {event}')
-                    recipient_ws = CONNECTIONS.get(event.recipient_uuid) if event.recipient_uuid else None
-                    if recipient_ws is not None:
-                        await recipient_ws.send(event.message)
-                    else:
-                        logger.warning(f'Connection not found for UUID: {event.recipient_uuid}')
+                events = _parse_messages(message)
             except json.JSONDecodeError as e:
                 logger.error(f'JSON decode error: {e}')
+                continue
             except Exception as e:
                 logger.error(f'Error processing message: {e}')
+                continue
+            for event in events:
+                try:
+                    if event.message == 'connected' and event.recipient_uuid:
+                        logger.info(f'Set UUID: {event.recipient_uuid}')
+                        if event.last_seq is not None:
+                            SEQ_SOCKETS.add(id(websocket))
+                        if _subscribe(event.recipient_uuid, websocket, tmp_key):
+                            await _replay(event.recipient_uuid, websocket, event.last_seq)
+                    elif event.message == 'disconnected' and event.recipient_uuid:
+                        logger.info(f'Unset UUID: {event.recipient_uuid}')
+                        _remove_connection(event.recipient_uuid, websocket)
+                    else:
+                        logger.info(f'Message: {event}')
+                        if not await send_to_recipient(event.recipient_uuid, event.message):
+                            logger.warning(f'Connection not found for UUID: {event.recipient_uuid}')
+                except Exception as e:
+                    logger.error(f'Error processing message: {e}')
 
     finally:
         logger.info(f'Disconnected: {tmp_uuid}')
         _remove_connection_by_ws(websocket)
-        logger.info(f'Connections total: {len(CONNECTIONS)}')
+        SEQ_SOCKETS.discard(id(websocket))
+        await _close_outbox(websocket)
+        logger.info(f'Connections total: {len(WS_TO_KEY)}')
 
 
 if __name__ == "__main__":
     args = sys.argv[1:]
-    port_num = args[0] if len(args) > 0 else 8765
-    asyncio.run(main(port=port_num))
+    port_num = int(args[0]) if len(args) > 0 else 8765
+    workers_num = int(args[1]) if len(args) > 1 else settings.ws_workers
+    run_workers(port=port_num, workers=workers_num)
@@ -1,35 +1,50 @@
 #!/usr/bin/env python
 
 import sys
+import os
 import uuid
 import asyncio
 import signal
 import json
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set
 from dataclasses import dataclass
 
 import redis.asyncio as redis
 from websockets.asyncio.server import serve, ServerConnection
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from web.outbox import ConnectionOutbox
+from web.redis_routing import (
+    PRESENCE_TTL, presence_key, route_key, node_channel, publish_routed, read_replay, mark_replayed
+)
+from web.replay import seq_envelope
+
 try:
     from config import settings
     REDIS_HOST = settings.redis_host
     REDIS_PORT = settings.redis_port
     REDIS_DB = settings.redis_db
+    WS_MAX_SUBSCRIPTIONS = settings.ws_max_subscriptions
+    WS_OUTBOX_SIZE = settings.ws_outbox_size
+    WS_SLOW_CONSUMER_POLICY = settings.ws_slow_consumer_policy
+    WS_REPLAY_SIZE = settings.ws_replay_size
+    WS_REPLAY_TTL = settings.ws_replay_ttl
 except ImportError:
     REDIS_HOST = 'localhost'
     REDIS_PORT = 6379
     REDIS_DB = 10
+    WS_MAX_SUBSCRIPTIONS = 1000
+    WS_OUTBOX_SIZE = 100
+    WS_SLOW_CONSUMER_POLICY = 'drop'
+    WS_REPLAY_SIZE = 20
+    WS_REPLAY_TTL = 300
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
-KEY_PREFIX = 'ws:conn:'
-KEY_TO_WS_PREFIX = 'ws:key_to_ws:'
-WS_TO_KEY_PREFIX = 'ws:ws_to_key:'
-
-PUB_CHANNEL = 'ws:messages'
+TMP_KEY_PREFIX = 'tmp_'
 
 
 class RedisConnectionManager:
@@ -38,90 +53,191 @@ class RedisConnectionManager:
         self.host = host
         self.port = port
         self.db = db
-        self.local_connections: Dict[str, ServerConnection] = {}
-        self.local_ws_to_key: Dict[int, str] = {}
+        # Several connections per key and several keys per connection, as in web/server.py
+        self.local_connections: Dict[str, Set[ServerConnection]] = {}
+        self.local_ws_to_key: Dict[int, Set[str]] = {}
+        self.outboxes: Dict[int, ConnectionOutbox] = {}
+        # Websocket ids of clients that sent last_seq: they receive messages wrapped with their sequence number
+        self.seq_sockets: Set[int] = set()
+        self.node_id = str(uuid.uuid4())
         self.pubsub: Optional[redis.client.PubSub] = None
         self.pubsub_task: Optional[asyncio.Task] = None
+        self.heartbeat_task: Optional[asyncio.Task] = None
 
     async def connect(self):
         self.redis = redis.Redis(host=self.host, port=self.port, db=self.db, decode_responses=True)
         self.pubsub = self.redis.pubsub()
         await self.redis.ping()
         logger.info(f'Connected to Redis at {self.host}:{self.port}')
+        self.heartbeat_task = asyncio.create_task(self._heartbeat())
 
     async def disconnect(self):
-        if self.pubsub_task:
-            self.pubsub_task.cancel()
-            try:
-                await self.pubsub_task
-            except asyncio.CancelledError:
-                pass
+        for task in (self.pubsub_task, self.heartbeat_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
         if self.pubsub:
             await self.pubsub.close()
         if self.redis:
+            try:
+                await self._presence_remove(*self.local_connections)
+                await self.redis.delete(self._get_presence_key())
+            except Exception as e:
+                logger.error(f'Redis presence error: {e}')
             await self.redis.close()
 
-    def _get_redis_key(self, key: str) -> str:
-        return f'{KEY_PREFIX}{key}'
-
-    def _get_key_to_ws_key(self, key: str) -> str:
-        return f'{KEY_TO_WS_PREFIX}{key}'
-
-    def _get_ws_to_key_key(self, ws_id: int) -> str:
-        return f'{WS_TO_KEY_PREFIX}{ws_id}'
+    def _get_presence_key(self) -> str:
+        return presence_key(self.node_id)
+
+    def _add_local(self, key: str, websocket) -> bool:
+        """Add to the local registry. Returns True if the key had no connections on this node before."""
+        websockets = self.local_connections.setdefault(key, set())
+        is_new = not websockets
+        websockets.add(websocket)
+        self.local_ws_to_key.setdefault(id(websocket), set()).add(key)
+        return is_new
+
+    def _remove_local(self, key: str, websocket) -> bool:
+        """Remove from the local registry. Returns True if the key has no connections on this node left."""
+        keys = self.local_ws_to_key.get(id(websocket))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.local_ws_to_key[id(websocket)]
+        websockets = self.local_connections.get(key)
+        if websockets is None:
+            return False
+        websockets.discard(websocket)
+        if websockets:
+            return False
+        del self.local_connections[key]
+        return True
+
+    async def _presence_add(self, *keys: str) -> None:
+        """Add the keys to the node presence set and the node to their routes, in one round trip."""
+        keys = [key for key in keys if not key.startswith(TMP_KEY_PREFIX)]
+        if not keys or not self.redis:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(self._get_presence_key(), *keys)
+            pipe.expire(self._get_presence_key(), PRESENCE_TTL)
+            for key in keys:
+                pipe.sadd(route_key(key), self.node_id)
+                pipe.expire(route_key(key), PRESENCE_TTL)
+            await pipe.execute()
+
+    async def _presence_remove(self, *keys: str) -> None:
+        keys = [key for key in keys if not key.startswith(TMP_KEY_PREFIX)]
+        if not keys or not self.redis:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.srem(self._get_presence_key(), *keys)
+            for key in keys:
+                pipe.srem(route_key(key), self.node_id)
+            await pipe.execute()
+
+    async def _heartbeat(self):
+        """Refresh the presence set and routes of the local keys (also restores them after a Redis restart)."""
+        while True:
+            await asyncio.sleep(PRESENCE_TTL / 3)
+            try:
+                keys = list(self.local_connections)
+                for i in range(0, len(keys), 500):
+                    await self._presence_add(*keys[i:i + 500])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'Redis presence error: {e}')
 
     async def add_connection(self, key: str, websocket: ServerConnection) -> None:
-        ws_id = id(websocket)
-        self.local_connections[key] = websocket
-        self.local_ws_to_key[ws_id] = key
+        # Redis is only written when the first connection of the node subscribes to the key
+        if self._add_local(key, websocket):
+            await self._presence_add(key)
 
-        if self.redis:
-            await self.redis.set(self._get_key_to_ws_key(key), str(ws_id))
-            await self.redis.set(self._get_ws_to_key_key(ws_id), key)
+    async def remove_connection(self, key: str, websocket) -> None:
+        if self._remove_local(key, websocket):
+            await self._presence_remove(key)
 
     async def remove_connection_by_key(self, key: str) -> None:
-        ws_id = None
-        if key in self.local_connections:
-            ws_id = id(self.local_connections[key])
-            del self.local_connections[key]
-
-        if self.redis:
-            ws_id_str = await self.redis.get(self._get_key_to_ws_key(key))
-            if ws_id_str:
-                ws_id = int(ws_id_str)
-            await self.redis.delete(self._get_key_to_ws_key(key))
-            if ws_id:
-                await self.redis.delete(self._get_ws_to_key_key(ws_id))
+        for websocket in list(self.local_connections.get(key, ())):
+            await self.remove_connection(key, websocket)
 
     async def remove_connection_by_websocket(self, websocket) -> None:
-        ws_id = id(websocket)
-        key = self.local_ws_to_key.pop(ws_id, None)
-        if key and key in self.local_connections:
-            del self.local_connections[key]
-
-        if self.redis:
-            key = await self.redis.get(self._get_ws_to_key_key(ws_id))
-            await self.redis.delete(self._get_ws_to_key_key(ws_id))
-            if key:
-                await self.redis.delete(self._get_key_to_ws_key(key))
-
-    def get_local_websocket(self, key: str) -> Optional[ServerConnection]:
-        return self.local_connections.get(key)
-
-    async def get_redis_websocket_id(self, key: str) -> Optional[str]:
-        if self.redis:
-            return await self.redis.get(self._get_key_to_ws_key(key))
-        return None
-
-    async def publish_message(self, recipient_key: str, message: str) -> None:
-        if self.redis:
-            await self.redis.publish(PUB_CHANNEL, json.dumps({
-                'recipient_key': recipient_key,
-                'message': message
-            }))
+        removed_keys = [key for key in list(self.local_ws_to_key.get(id(websocket), ()))
+                        if self._remove_local(key, websocket)]
+        await self._presence_remove(*removed_keys)
+
+    def get_local_websockets(self, key: str) -> Set[ServerConnection]:
+        return self.local_connections.get(key, set())
+
+    def open_outbox(self, websocket) -> ConnectionOutbox:
+        outbox = ConnectionOutbox(websocket, max_size=WS_OUTBOX_SIZE, policy=WS_SLOW_CONSUMER_POLICY)
+        self.outboxes[id(websocket)] = outbox
+        return outbox
+
+    async def close_outbox(self, websocket) -> None:
+        self.seq_sockets.discard(id(websocket))
+        outbox = self.outboxes.pop(id(websocket), None)
+        if outbox is not None:
+            await outbox.close()
+
+    async def send_local(self, key: str, message: str, seq: Optional[str] = None) -> bool:
+        """Queue a message to every connection of this node subscribed to the key. Returns False if there are none."""
+        websockets = list(self.get_local_websockets(key))
+        if not websockets:
+            return False
+        envelope = None
+        direct = []
+        for ws in websockets:
+            text = message
+            if seq is not None and id(ws) in self.seq_sockets:
+                if envelope is None:
+                    envelope = seq_envelope(key, seq, message)
+                text = envelope
+            outbox = self.outboxes.get(id(ws))
+            if outbox is not None:
+                outbox.send_nowait(text)
+            else:
+                direct.append((ws, text))
+        if direct:
+            results = await asyncio.gather(*(ws.send(text) for ws, text in direct), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f'Error sending message to {key}: {result}')
+        return True
+
+    async def publish_message(self, recipient_key: str, message: str) -> Optional[str]:
+        """Publish to the other nodes that have subscribers for the recipient. Returns the sequence number."""
+        if not self.redis:
+            return None
+        return await publish_routed(self.redis, recipient_key, message, exclude_node=self.node_id,
+                                    replay_size=WS_REPLAY_SIZE, replay_ttl=WS_REPLAY_TTL)
+
+    async def replay(self, key: str, websocket, last_seq: Optional[str] = None) -> int:
+        """Send the messages of the replay stream to a new subscriber: newer than last_seq, or the undelivered ones."""
+        if WS_REPLAY_SIZE <= 0 or not self.redis:
+            return 0
+        messages = await read_replay(self.redis, key, last_seq, count=WS_REPLAY_SIZE, ttl=WS_REPLAY_TTL)
+        outbox = self.outboxes.get(id(websocket))
+        sent_seq = None
+        try:
+            for seq, message in messages:
+                text = seq_envelope(key, seq, message) if last_seq is not None else message
+                if outbox is not None:
+                    outbox.send_nowait(text)
+                else:
+                    await websocket.send(text)
+                sent_seq = seq
+        finally:
+            if sent_seq is not None:
+                await mark_replayed(self.redis, key, sent_seq, ttl=WS_REPLAY_TTL)
+        return len(messages)
 
     async def subscribe(self):
-        await self.pubsub.subscribe(PUB_CHANNEL)
+        await self.pubsub.subscribe(node_channel(self.node_id))
         self.pubsub_task = asyncio.create_task(self._handle_pubsub())
 
     async def _handle_pubsub(self):
@@ -133,9 +249,7 @@ class RedisConnectionManager:
                         recipient_key = data.get('recipient_key')
                         message_text = data.get('message')
                         if recipient_key and message_text:
-                            ws = self.local_connections.get(recipient_key)
-                            if ws:
-                                await ws.send(message_text)
+                            await self.send_local(recipient_key, message_text, data.get('seq'))
                     except json.JSONDecodeError as e:
                         logger.error(f'JSON decode error from Redis: {e}')
         except asyncio.CancelledError:
@@ -149,6 +263,7 @@ conn_manager: Optional[RedisConnectionManager] = None
 class WebSocketMessage:
     recipient_uuid: Optional[str] = None
     message: Optional[str] = None
+    last_seq: Optional[str] = None
 
 
 def _parse_message(message: str) -> WebSocketMessage:
@@ -160,6 +275,14 @@ def _parse_message(message: str) -> WebSocketMessage:
     return WebSocketMessage(message=message)
 
 
+def _parse_messages(message: str) -> List[WebSocketMessage]:
+    if message.startswith('['):
+        data = json.loads(message)
+        if isinstance(data, list) and data and all(isinstance(item, dict) for item in data):
+            return [WebSocketMessage(**item) for item in data]
+    return [_parse_message(message)]
+
+
 async def register(websocket):
     global conn_manager
     if not conn_manager:
@@ -171,50 +294,52 @@ async def register(websocket):
     tmp_key = f'tmp_{tmp_uuid}'
     logger.info(f'New connection: {tmp_uuid}')
 
-    # Add connection to local registry first (fast, synchronous operation)
+    # Temporary keys live in the local registry only, Redis keeps the per-node presence of real UUIDs
     ws_id = id(websocket)
-    conn_manager.local_connections[tmp_key] = websocket
-    conn_manager.local_ws_to_key[ws_id] = tmp_key
-    logger.info(f'Connections total: {len(conn_manager.local_connections)}')
-
-    # Store in Redis asynchronously after adding to local registry
-    async def _store_in_redis():
-        if conn_manager.redis:
-            try:
-                await conn_manager.redis.set(conn_manager._get_key_to_ws_key(tmp_key), str(ws_id))
-                await conn_manager.redis.set(conn_manager._get_ws_to_key_key(ws_id), tmp_key)
-            except Exception as e:
-                logger.error(f'Redis storage error: {e}')
-
-    asyncio.create_task(_store_in_redis())
+    conn_manager._add_local(tmp_key, websocket)
+    conn_manager.open_outbox(websocket)
+    logger.info(f'Connections total: {len(conn_manager.local_ws_to_key)}')
 
     try:
         await websocket.send('..:: Hello from the Notification Center (Redis) ::..')
         async for message in websocket:
             try:
-                event = _parse_message(message)
-
-                if event.message == 'connected' and event.recipient_uuid:
-                    logger.info(f'Set UUID: {event.recipient_uuid}')
-                    await conn_manager.remove_connection_by_key(tmp_key)
-                    await conn_manager.add_connection(event.recipient_uuid, websocket)
-                else:
-                    logger.info(f'Message: {event}')
-                    recipient_ws = conn_manager.get_local_websocket(event.recipient_uuid) if event.recipient_uuid else None
-                    if recipient_ws is not None:
-                        await recipient_ws.send(event.message)
-                    else:
-                        await conn_manager.publish_message(event.recipient_uuid, event.message)
-                        logger.info(f'Message published to Redis for: {event.recipient_uuid}')
+                events = _parse_messages(message)
             except json.JSONDecodeError as e:
                 logger.error(f'JSON decode error: {e}')
+                continue
             except Exception as e:
                 logger.error(f'Error processing message: {e}')
+                continue
+            for event in events:
+                try:
+                    if event.message == 'connected' and event.recipient_uuid:
+                        logger.info(f'Set UUID: {event.recipient_uuid}')
+                        await conn_manager.remove_connection(tmp_key, websocket)
+                        if event.last_seq is not None:
+                            conn_manager.seq_sockets.add(ws_id)
+                        if len(conn_manager.local_ws_to_key.get(ws_id, ())) < WS_MAX_SUBSCRIPTIONS:
+                            await conn_manager.add_connection(event.recipient_uuid, websocket)
+                            await conn_manager.replay(event.recipient_uuid, websocket,
+                                                      None if event.last_seq is None else str(event.last_seq))
+                        else:
+                            logger.warning(f'Too many subscriptions, ignored UUID: {event.recipient_uuid}')
+                    elif event.message == 'disconnected' and event.recipient_uuid:
+                        logger.info(f'Unset UUID: {event.recipient_uuid}')
+                        await conn_manager.remove_connection(event.recipient_uuid, websocket)
+                    elif event.recipient_uuid:
+                        logger.info(f'Message: {event}')
+                        # Other nodes get it through Redis, local subscribers directly
+                        seq = await conn_manager.publish_message(event.recipient_uuid, event.message)
+                        await conn_manager.send_local(event.recipient_uuid, event.message, seq)
+                except Exception as e:
+                    logger.error(f'Error processing message: {e}')
 
     finally:
         logger.info(f'Disconnected: {tmp_uuid}')
         await conn_manager.remove_connection_by_websocket(websocket)
-        logger.info(f'Connections total: {len(conn_manager.local_connections)}')
+        await conn_manager.close_outbox(websocket)
+        logger.info(f'Connections total: {len(conn_manager.local_ws_to_key)}')
 
 
 async def main(port=8766):
@@ -294,6 +419,15 @@ async def websocket_handler(scope, receive, send):
                     'text': message
                 })
 
+        async def close(self, code: int = 1000, reason: str = ''):
+            if not self._closed:
+                self._closed = True
+                await self._send({
+                    'type': 'websocket.close',
+                    'code': code,
+                    'reason': reason
+                })
+
         def __aiter__(self):
             return self
 
@@ -312,50 +446,52 @@ async def websocket_handler(scope, receive, send):
 
     websocket = ASGIWebSocket(scope, receive, send)
 
-    # Add connection to local registry first (fast, synchronous operation)
+    # Temporary keys live in the local registry only, Redis keeps the per-node presence of real UUIDs
     ws_id = id(websocket)
-    conn_manager.local_connections[tmp_key] = websocket
-    conn_manager.local_ws_to_key[ws_id] = tmp_key
-    logger.info(f'Connections total: {len(conn_manager.local_connections)}')
-
-    # Store in Redis asynchronously after adding to local registry
-    async def _store_in_redis():
-        if conn_manager.redis:
-            try:
-                await conn_manager.redis.set(conn_manager._get_key_to_ws_key(tmp_key), str(ws_id))
-                await conn_manager.redis.set(conn_manager._get_ws_to_key_key(ws_id), tmp_key)
-            except Exception as e:
-                logger.error(f'Redis storage error: {e}')
-
-    asyncio.create_task(_store_in_redis())
+    conn_manager._add_local(tmp_key, websocket)
+    conn_manager.open_outbox(websocket)
+    logger.info(f'Connections total: {len(conn_manager.local_ws_to_key)}')
 
     try:
         await websocket.send('..:: Hello from the Notification Center (Redis) ::..')
         async for message in websocket:
             try:
-                event = _parse_message(message)
-
-                if event.message == 'connected' and event.recipient_uuid:
-                    logger.info(f'Set UUID: {event.recipient_uuid}')
-                    await conn_manager.remove_connection_by_key(tmp_key)
-                    await conn_manager.add_connection(event.recipient_uuid, websocket)
-                else:
-                    logger.info(f'Message: {event}')
-                    recipient_ws = conn_manager.get_local_websocket(event.recipient_uuid) if event.recipient_uuid else None
-                    if recipient_ws is not None:
-                        await recipient_ws.send(event.message)
-                    else:
-                        await conn_manager.publish_message(event.recipient_uuid, event.message)
-                        logger.info(f'Message published to Redis for: {event.recipient_uuid}')
+                events = _parse_messages(message)
             except json.JSONDecodeError as e:
                 logger.error(f'JSON decode error: {e}')
+                continue
             except Exception as e:
                 logger.error(f'Error processing message: {e}')
+                continue
+            for event in events:
+                try:
+                    if event.message == 'connected' and event.recipient_uuid:
+                        logger.info(f'Set UUID: {event.recipient_uuid}')
+                        await conn_manager.remove_connection(tmp_key, websocket)
+                        if event.last_seq is not None:
+                            conn_manager.seq_sockets.add(ws_id)
+                        if len(conn_manager.local_ws_to_key.get(ws_id, ())) < WS_MAX_SUBSCRIPTIONS:
+                            await conn_manager.add_connection(event.recipient_uuid, websocket)
+                            await conn_manager.replay(event.recipient_uuid, websocket,
+                                                      None if event.last_seq is None else str(event.last_seq))
+                        else:
+                            logger.warning(f'Too many subscriptions, ignored UUID: {event.recipient_uuid}')
+                    elif event.message == 'disconnected' and event.recipient_uuid:
+                        logger.info(f'Unset UUID: {event.recipient_uuid}')
+                        await conn_manager.remove_connection(event.recipient_uuid, websocket)
+                    elif event.recipient_uuid:
+                        logger.info(f'Message: {event}')
+                        # Other nodes get it through Redis, local subscribers directly
+                        seq = await conn_manager.publish_message(event.recipient_uuid, event.message)
+                        await conn_manager.send_local(event.recipient_uuid, event.message, seq)
+                except Exception as e:
+                    logger.error(f'Error processing message: {e}')
 
     finally:
         logger.info(f'Disconnected: {tmp_uuid}')
         await conn_manager.remove_connection_by_websocket(websocket)
-        logger.info(f'Connections total: {len(conn_manager.local_connections)}')
+        await conn_manager.close_outbox(websocket)
+        logger.info(f'Connections total: {len(conn_manager.local_ws_to_key)}')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Per-peer limit of unsent IPC data; beyond it messages to that worker are dropped
+MAX_PEER_BUFFER = 16 * 1024 * 1024
+
+
+class WorkerLink:
+    """Routes messages between the worker processes of web/server.py over Unix sockets.
+
+    Every worker listens on ``<ipc_dir>/worker-<id>.sock`` and keeps one outgoing
+    connection to each other worker. Workers announce the UUIDs they have
+    subscribers for (``sub``/``unsub``), so a message is forwarded only to the
+    workers holding its recipient. When a peer connection drops, the UUIDs it
+    announced are forgotten; on (re)connect a worker announces all its UUIDs again.
+    """
+
+    def __init__(self, worker_id: int, workers: int, ipc_dir: str,
+                 deliver: Callable[[str, str, Optional[int], bool], Awaitable[None]],
+                 local_keys: Callable[[], Iterable[str]]):
+        self.worker_id = worker_id
+        self.workers = workers
+        self.ipc_dir = ipc_dir
+        self.deliver = deliver
+        self.local_keys = local_keys
+        # key -> ids of the other workers with subscribers for it
+        self.remote: Dict[str, Set[int]] = {}
+        # Outgoing connections (we write to them) and incoming ones (peers write to us)
+        self.peers: Dict[int, asyncio.StreamWriter] = {}
+        self.incoming: Dict[int, asyncio.StreamWriter] = {}
+        self.dropped = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.tasks = []
+        self.handlers: Set[asyncio.Task] = set()
+
+    def socket_path(self, worker_id: int) -> str:
+        return os.path.join(self.ipc_dir, f'worker-{worker_id}.sock')
+
+    async def start(self) -> None:
+        path = self.socket_path(self.worker_id)
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = await asyncio.start_unix_server(self._handle_peer, path=path, limit=MAX_PEER_BUFFER)
+        self.tasks = [asyncio.create_task(self._connect(peer_id))
+                      for peer_id in range(self.workers) if peer_id != self.worker_id]
+
+    async def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.server is not None:
+            self.server.close()
+        for writer in list(self.incoming.values()):
+            writer.close()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+
+    def has_remote(self, key: str) -> bool:
+        return bool(self.remote.get(key))
+
+    def _write(self, peer_id: int, data: dict) -> None:
+        writer = self.peers.get(peer_id)
+        if writer is None:
+            return
+        if writer.transport.get_write_buffer_size() > MAX_PEER_BUFFER:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f'Worker {peer_id} is not reading, IPC messages dropped: {self.dropped}')
+            return
+        writer.write(json.dumps(data).encode() + b'\n')
+
+    def subscribed(self, key: str) -> None:
+        """Announce the first local subscriber of the key to the other workers."""
+        for peer_id in list(self.peers):
+            self._write(peer_id, {'op': 'sub', 'key': key})
+
+    def unsubscribed(self, key: str) -> None:
+        """Announce that the last local subscriber of the key is gone."""
+        for peer_id in list(self.peers):
+            self._write(peer_id, {'op': 'unsub', 'key': key})
+
+    def forward(self, key: str, message: str, seq: Optional[int] = None, delivered: bool = True) -> bool:
+        """Send a message to the workers holding the key. Returns False if there are none.
+
+        A message nobody received (*delivered* is False) goes to every worker, so
+        whichever worker the client reconnects to can replay it.
+        """
+        targets = self.remote.get(key)
+        if targets:
+            for peer_id in list(targets):
+                self._write(peer_id, {'op': 'msg', 'key': key, 'message': message, 'seq': seq})
+            return True
+        if not delivered:
+            for peer_id in list(self.peers):
+                self._write(peer_id, {'op': 'msg', 'key': key, 'message': message, 'seq': seq, 'delivered': False})
+        return False
+
+    async def _connect(self, peer_id: int) -> None:
+        """Keep the outgoing connection to a peer, announcing the local keys after every (re)connect."""
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path(peer_id))
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(0.2)
+                continue
+            try:
+                writer.write(json.dumps({'op': 'hello', 'worker_id': self.worker_id}).encode() + b'\n')
+                self.peers[peer_id] = writer
+                for key in list(self.local_keys()):
+                    self._write(peer_id, {'op': 'sub', 'key': key})
+                # The peer never writes back, EOF means it went away
+                await reader.read()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'IPC connection to worker {peer_id} failed: {e}')
+            finally:
+                self.peers.pop(peer_id, None)
+                writer.close()
+            await asyncio.sleep(0.2)
+
+    def _forget(self, peer_id: int) -> None:
+        for key in [key for key, workers in self.remote.items() if peer_id in workers]:
+            self.remote[key].discard(peer_id)
+            if not self.remote[key]:
+                del self.remote[key]
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer_id = None
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        try:
+            async for line in reader:
+                try:
+                    data = json.loads(line)
+                    op = data.get('op')
+                    if op == 'hello':
+                        peer_id = data['worker_id']
+                        # Announcements of the previous connection of the peer are stale
+                        self._forget(peer_id)
+                        self.incoming[peer_id] = writer
+                    elif op == 'sub':
+                        self.remote.setdefault(data['key'], set()).add(peer_id)
+                    elif op == 'unsub':
+                        workers = self.remote.get(data['key'])
+                        if workers is not None:
+                            workers.discard(peer_id)
+                            if not workers:
+                                del self.remote[data['key']]
+                    elif op == 'msg':
+                        await self.deliver(data['key'], data['message'], data.get('seq'), data.get('delivered', True))
+                except Exception as e:
+                    logger.error(f'IPC message error: {e}')
+        finally:
+            if peer_id is not None and self.incoming.get(peer_id) is writer:
+                del self.incoming[peer_id]
+                self._forget(peer_id)
+            self.handlers.discard(task)
+            writer.close()